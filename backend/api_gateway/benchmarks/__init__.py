@@ -0,0 +1,9 @@
+"""
+网关基准测试
+在本进程内启动六个上游服务桩，以固定并发驱动网关视图，输出吞吐量和 p50/p95/p99 延迟，并与保存的基线对比；
+不依赖Redis、MongoDB等外部服务
+
+运行方式（在 backend/api_gateway 目录下）：
+    python -m benchmarks --mode sync
+    python -m benchmarks --mode async --concurrency 64 --latency-ms 20
+"""
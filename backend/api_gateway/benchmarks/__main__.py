@@ -0,0 +1,189 @@
+"""
+基准测试命令行入口
+
+    python -m benchmarks [--mode sync|async] [--scenarios users_list,batch] [--concurrency 16] [--requests 2000]
+                         [--latency-ms 5] [--payload-bytes 2048] [--error-rate 0]
+                         [--save-baseline] [--max-regression 10] [--micro]
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+from .stubs import STUB_SERVICES, StubConfig, start_stubs, stop_stubs
+
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+
+# 与基线对比时必须一致的参数，不一致时对比没有意义
+BASELINE_PARAMS = ['concurrency', 'requests', 'latency_ms', 'jitter_ms', 'payload_bytes', 'error_rate', 'replicas']
+
+
+def parse_args(argv=None):
+    from .runner import SCENARIOS
+
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='网关负载测试和微基准测试')
+    parser.add_argument('--mode', choices=['sync', 'async'], default='sync', help='网关模式（GATEWAY_ASYNC）')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='逗号分隔的场景名称')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000, help='每个场景统计的请求数')
+    parser.add_argument('--warmup', type=int, default=100, help='每个场景的预热请求数')
+    parser.add_argument('--latency-ms', type=float, default=5, help='上游服务桩的固定延迟')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='上游服务桩的随机附加延迟上限')
+    parser.add_argument('--payload-bytes', type=int, default=2048, help='上游响应体大小')
+    parser.add_argument('--error-rate', type=float, default=0, help='上游返回500的比例')
+    parser.add_argument('--replicas', type=int, default=1, help='每个上游服务的副本数')
+    parser.add_argument('--micro', action='store_true', help='同时运行微基准测试')
+    parser.add_argument('--baseline', help='基线文件（默认 benchmarks/baselines/<mode>.json）')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+    parser.add_argument('--max-regression', type=float, default=None,
+                        help='p95延迟升高或吞吐量下降超过该百分比时以非零状态退出')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args(argv)
+
+    args.scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f'未知场景: {", ".join(unknown)}（可选: {", ".join(SCENARIOS)}）')
+    return args
+
+
+def setup_environment(args, stubs):
+    """把上游地址指向服务桩并初始化Django（必须在导入网关模块之前调用）"""
+    for service_name in STUB_SERVICES:
+        os.environ[f'{service_name.upper()}_URLS'] = ','.join(stub.url for stub in stubs[service_name])
+    os.environ['GATEWAY_ASYNC'] = 'True' if args.mode == 'async' else 'False'
+    # 不签发内部身份头，避免身份解析查询MongoDB
+    os.environ['INTERNAL_AUTH_SECRET'] = ''
+    os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.settings'
+
+    import django
+    django.setup()
+
+
+def get_params(args):
+    return {name: getattr(args, name) for name in BASELINE_PARAMS}
+
+
+def load_baseline(path):
+    if not path.exists():
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_baseline(path, args, results):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = {
+        'mode': args.mode,
+        'params': get_params(args),
+        'scenarios': {result.scenario: result._asdict() for result in results},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def compare(results, baseline, max_regression):
+    """
+    与基线对比
+
+    Returns:
+        (对比结果列表, 是否存在超过阈值的回归)
+    """
+    comparisons = []
+    regressed = False
+    for result in results:
+        base = baseline['scenarios'].get(result.scenario)
+        if base is None:
+            continue
+        p95_change = (result.p95 - base['p95']) / base['p95'] * 100 if base['p95'] else 0.0
+        throughput_change = (
+            (result.throughput - base['throughput']) / base['throughput'] * 100 if base['throughput'] else 0.0
+        )
+        failed = max_regression is not None and (p95_change > max_regression or -throughput_change > max_regression)
+        regressed = regressed or failed
+        comparisons.append({
+            'scenario': result.scenario,
+            'p95_change': p95_change,
+            'throughput_change': throughput_change,
+            'regressed': failed,
+        })
+    return comparisons, regressed
+
+
+def print_results(args, results, comparisons, micro_results, baseline_note):
+    print(f'模式: {args.mode}  并发: {args.concurrency}  上游延迟: {args.latency_ms}ms  响应体: {args.payload_bytes}B')
+    print(f'{"场景":<22}{"请求数":>8}{"req/s":>10}{"p50":>9}{"p95":>9}{"p99":>9}{"max":>9}  状态码')
+    for result in results:
+        statuses = ' '.join(f'{code}:{count}' for code, count in sorted(result.statuses.items()))
+        print(f'{result.scenario:<22}{result.requests:>8}{result.throughput:>10.1f}'
+              f'{result.p50:>9.2f}{result.p95:>9.2f}{result.p99:>9.2f}{result.max:>9.2f}  {statuses}')
+
+    if micro_results:
+        print()
+        print(f'{"微基准":<26}{"us/次":>10}')
+        for micro in micro_results:
+            print(f'{micro.name:<26}{micro.per_call_us:>10.2f}')
+
+    if baseline_note:
+        print()
+        print(baseline_note)
+    for item in comparisons:
+        flag = '  回归' if item['regressed'] else ''
+        print(f'{item["scenario"]:<22}p95 {item["p95_change"]:+.1f}%  吞吐量 {item["throughput_change"]:+.1f}%{flag}')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub_config = StubConfig(
+        latency=args.latency_ms / 1000,
+        jitter=args.jitter_ms / 1000,
+        payload_bytes=args.payload_bytes,
+        error_rate=args.error_rate,
+    )
+    stubs = start_stubs(stub_config, args.replicas)
+    try:
+        setup_environment(args, stubs)
+
+        from .micro import run_micro
+        from .runner import build_access_token, run_scenarios
+
+        results = run_scenarios(args.mode, args.scenarios, args.concurrency, args.requests, args.warmup)
+        micro_results = run_micro(build_access_token()) if args.micro else []
+    finally:
+        stop_stubs(stubs)
+
+    baseline_path = Path(args.baseline) if args.baseline else BASELINE_DIR / f'{args.mode}.json'
+    baseline = load_baseline(baseline_path)
+    comparisons, regressed = [], False
+    baseline_note = None
+    if baseline is None:
+        baseline_note = f'没有基线: {baseline_path}'
+    elif baseline['params'] != get_params(args):
+        baseline_note = f'基线参数不一致，跳过对比: {baseline["params"]}'
+    else:
+        baseline_note = f'与基线对比: {baseline_path}'
+        comparisons, regressed = compare(results, baseline, args.max_regression)
+
+    if args.json:
+        print(json.dumps({
+            'mode': args.mode,
+            'params': get_params(args),
+            'scenarios': [result._asdict() for result in results],
+            'micro': [micro._asdict() for micro in micro_results],
+            'comparisons': comparisons,
+        }, indent=2, ensure_ascii=False))
+    else:
+        print_results(args, results, comparisons, micro_results, baseline_note)
+
+    if args.save_baseline:
+        save_baseline(baseline_path, args, results)
+        if not args.json:
+            print(f'已保存基线: {baseline_path}')
+
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
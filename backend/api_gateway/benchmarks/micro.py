@@ -0,0 +1,75 @@
+"""
+微基准测试
+单独测量网关每个请求都会经过的热点函数的耗时
+"""
+import timeit
+from collections import namedtuple
+
+
+MicroResult = namedtuple('MicroResult', ['name', 'loops', 'per_call_us'])
+
+
+def build_benchmarks(token):
+    """
+    构建微基准测试项
+
+    Returns:
+        [(名称, 无参函数), ...]
+    """
+    from django.test import RequestFactory
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from common.middleware.compression_middleware import compress, get_accepted_encodings
+    from common.utils.jwt_utils import verify_access_token
+    from common.utils.load_balancer import RoundRobinBalancer
+    from common.utils.tracing import Trace
+    from gateway.cache import response_cache
+    from gateway.views import build_upstream_request
+
+    factory = RequestFactory()
+    request = factory.get(
+        '/api/companies/benchmark/',
+        {'page': 1},
+        HTTP_AUTHORIZATION=f'Bearer {token}',
+        HTTP_ACCEPT_ENCODING='gzip, deflate, br',
+    )
+    request.auth = AccessToken(token)
+    request.company_id = 'benchmark-company'
+
+    body = b'{"results": [' + b', '.join([b'{"id": "000000000000000000000000", "name": "benchmark"}'] * 64) + b']}'
+    balancer = RoundRobinBalancer(['http://127.0.0.1:1', 'http://127.0.0.1:2', 'http://127.0.0.1:3'])
+
+    trace = Trace()
+    for name in ('jwt', 'tenant', 'cache', 'user_service'):
+        trace.record(name, 0.001)
+
+    def balancer_round_trip():
+        balancer.release(balancer.acquire(), False)
+
+    return [
+        ('jwt_decode', lambda: AccessToken(token)),
+        ('jwt_verify_cached', lambda: verify_access_token(token)),
+        ('build_upstream_request', lambda: build_upstream_request(request, 'http://127.0.0.1:1', 'companies/benchmark/')),
+        ('cache_build_key', lambda: response_cache.build_key(request)),
+        ('accept_encoding', lambda: get_accepted_encodings('gzip;q=0.8, br, *;q=0.1')),
+        ('gzip_compress_4k', lambda: compress(body, 'gzip')),
+        ('balancer_round_trip', balancer_round_trip),
+        ('server_timing', trace.server_timing),
+    ]
+
+
+def run_micro(token, min_time=0.2):
+    """
+    运行微基准测试（每项自动确定循环次数，取三次测量中最快的一次）
+
+    Returns:
+        [MicroResult, ...]
+    """
+    results = []
+    for name, func in build_benchmarks(token):
+        timer = timeit.Timer(func)
+        loops, _ = timer.autorange()
+        loops = max(1, int(loops * min_time / 0.2))
+        best = min(timer.repeat(repeat=3, number=loops))
+        results.append(MicroResult(name, loops, best / loops * 1e6))
+    return results
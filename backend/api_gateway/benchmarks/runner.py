@@ -0,0 +1,208 @@
+"""
+负载测试
+以固定并发通过Django测试客户端驱动网关（经过完整的中间件链和代理视图），统计吞吐量和延迟分位数
+"""
+import asyncio
+import json
+import math
+import threading
+import time
+from collections import Counter, namedtuple
+
+
+# auth: 是否携带JWT
+Scenario = namedtuple('Scenario', ['method', 'path', 'body', 'auth'])
+
+SCENARIOS = {
+    # 流式转发的列表接口
+    'users_list': Scenario('GET', '/api/users/', None, True),
+    # 启用响应缓存的路由（主要命中L1）
+    'company_detail': Scenario('GET', '/api/companies/benchmark/', None, True),
+    # 启用请求合并和短时缓存的高频接口
+    'notifications_unread': Scenario('GET', '/api/notifications/unread_count/', None, True),
+    # 写操作：转发请求体并使缓存失效
+    'logs_create': Scenario('POST', '/api/logs/', {'action': 'benchmark', 'level': 'info'}, True),
+    # 未认证接口
+    'auth_login': Scenario('POST', '/api/auth/login/', {'username': 'benchmark', 'password': 'benchmark'}, False),
+    # 批量请求：一次请求并发调用多个上游服务
+    'batch': Scenario('POST', '/api/batch/', {
+        'requests': [
+            {'method': 'GET', 'path': '/api/users/'},
+            {'method': 'GET', 'path': '/api/permissions/'},
+            {'method': 'GET', 'path': '/api/notifications/'},
+        ],
+    }, True),
+}
+
+Result = namedtuple('Result', ['scenario', 'requests', 'duration', 'throughput', 'p50', 'p95', 'p99', 'max', 'statuses'])
+
+
+def build_access_token():
+    """构建基准测试用户的JWT"""
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    token = AccessToken()
+    token['user_id'] = 'benchmark-user'
+    return str(token)
+
+
+def percentile(sorted_values, fraction):
+    """最近秩法计算分位数"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(scenario_name, latencies, statuses, duration):
+    """汇总一个场景的测试结果（延迟单位为毫秒）"""
+    latencies = sorted(latencies)
+    return Result(
+        scenario=scenario_name,
+        requests=len(latencies),
+        duration=duration,
+        throughput=len(latencies) / duration if duration > 0 else 0.0,
+        p50=percentile(latencies, 0.50) * 1000,
+        p95=percentile(latencies, 0.95) * 1000,
+        p99=percentile(latencies, 0.99) * 1000,
+        max=(latencies[-1] if latencies else 0.0) * 1000,
+        statuses=dict(Counter(statuses)),
+    )
+
+
+def build_request_kwargs(scenario, token):
+    kwargs = {}
+    if scenario.body is not None:
+        kwargs['data'] = json.dumps(scenario.body)
+        kwargs['content_type'] = 'application/json'
+    if scenario.auth:
+        kwargs['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+    return kwargs
+
+
+def run_sync(scenario_name, scenario, token, concurrency, total_requests, warmup):
+    """
+    同步模式：concurrency 个线程各自使用一个测试客户端循环发送请求
+
+    Returns:
+        Result
+    """
+    from django.test import Client
+
+    kwargs = build_request_kwargs(scenario, token)
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+    remaining = [warmup + total_requests]
+    # 吞吐量从第一个统计的请求开始计时，不包含预热
+    measure_started = [None]
+
+    def next_request():
+        with lock:
+            if remaining[0] <= 0:
+                return None
+            remaining[0] -= 1
+            measured = remaining[0] < total_requests
+            if measured and measure_started[0] is None:
+                measure_started[0] = time.perf_counter()
+            return measured
+
+    def worker():
+        client = Client(raise_request_exception=False)
+        while True:
+            measured = next_request()
+            if measured is None:
+                return
+            started = time.perf_counter()
+            response = client.generic(scenario.method, scenario.path, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            else:
+                response.content
+            elapsed = time.perf_counter() - started
+            if measured:
+                with lock:
+                    latencies.append(elapsed)
+                    statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - measure_started[0] if measure_started[0] is not None else 0.0
+    return summarize(scenario_name, latencies, statuses, duration)
+
+
+async def _consume_async(response):
+    if not response.streaming:
+        return
+    content = response.streaming_content
+    if hasattr(content, '__aiter__'):
+        async for _ in content:
+            pass
+    else:
+        for _ in content:
+            pass
+
+
+async def _run_async(scenario, token, concurrency, total_requests, warmup, latencies, statuses, measure_started):
+    from django.test import AsyncClient
+
+    kwargs = build_request_kwargs(scenario, token)
+    remaining = [warmup + total_requests]
+
+    async def worker():
+        client = AsyncClient(raise_request_exception=False)
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            measured = remaining[0] < total_requests
+            started = time.perf_counter()
+            if measured and measure_started[0] is None:
+                measure_started[0] = started
+            response = await client.generic(scenario.method, scenario.path, **kwargs)
+            await _consume_async(response)
+            elapsed = time.perf_counter() - started
+            if measured:
+                latencies.append(elapsed)
+                statuses.append(response.status_code)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+def run_async(scenario_name, scenario, token, concurrency, total_requests, warmup):
+    """
+    异步模式：在一个事件循环中运行 concurrency 个协程，使用异步测试客户端发送请求
+
+    Returns:
+        Result
+    """
+    latencies = []
+    statuses = []
+    measure_started = [None]
+    asyncio.run(_run_async(scenario, token, concurrency, total_requests, warmup, latencies, statuses, measure_started))
+    duration = time.perf_counter() - measure_started[0] if measure_started[0] is not None else 0.0
+    return summarize(scenario_name, latencies, statuses, duration)
+
+
+def run_scenarios(mode, scenario_names, concurrency, total_requests, warmup):
+    """
+    依次运行场景
+
+    Args:
+        mode: sync / async
+        scenario_names: 场景名称列表
+        concurrency: 并发数
+        total_requests: 每个场景统计的请求数
+        warmup: 每个场景正式统计前的预热请求数（建立连接池、填充缓存）
+
+    Returns:
+        [Result, ...]
+    """
+    token = build_access_token()
+    run = run_async if mode == 'async' else run_sync
+    return [
+        run(name, SCENARIOS[name], token, concurrency, total_requests, warmup)
+        for name in scenario_names
+    ]
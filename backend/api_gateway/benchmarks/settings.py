@@ -0,0 +1,27 @@
+"""
+基准测试配置
+在网关配置的基础上关闭依赖外部服务（Redis、MongoDB）的功能，其余配置保持不变
+"""
+from gateway_service.settings import *  # noqa: F401,F403
+from gateway_service.settings import (
+    GATEWAY_METRICS,
+    GATEWAY_RATE_LIMIT,
+    GATEWAY_RESPONSE_CACHE,
+)
+
+DEBUG = False
+
+# 响应缓存只使用进程内L1
+GATEWAY_RESPONSE_CACHE = dict(GATEWAY_RESPONSE_CACHE, L2_ENABLED=False)
+
+# 限流的令牌桶保存在Redis中
+GATEWAY_RATE_LIMIT = dict(GATEWAY_RATE_LIMIT, ENABLED=False)
+
+# 指标只在本进程内累加
+GATEWAY_METRICS = dict(GATEWAY_METRICS, SHARED=False)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'root': {'level': 'ERROR'},
+}
@@ -0,0 +1,130 @@
+"""
+上游服务桩
+每个服务在本进程的线程中启动一个HTTP/1.1服务（支持keep-alive），按配置的延迟、响应体大小和错误率返回JSON响应
+（请求的 Accept 为msgpack时返回msgpack，与服务端的内容协商一致）
+"""
+import json
+import random
+import threading
+import time
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import msgpack
+
+
+# 网关代理的六个上游服务
+STUB_SERVICES = [
+    'user_service',
+    'company_service',
+    'auth_service',
+    'permission_service',
+    'notification_service',
+    'log_service',
+]
+
+# latency/jitter: 固定延迟和随机附加延迟（秒）；payload_bytes: 响应体大小；error_rate: 返回500的比例
+StubConfig = namedtuple('StubConfig', ['latency', 'jitter', 'payload_bytes', 'error_rate'])
+
+
+def build_payload(service_name, payload_bytes):
+    """构建JSON编码后约为指定大小的响应数据"""
+    item = {'id': '0' * 24, 'name': service_name, 'description': 'x' * 64, 'is_active': True}
+    item_size = len(json.dumps(item).encode('utf-8'))
+    count = max(1, payload_bytes // (item_size + 2))
+    return {
+        'count': count,
+        'results': [dict(item, id=f'{index:024d}') for index in range(count)],
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """对所有路径和方法返回同样的JSON响应"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond()
+
+    do_POST = do_PUT = do_PATCH = do_DELETE = do_GET
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+
+        stub_config = self.server.stub_config
+        delay = stub_config.latency + random.uniform(0, stub_config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+        content_type = 'application/json'
+        if random.random() < stub_config.error_rate:
+            status_code, body = 500, b'{"error": "stub error"}'
+        elif 'application/msgpack' in self.headers.get('Accept', ''):
+            status_code, body, content_type = 200, self.server.msgpack_payload, 'application/msgpack'
+        else:
+            status_code, body = 200, self.server.payload
+        self.server.requests_total += 1
+
+        self.send_response(status_code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 高并发时避免监听队列溢出导致的连接重试
+    request_queue_size = 1024
+
+
+class StubService:
+    """一个上游服务桩副本"""
+
+    def __init__(self, service_name, stub_config):
+        self.service_name = service_name
+        self.server = StubServer(('127.0.0.1', 0), StubHandler)
+        self.server.stub_config = stub_config
+        payload = build_payload(service_name, stub_config.payload_bytes)
+        self.server.payload = json.dumps(payload).encode('utf-8')
+        self.server.msgpack_payload = msgpack.packb(payload)
+        self.server.requests_total = 0
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self._thread = threading.Thread(target=self.server.serve_forever, name=f'stub-{service_name}', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_stubs(stub_config, replicas=1):
+    """
+    启动所有上游服务桩
+
+    Args:
+        stub_config: StubConfig
+        replicas: 每个服务的副本数
+
+    Returns:
+        dict: 服务名称 -> StubService列表
+    """
+    stubs = {}
+    for service_name in STUB_SERVICES:
+        stubs[service_name] = [StubService(service_name, stub_config) for _ in range(replicas)]
+        for stub in stubs[service_name]:
+            stub.start()
+    return stubs
+
+
+def stop_stubs(stubs):
+    for replicas in stubs.values():
+        for stub in replicas:
+            stub.stop()
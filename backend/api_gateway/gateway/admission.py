@@ -0,0 +1,233 @@
+"""
+上游并发准入控制
+限制每个上游服务同时进行的请求数，超出时在有界队列中等待；队列已满或等待超时的请求
+立即返回503（或429）和 Retry-After，避免工作线程堆积在慢服务上
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+
+DEFAULT_ADMISSION_CONFIG = {
+    'ENABLED': True,
+    'MAX_IN_FLIGHT': 50,
+    'MAX_QUEUE': 100,
+    'QUEUE_TIMEOUT': 2,
+    # 拒绝时返回的状态码（503 或 429）
+    'REJECT_STATUS': 503,
+    'RETRY_AFTER': 1,
+    'SERVICE_OVERRIDES': {},
+}
+
+
+def get_admission_config(service_name=None):
+    """获取准入控制配置（合并默认值、全局配置和服务级覆盖配置）"""
+    admission_config = dict(DEFAULT_ADMISSION_CONFIG)
+    admission_config.update(getattr(settings, 'GATEWAY_ADMISSION', {}))
+    if service_name:
+        admission_config.update(admission_config.get('SERVICE_OVERRIDES', {}).get(service_name, {}))
+    return admission_config
+
+
+class BaseAdmissionLimiter:
+    """准入控制器的配置和统计（子类提供当前排队数 queue_depth）"""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.config = get_admission_config(service_name)
+        self.max_in_flight = self.config['MAX_IN_FLIGHT']
+        self.max_queue = self.config['MAX_QUEUE']
+        self.queue_timeout = self.config['QUEUE_TIMEOUT']
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.max_queue_depth = 0
+        self.wait_time_total = 0
+        self.wait_time_max = 0
+
+    def retry_after(self):
+        """建议的重试间隔（秒）"""
+        return max(1, math.ceil(self.config['RETRY_AFTER']))
+
+    def _record_wait(self, waited):
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+
+    def metrics(self):
+        """准入控制指标"""
+        return {
+            'max_in_flight': self.max_in_flight,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected_queue_full': self.rejected_queue_full,
+            'rejected_timeout': self.rejected_timeout,
+            'wait_time_avg_ms': round(self.wait_time_total / self.queued * 1000, 2) if self.queued else 0,
+            'wait_time_max_ms': round(self.wait_time_max * 1000, 2),
+        }
+
+
+class AdmissionLimiter(BaseAdmissionLimiter):
+    """同步准入控制器（多线程WSGI）"""
+
+    def __init__(self, service_name):
+        super().__init__(service_name)
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    @property
+    def queue_depth(self):
+        return self._waiting
+
+    def acquire(self):
+        """
+        获取上游请求名额，名额不足时排队等待
+
+        Returns:
+            是否获得名额（False表示队列已满或等待超时，请求应被拒绝）
+        """
+        with self._condition:
+            if self.in_flight < self.max_in_flight and self._waiting == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            if self._waiting >= self.max_queue:
+                self.rejected_queue_full += 1
+                return False
+
+            self._waiting += 1
+            self.queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._waiting)
+            started = time.monotonic()
+            deadline = started + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected_timeout += 1
+                        return False
+                    self._condition.wait(remaining)
+                self.in_flight += 1
+                self.admitted += 1
+                return True
+            finally:
+                self._waiting -= 1
+                self._record_wait(time.monotonic() - started)
+
+    def release(self):
+        """释放名额并唤醒一个等待的请求"""
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+
+class AsyncAdmissionLimiter(BaseAdmissionLimiter):
+    """
+    异步准入控制器（ASGI）
+    在事件循环线程内使用，释放名额时直接转交给队首的等待者（先进先出）
+    """
+
+    def __init__(self, service_name):
+        super().__init__(service_name)
+        self._waiters = deque()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    async def acquire(self):
+        """
+        获取上游请求名额，名额不足时排队等待
+
+        Returns:
+            是否获得名额（False表示队列已满或等待超时，请求应被拒绝）
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+            self.admitted += 1
+            return True
+        except asyncio.TimeoutError:
+            # 超时与 release() 转交名额可能同时发生（Python 3.12+ 的 wait_for 可能在future完成后才报告超时），
+            # 名额已转交时视为获得名额，否则该名额永远不会被释放
+            if waiter.done() and not waiter.cancelled():
+                self.admitted += 1
+                return True
+            self.rejected_timeout += 1
+            return False
+        except asyncio.CancelledError:
+            # 请求被取消时，已转交的名额需要归还
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            self._record_wait(time.monotonic() - started)
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self):
+        """释放名额，有等待者时直接转交"""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+
+class AdmissionRegistry:
+    """准入控制器注册表，按服务名称懒加载创建"""
+
+    def __init__(self, limiter_class):
+        self.limiter_class = limiter_class
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def get(self, service_name):
+        """获取服务的准入控制器，未启用准入控制时返回None"""
+        if not get_admission_config(service_name)['ENABLED']:
+            return None
+        limiter = self._limiters.get(service_name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.setdefault(service_name, self.limiter_class(service_name))
+        return limiter
+
+    def metrics(self):
+        return {
+            service_name: limiter.metrics()
+            for service_name, limiter in list(self._limiters.items())
+        }
+
+
+admission_registry = AdmissionRegistry(AdmissionLimiter)
+async_admission_registry = AdmissionRegistry(AsyncAdmissionLimiter)
+
+
+def get_admission_metrics():
+    """当前网关模式（同步/异步）下的准入控制指标"""
+    if settings.GATEWAY_ASYNC:
+        return async_admission_registry.metrics()
+    return admission_registry.metrics()
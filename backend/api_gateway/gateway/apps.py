@@ -0,0 +1,29 @@
+import threading
+
+from django.apps import AppConfig
+
+
+class GatewayConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'gateway'
+    verbose_name = 'API网关'
+
+    def ready(self):
+        """
+        应用启动时连接数据库（需要查询用户所属企业时）、构建路由表并注册热重载信号，在后台预热上游连接池
+        （异步模式的连接池绑定事件循环，按需建立）
+        """
+        from django.conf import settings
+        from .routing import router
+        from .upstream import get_pool_config
+        from .identity import requires_tenant_lookup
+
+        # 内部身份转发和企业级限流需要查询用户所属企业
+        if requires_tenant_lookup():
+            from common.db import connect_mongodb
+            connect_mongodb()
+
+        router.table
+        router.install_signal_handler()
+        if not settings.GATEWAY_ASYNC and get_pool_config()['PREWARM'] > 0:
+            threading.Thread(target=router.prewarm, daemon=True).start()
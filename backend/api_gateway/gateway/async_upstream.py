@@ -0,0 +1,109 @@
+"""
+异步上游连接池管理（ASGI模式）
+基于 httpx.AsyncClient，单进程内以非阻塞方式维持大量并发上游请求
+"""
+import asyncio
+
+import httpx
+
+from .upstream import get_pool_config, build_load_balancer
+
+
+class AsyncUpstreamPool:
+    """
+    单个上游服务的异步连接池
+    httpx.AsyncClient 绑定到创建它的事件循环，事件循环变化时自动重建；
+    服务有多个副本时共用一个 AsyncClient（按主机分别维护连接），由负载均衡器选择副本
+    """
+
+    def __init__(self, service_name, base_urls, pool_size=1000, timeout=30):
+        self.service_name = service_name
+        self.base_urls = base_urls
+        self.pool_size = pool_size
+        self.balancer = build_load_balancer(service_name, base_urls)
+        self.timeout = timeout
+
+        self._client = None
+        self._loop = None
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _get_client(self):
+        """获取当前事件循环上的 AsyncClient"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                ),
+                timeout=httpx.Timeout(self.timeout),
+            )
+            self._loop = loop
+        return self._client
+
+    async def request(self, method, url, body=None, stream=False, **kwargs):
+        """
+        通过异步连接池发送请求
+
+        Args:
+            body: 原始请求体（bytes 或异步迭代器）
+            stream: 是否流式读取响应体（为True时调用方负责关闭响应）
+        """
+        client = self._get_client()
+        self.requests_total += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if stream:
+                upstream_request = client.build_request(method, url, content=body, **kwargs)
+                return await client.send(upstream_request, stream=True)
+            return await client.request(method, url, content=body, **kwargs)
+        except httpx.HTTPError:
+            self.errors_total += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+    def metrics(self):
+        """连接池指标"""
+        return {
+            'base_urls': self.base_urls,
+            'pool_size': self.pool_size,
+            'requests_total': self.requests_total,
+            'errors_total': self.errors_total,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'load_balancer': self.balancer.metrics(),
+        }
+
+    async def aclose(self):
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def close(self):
+        """从其他线程关闭连接池（提交到 AsyncClient 所属的事件循环执行）"""
+        loop = self._loop
+        if self._client is not None and loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop)
+
+
+def create_async_pool(service_name, base_urls):
+    """
+    按配置创建服务的异步连接池
+
+    Args:
+        service_name: 服务名称
+        base_urls: 服务副本地址列表
+    """
+    pool_config = get_pool_config(service_name)
+    return AsyncUpstreamPool(
+        service_name,
+        base_urls,
+        pool_size=pool_config['ASYNC_POOL_SIZE'],
+        timeout=pool_config['TIMEOUT'],
+    )
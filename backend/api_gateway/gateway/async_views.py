@@ -0,0 +1,424 @@
+"""
+API网关异步视图（ASGI模式）
+路由与 views.py 保持一致，上游调用使用非阻塞HTTP客户端，等待上游时不占用工作线程
+"""
+import functools
+import json
+import logging
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from common.utils.tracing import span
+
+from .routing import router
+from .identity import should_resolve_identity, resolve_identity, build_company_forbidden_response
+from .ratelimit import rate_limiter, apply_rate_limit_headers
+from .admission import async_admission_registry
+from .hedging import hedging_registry, asend_upstream
+from .metrics import gateway_metrics, get_metrics_config
+from .cache import response_cache
+from .conditional import etag_matches, build_not_modified_response, evaluate_conditional
+from .coalescing import build_coalescing_key, snapshot_response, build_snapshot_response, async_single_flight
+from .circuit_breaker import breaker_registry
+from .serializers import BatchRequestSerializer
+from .batch import arun_batch
+from .views import (
+    WRITE_METHODS,
+    RequestBodyStream,
+    build_upstream_request,
+    build_client_response,
+    build_buffered_response,
+    build_cached_response,
+    build_circuit_open_response,
+    build_overloaded_response,
+    build_rate_limited_response,
+    build_streaming_response,
+    cache_upstream_response,
+    is_passthrough_response,
+    is_relayable_encoding,
+    record_upstream_timing,
+)
+
+
+logger = logging.getLogger(__name__)
+
+PROXY_METHODS = ['GET', 'POST', 'PUT', 'PATCH', 'DELETE']
+
+
+def authenticate(request):
+    """
+    使用DRF配置的认证类认证请求（与 @api_view 的认证流程一致）
+
+    Returns:
+        (user, auth)，未提供认证信息时返回None
+
+    Raises:
+        AuthenticationFailed: 认证信息无效
+    """
+    for authenticator_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        user_auth_tuple = authenticator_class().authenticate(request)
+        if user_auth_tuple is not None:
+            return user_auth_tuple
+    return None
+
+
+def api_error_response(exc):
+    """将DRF异常转换为响应（与DRF默认异常处理格式一致）"""
+    if isinstance(exc.detail, (list, dict)):
+        data = exc.detail
+    else:
+        data = {'detail': exc.detail}
+
+    response = JsonResponse(data, status=exc.status_code, safe=False)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        authenticators = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        if authenticators:
+            response['WWW-Authenticate'] = authenticators[0]().authenticate_header(None)
+    return response
+
+
+def build_options_response(view_func, allowed_methods):
+    """OPTIONS响应（与 @api_view 一致：返回DRF元数据和 Allow 响应头）"""
+    metadata_class = api_settings.DEFAULT_METADATA_CLASS
+    if metadata_class is None:
+        return api_error_response(exceptions.MethodNotAllowed('OPTIONS'))
+
+    # @api_view 以视图函数名和文档字符串生成视图名称和描述
+    view = type(view_func.__name__, (APIView,), {'__doc__': view_func.__doc__})()
+    response = JsonResponse(metadata_class().determine_metadata(None, view))
+    response['Allow'] = ', '.join(allowed_methods)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+async def strip_response_body(response):
+    """
+    丢弃HEAD请求的响应体，只返回响应头（与WSGI服务器处理 @api_view 的HEAD请求一致）
+    流式响应先读取完上游响应体，上游连接才会释放回连接池
+    """
+    if response.streaming:
+        if response.is_async:
+            async for _chunk in response.streaming_content:
+                pass
+        else:
+            for _chunk in response.streaming_content:
+                pass
+        response.streaming_content = []
+        return response
+
+    if not response.has_header('Content-Length'):
+        response['Content-Length'] = str(len(response.content))
+    response.content = b''
+    return response
+
+
+def async_api_view(require_auth=True, methods=PROXY_METHODS):
+    """
+    异步代理视图装饰器
+    对应同步视图的 @api_view + @permission_classes：CSRF豁免、请求方法校验和认证；
+    与 @api_view 一致，总是允许OPTIONS（返回视图元数据），允许GET时HEAD按GET处理并丢弃响应体
+
+    Args:
+        require_auth: 是否要求已认证（对应 IsAuthenticated / AllowAny）
+        methods: 允许的请求方法
+    """
+    allowed_methods = [*methods, 'OPTIONS']
+
+    def decorator(view_func):
+        @csrf_exempt
+        @functools.wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            head = request.method == 'HEAD' and 'GET' in methods
+            if request.method not in allowed_methods and not head:
+                return api_error_response(exceptions.MethodNotAllowed(request.method))
+
+            try:
+                user_auth_tuple = await sync_to_async(authenticate)(request)
+            except exceptions.APIException as exc:
+                return api_error_response(exc)
+
+            request.auth = None
+            if user_auth_tuple is not None:
+                request.user, request.auth = user_auth_tuple
+            elif require_auth:
+                return api_error_response(exceptions.NotAuthenticated())
+
+            if request.method == 'OPTIONS':
+                return build_options_response(view_func, allowed_methods)
+
+            response = await view_func(request, *args, **kwargs)
+            if head:
+                return await strip_response_body(response)
+            return response
+        return wrapper
+    return decorator
+
+
+async def aiter_request_body(body_stream):
+    """将请求体流包装为异步迭代器（httpx.AsyncClient 只接受异步请求体流）"""
+    for chunk in body_stream:
+        yield chunk
+
+
+async def aiter_upstream_body(response, chunk_size, encoded=False):
+    """分块读取上游响应体（encoded为True时读取未解压的原始字节），结束后释放连接回连接池"""
+    try:
+        chunks = response.aiter_raw(chunk_size=chunk_size) if encoded else response.aiter_bytes(chunk_size=chunk_size)
+        async for chunk in chunks:
+            yield chunk
+    except httpx.HTTPError as e:
+        logger.warning(f'读取上游响应失败: {e}')
+    finally:
+        await response.aclose()
+
+
+async def fetch_upstream(request, pool, path, cache_key=None, buffered=False):
+    """
+    在上游并发名额内异步调用上游服务，名额不足时排队，队列已满或等待超时时直接拒绝
+
+    Args:
+        cache_key: 响应缓存键，不为None时缓冲并缓存响应
+        buffered: 是否必须返回已缓冲的响应（请求合并时结果需要分发给多个请求）
+    """
+    limiter = async_admission_registry.get(pool.service_name)
+    if limiter is None:
+        return await call_upstream(request, pool, path, cache_key, buffered)
+
+    if not await limiter.acquire():
+        gateway_metrics.record_rejection(pool.service_name, 'overloaded')
+        return build_overloaded_response(limiter)
+    try:
+        return await call_upstream(request, pool, path, cache_key, buffered)
+    finally:
+        limiter.release()
+
+
+async def call_upstream(request, pool, path, cache_key=None, buffered=False):
+    """
+    异步调用上游服务并构建返回给客户端的响应（上游异常转换为错误响应）
+
+    Args:
+        cache_key: 响应缓存键，不为None时缓冲并缓存响应
+        buffered: 是否必须返回已缓冲的响应（请求合并时结果需要分发给多个请求）
+    """
+    breaker = breaker_registry.get(pool.service_name)
+    permit = None
+    if breaker is not None:
+        permit = breaker.allow_request()
+        if permit is None:
+            gateway_metrics.record_rejection(pool.service_name, 'circuit_open')
+            return build_circuit_open_response(breaker)
+
+    hedge_policy = hedging_registry.get_for_request(request, pool.service_name)
+    started = time.monotonic()
+    latency = None
+    failed = True
+    outcome = 'error'
+    response_bytes = None
+    try:
+        stream = settings.GATEWAY_STREAM_RESPONSES and cache_key is None and not buffered
+        conditional = cache_key is None and not buffered
+
+        async def send(replica):
+            upstream_request = build_upstream_request(
+                request, replica.url, path, stream, conditional, msgpack=cache_key is not None
+            )
+            if isinstance(upstream_request['body'], RequestBodyStream):
+                upstream_request['body'] = aiter_request_body(upstream_request['body'])
+            return await pool.request(stream=stream, **upstream_request)
+
+        # 非阻塞发送请求，等待期间事件循环可处理其他请求；由负载均衡器选择副本，对冲路由超时后向另一个副本发送对冲请求
+        response = await asend_upstream(pool.balancer, send, hedge_policy)
+        latency = time.monotonic() - started
+        failed = response.status_code >= 500
+        outcome = str(response.status_code)
+        if 'Content-Length' in response.headers:
+            response_bytes = int(response.headers['Content-Length'])
+        record_upstream_timing(request, pool.service_name, latency, response)
+
+        if cache_key is not None:
+            client_response, cached = cache_upstream_response(cache_key, response)
+            if cached is not None:
+                await sync_to_async(response_cache.set, thread_sensitive=False)(cache_key, cached)
+            return client_response
+
+        if response.status_code == status.HTTP_304_NOT_MODIFIED:
+            await response.aclose()
+            return build_not_modified_response(response.headers.get('ETag'))
+
+        if is_passthrough_response(response):
+            if stream:
+                encoded = is_relayable_encoding(request, response)
+                return build_streaming_response(
+                    response,
+                    aiter_upstream_body(response, settings.GATEWAY_STREAM_CHUNK_SIZE, encoded),
+                    encoded
+                )
+            if buffered:
+                return build_buffered_response(response)
+        elif stream:
+            # 需要检查的响应先完整读取
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+
+        return build_client_response(response)
+    except httpx.HTTPError as e:
+        if isinstance(e, httpx.TimeoutException):
+            outcome = 'timeout'
+        return JsonResponse(
+            {'error': f'服务调用失败: {str(e)}'},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return JsonResponse(
+            {'error': f'请求处理失败: {str(e)}'},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+    finally:
+        if latency is None:
+            latency = time.monotonic() - started
+        if permit is not None:
+            breaker.record(permit, failed, latency)
+        if get_metrics_config()['ENABLED']:
+            gateway_metrics.record_upstream(pool.service_name, outcome, latency, response_bytes)
+
+
+async def forward_request(request, service_name, path=''):
+    """
+    异步转发请求到指定服务
+
+    Args:
+        request: Django请求对象
+        service_name: 服务名称
+        path: 服务路径（不包含/api/前缀）
+    """
+    pool = router.get_pool(service_name)
+    if pool is None:
+        return JsonResponse(
+            {'error': f'服务 {service_name} 不存在'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    # 解析租户需要查询数据库，在线程池中执行
+    if should_resolve_identity(request):
+        if not await sync_to_async(resolve_identity, thread_sensitive=False)(request):
+            return build_company_forbidden_response()
+
+    # 按租户限流：优先消耗本地租用的令牌，不足时在线程池中访问Redis
+    with span('ratelimit'):
+        buckets = rate_limiter.get_buckets(request)
+        decision = rate_limiter.check_local(buckets) if buckets else None
+        if buckets and decision is None:
+            decision = await sync_to_async(rate_limiter.check, thread_sensitive=False)(buckets)
+    if decision is not None and not decision.allowed:
+        return apply_rate_limit_headers(build_rate_limited_response(), decision)
+
+    response = await proxy_request(request, pool, path)
+    return apply_rate_limit_headers(response, decision)
+
+
+async def proxy_request(request, pool, path):
+    """
+    经过响应缓存和请求合并后异步调用上游服务
+
+    Args:
+        pool: 上游服务异步连接池
+    """
+    # GET响应缓存：先查L1（无IO），未命中再在线程池中查询Redis
+    cache_key = response_cache.build_key(request)
+    if cache_key is not None:
+        with span('cache'):
+            cached = response_cache.get_local(cache_key)
+            if cached is None:
+                cached, generation = await sync_to_async(response_cache.get_remote, thread_sensitive=False)(cache_key)
+        if cached is not None:
+            # 客户端持有的ETag与缓存一致时直接返回304，不访问上游
+            if etag_matches(request, cached.etag):
+                client_response = build_not_modified_response(cached.etag)
+                client_response['X-Cache'] = 'HIT'
+                return client_response
+            return build_cached_response(cached, 'HIT')
+        # 请求上游前的失效代数：上游返回前资源已被写操作失效时不写入缓存
+        cache_key = cache_key._replace(generation=generation)
+
+    try:
+        # 相同的并发GET请求合并为一次上游调用
+        coalescing_key = build_coalescing_key(request)
+        if coalescing_key is None:
+            return evaluate_conditional(request, await fetch_upstream(request, pool, path, cache_key))
+
+        async def fetch_snapshot():
+            return snapshot_response(await fetch_upstream(request, pool, path, cache_key, buffered=True))
+
+        # 共享不可变的响应快照，每个请求各自构建响应对象（之后的压缩、ETag处理互不影响）
+        snapshot, shared = await async_single_flight.do(coalescing_key, fetch_snapshot)
+        return evaluate_conditional(request, build_snapshot_response(snapshot, shared))
+    finally:
+        if request.method in WRITE_METHODS:
+            await sync_to_async(response_cache.invalidate, thread_sensitive=False)(request.path)
+
+
+@async_api_view(require_auth=False, methods=['POST'])
+async def batch_proxy(request):
+    """
+    批量请求代理
+    并发执行多个子请求并合并返回，每个子请求按其路由单独进行认证和权限检查
+    """
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return api_error_response(exceptions.ParseError())
+
+    serializer = BatchRequestSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    results = await arun_batch(request, serializer.validated_data['requests'])
+    return JsonResponse({'results': results}, status=status.HTTP_200_OK)
+
+
+@async_api_view(require_auth=True)
+async def user_service_proxy(request, path=''):
+    """用户服务代理"""
+    return await forward_request(request, 'user_service', f'users/{path}')
+
+
+@async_api_view(require_auth=True)
+async def company_service_proxy(request, path=''):
+    """企业服务代理"""
+    return await forward_request(request, 'company_service', f'companies/{path}')
+
+
+@async_api_view(require_auth=False)
+async def auth_service_proxy(request, path=''):
+    """认证服务代理（允许未认证访问）"""
+    return await forward_request(request, 'auth_service', f'auth/{path}')
+
+
+@async_api_view(require_auth=True)
+async def permission_service_proxy(request, path=''):
+    """权限服务代理"""
+    return await forward_request(request, 'permission_service', f'permissions/{path}')
+
+
+@async_api_view(require_auth=True)
+async def notification_service_proxy(request, path=''):
+    """通知服务代理"""
+    return await forward_request(request, 'notification_service', f'notifications/{path}')
+
+
+@async_api_view(require_auth=True)
+async def log_service_proxy(request, path=''):
+    """日志服务代理"""
+    return await forward_request(request, 'log_service', f'logs/{path}')
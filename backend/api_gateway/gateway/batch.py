@@ -0,0 +1,217 @@
+"""
+批量请求
+将多个子请求并发分发到各服务代理路由（与单独调用时的认证、缓存、熔断等行为一致），合并为一个响应返回
+"""
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.urls import resolve, Resolver404
+from rest_framework import status
+
+from common.utils.msgpack_utils import is_msgpack_content_type, unpackb
+
+
+# 子请求从批量请求继承的META
+INHERITED_META = [
+    'HTTP_AUTHORIZATION',
+    'HTTP_ACCEPT',
+    'HTTP_HOST',
+    'HTTP_X_FORWARDED_FOR',
+    'HTTP_X_COMPANY_ID',
+    'REMOTE_ADDR',
+    'SERVER_NAME',
+    'SERVER_PORT',
+    'wsgi.url_scheme',
+]
+
+# 允许作为子请求的路由（各服务代理路由）
+PROXY_URL_NAME_SUFFIXES = ('_service_proxy', '_service_proxy_detail')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """批量请求共享的线程池（同步模式）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.GATEWAY_BATCH['MAX_WORKERS'],
+                    thread_name_prefix='gateway-batch'
+                )
+    return _executor
+
+
+def build_sub_request(parent, item):
+    """
+    根据批量请求中的子请求描述构建Django请求对象
+
+    Args:
+        parent: 批量请求
+        item: 子请求（method、path、body）
+    """
+    split = urlsplit(item['path'])
+    body = b''
+
+    sub_request = HttpRequest()
+    sub_request.method = item['method']
+    sub_request.path = sub_request.path_info = split.path
+    sub_request.META = {key: parent.META[key] for key in INHERITED_META if key in parent.META}
+    sub_request.META.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': split.path,
+        'QUERY_STRING': split.query,
+    })
+    sub_request.GET = QueryDict(split.query)
+
+    if item.get('body') is not None:
+        body = json.dumps(item['body']).encode('utf-8')
+        sub_request.META['CONTENT_TYPE'] = 'application/json'
+        sub_request.content_type = 'application/json'
+    sub_request.META['CONTENT_LENGTH'] = str(len(body))
+    sub_request._body = body
+    sub_request._dont_enforce_csrf_checks = True
+    # 子请求的上游调用计入批量请求的追踪
+    trace = getattr(parent, 'trace', None)
+    if trace is not None:
+        sub_request.trace = trace
+    return sub_request
+
+
+def resolve_sub_request(sub_request):
+    """
+    解析子请求对应的服务代理视图
+
+    Returns:
+        ResolverMatch，路由不存在或不是代理路由时返回None
+    """
+    try:
+        match = resolve(sub_request.path_info)
+    except Resolver404:
+        return None
+    if not (match.url_name or '').endswith(PROXY_URL_NAME_SUFFIXES):
+        return None
+    sub_request.resolver_match = match
+    return match
+
+
+def build_item_result(item, index, status_code, headers, body):
+    """构建单个子请求的结果"""
+    return {
+        'id': item.get('id', str(index)),
+        'status': status_code,
+        'headers': headers,
+        'body': body,
+    }
+
+
+def build_item_response_result(item, index, response, content):
+    """根据子请求的响应构建结果，JSON / msgpack响应体解析后嵌入"""
+    body = None
+    if content:
+        content_type = response.get('Content-Type', '')
+        if 'application/json' in content_type or is_msgpack_content_type(content_type):
+            try:
+                body = json.loads(content) if 'application/json' in content_type else unpackb(content)
+            except ValueError:
+                body = content.decode('utf-8', errors='replace')
+        else:
+            body = content.decode('utf-8', errors='replace')
+    return build_item_result(item, index, response.status_code, dict(response.items()), body)
+
+
+def build_item_error_result(item, index, status_code, message):
+    """子请求失败的结果"""
+    return build_item_result(item, index, status_code, {}, {'error': message})
+
+
+def run_sub_request(parent, item, index):
+    """在线程池中执行单个子请求（同步模式）"""
+    sub_request = build_sub_request(parent, item)
+    match = resolve_sub_request(sub_request)
+    if match is None:
+        return build_item_error_result(item, index, status.HTTP_404_NOT_FOUND, f'路由 {item["path"]} 不存在')
+
+    response = None
+    try:
+        response = match.func(sub_request, *match.args, **match.kwargs)
+        # DRF视图返回的Response需要先渲染
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+        if response.streaming:
+            content = b''.join(response.streaming_content)
+        else:
+            content = response.content
+        return build_item_response_result(item, index, response, content)
+    except Exception as e:
+        return build_item_error_result(item, index, status.HTTP_500_INTERNAL_SERVER_ERROR, f'请求处理失败: {str(e)}')
+    finally:
+        if response is not None:
+            response.close()
+        connections.close_all()
+
+
+def run_batch(parent, items):
+    """
+    并发执行所有子请求（同步模式）
+
+    Returns:
+        按子请求顺序排列的结果列表
+    """
+    executor = get_executor()
+    futures = [
+        executor.submit(run_sub_request, parent, item, index)
+        for index, item in enumerate(items)
+    ]
+    return [future.result() for future in futures]
+
+
+async def arun_sub_request(parent, item, index):
+    """执行单个子请求（异步模式）"""
+    sub_request = build_sub_request(parent, item)
+    match = resolve_sub_request(sub_request)
+    if match is None:
+        return build_item_error_result(item, index, status.HTTP_404_NOT_FOUND, f'路由 {item["path"]} 不存在')
+
+    try:
+        if asyncio.iscoroutinefunction(match.func):
+            response = await match.func(sub_request, *match.args, **match.kwargs)
+        else:
+            response = await sync_to_async(match.func)(sub_request, *match.args, **match.kwargs)
+            if hasattr(response, 'render') and not response.is_rendered:
+                response.render()
+
+        if not response.streaming:
+            content = response.content
+        elif response.is_async:
+            content = b''.join([chunk async for chunk in response.streaming_content])
+        else:
+            content = b''.join(response.streaming_content)
+        return build_item_response_result(item, index, response, content)
+    except Exception as e:
+        return build_item_error_result(item, index, status.HTTP_500_INTERNAL_SERVER_ERROR, f'请求处理失败: {str(e)}')
+
+
+async def arun_batch(parent, items):
+    """
+    并发执行所有子请求（异步模式），并发数不超过 MAX_WORKERS
+
+    Returns:
+        按子请求顺序排列的结果列表
+    """
+    semaphore = asyncio.Semaphore(settings.GATEWAY_BATCH['MAX_WORKERS'])
+
+    async def run(item, index):
+        async with semaphore:
+            return await arun_sub_request(parent, item, index)
+
+    return await asyncio.gather(*(run(item, index) for index, item in enumerate(items)))
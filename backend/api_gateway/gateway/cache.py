@@ -0,0 +1,384 @@
+"""
+网关GET响应缓存
+两级缓存：进程内LRU（L1）+ Redis（L2），按租户、用户、路径和查询参数隔离
+"""
+import hashlib
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import msgpack
+import redis
+from django.conf import settings
+
+from common.utils.jwt_utils import get_requested_company_id
+from common.utils.redis_client import get_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'gateway:cache'
+
+# 资源前缀失效代数的保留时间（秒），远大于一次上游请求的耗时
+GENERATION_TTL = 86400
+
+# 只在资源前缀的失效代数与请求上游前读取的值一致时写入（KEYS: 代数键、缓存键、前缀集合键；ARGV: 代数、值、TTL、前缀集合TTL）
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+redis.call('SADD', KEYS[3], KEYS[2])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return 1
+"""
+
+DEFAULT_CACHE_CONFIG = {
+    'ENABLED': True,
+    'L1_MAX_ENTRIES': 1000,
+    'L1_MAX_TTL': 5,
+    'L2_ENABLED': True,
+    'MAX_BODY_SIZE': 1024 * 1024,
+    'ROUTES': [],
+}
+
+# 缓存键：key为缓存键，prefix为资源前缀（用于写操作失效），ttl为缓存时间（秒），
+# generation为缓存未命中时读取的资源前缀失效代数（本进程代数, Redis代数），写入时据此放弃失效前取得的响应
+CacheKey = namedtuple('CacheKey', ['key', 'prefix', 'ttl', 'generation'], defaults=[None])
+
+# 缓存的响应（etag用于条件GET，旧版本写入的缓存条目没有etag）
+CachedResponse = namedtuple('CachedResponse', ['status_code', 'content_type', 'body', 'etag'], defaults=[None])
+
+
+def get_cache_config():
+    """获取响应缓存配置"""
+    cache_config = dict(DEFAULT_CACHE_CONFIG)
+    cache_config.update(getattr(settings, 'GATEWAY_RESPONSE_CACHE', {}))
+    return cache_config
+
+
+def get_resource_prefix(path):
+    """
+    获取路径所属的资源前缀，如 /api/companies/abc/update/ -> /api/companies/
+    对同一资源前缀的写操作会使该前缀下的所有缓存失效
+    """
+    parts = [part for part in path.split('/') if part]
+    if len(parts) >= 2 and parts[0] == 'api':
+        return f'/api/{parts[1]}/'
+    return path
+
+
+def get_request_scope(request):
+    """
+    获取请求的缓存隔离范围
+
+    Returns:
+        (company_id, user_id)，未认证请求的user_id为None；
+        company_id可能是网关未校验的 X-Company-Id，不能用于授权或按企业计费
+    """
+    user_id = None
+    token = getattr(request, 'auth', None)
+    if token is not None and hasattr(token, 'get'):
+        user_id = token.get('user_id')
+    company_id = getattr(request, 'company_id', None)
+    if company_id is None and user_id:
+        # 网关未校验的指定企业（由下游服务校验），只用于隔离缓存和合并范围
+        company_id = get_requested_company_id(request.META)
+    return company_id, user_id
+
+
+class LocalLRUCache:
+    """
+    进程内LRU缓存（L1）
+    多进程部署时各进程的L1互不可见，因此L1的TTL上限较短，用于限制跨进程的数据滞后
+    """
+
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, _, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, prefix):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, prefix, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_prefix(self, prefix):
+        """删除资源前缀下的所有条目"""
+        with self._lock:
+            keys = [key for key, (_, entry_prefix, _) in self._entries.items() if entry_prefix == prefix]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ResponseCache:
+    """
+    网关响应缓存
+    只缓存已配置路由的GET请求的200 JSON响应，命中时不访问上游服务
+    """
+
+    def __init__(self):
+        self._routes = None
+        self._l1 = None
+        self._lock = threading.Lock()
+        self._script = None
+        # 本进程内各资源前缀的失效代数
+        self._generations = {}
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.stale_writes_skipped = 0
+        self.redis_errors = 0
+
+    @property
+    def l1(self):
+        if self._l1 is None:
+            self._l1 = LocalLRUCache(get_cache_config()['L1_MAX_ENTRIES'])
+        return self._l1
+
+    def _get_routes(self):
+        """编译路由TTL配置：[(路径正则, TTL秒数), ...]"""
+        if self._routes is None:
+            self._routes = [
+                (re.compile(pattern), ttl)
+                for pattern, ttl in get_cache_config()['ROUTES']
+            ]
+        return self._routes
+
+    def get_route_ttl(self, path):
+        """获取路径的缓存时间，未配置缓存时返回None"""
+        for pattern, ttl in self._get_routes():
+            if pattern.match(path):
+                return ttl
+        return None
+
+    def get_max_ttl(self):
+        """所有路由中最长的缓存时间"""
+        return max((ttl for _, ttl in self._get_routes()), default=0)
+
+    def build_key(self, request):
+        """
+        构建请求的缓存键
+
+        Returns:
+            CacheKey，请求不可缓存时返回None
+        """
+        cache_config = get_cache_config()
+        if not cache_config['ENABLED'] or request.method != 'GET':
+            return None
+
+        ttl = self.get_route_ttl(request.path)
+        if not ttl:
+            return None
+
+        company_id, user_id = get_request_scope(request)
+        if not user_id:
+            return None
+
+        query = '&'.join(sorted(
+            f'{name}={value}'
+            for name, values in request.GET.lists()
+            for value in values
+        ))
+        raw_key = f'{company_id or "-"}:{user_id}:{request.path}?{query}'
+        key = hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+        return CacheKey(key, get_resource_prefix(request.path), ttl)
+
+    def _redis_key(self, key):
+        return f'{REDIS_KEY_PREFIX}:entry:{key}'
+
+    def _redis_prefix_key(self, prefix):
+        return f'{REDIS_KEY_PREFIX}:prefix:{prefix}'
+
+    def _redis_generation_key(self, prefix):
+        return f'{REDIS_KEY_PREFIX}:generation:{prefix}'
+
+    def _set_script(self):
+        if self._script is None:
+            self._script = get_redis_client().register_script(SET_IF_GENERATION_SCRIPT)
+        return self._script
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, cache_key):
+        """
+        查询缓存（先L1后L2，L2命中时回填L1）
+
+        Returns:
+            (CachedResponse或None, 失效代数)，未命中时应以 cache_key._replace(generation=失效代数) 写入缓存
+        """
+        cached = self.get_local(cache_key)
+        if cached is not None:
+            return cached, None
+        return self.get_remote(cache_key)
+
+    def get_local(self, cache_key):
+        """查询L1缓存（不涉及网络IO，可在事件循环中直接调用）"""
+        cached = self.l1.get(cache_key.key)
+        if cached is not None:
+            self._count('hits_l1')
+        return cached
+
+    def get_remote(self, cache_key):
+        """
+        查询L2缓存，命中时回填L1；同时读取资源前缀的失效代数（未命中时请求上游前的代数）
+
+        Returns:
+            (CachedResponse或None, 失效代数)
+        """
+        cache_config = get_cache_config()
+        with self._lock:
+            local_generation = self._generations.get(cache_key.prefix, 0)
+        if not cache_config['L2_ENABLED']:
+            self._count('misses')
+            return None, (local_generation, None)
+
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            pipeline.get(self._redis_key(cache_key.key))
+            pipeline.get(self._redis_generation_key(cache_key.prefix))
+            payload, remote_generation = pipeline.execute()
+            remote_generation = remote_generation.decode('utf-8') if remote_generation is not None else ''
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'读取Redis响应缓存失败: {e}')
+            # 无法读取Redis代数时不写入L2
+            payload, remote_generation = None, None
+
+        if payload is not None:
+            cached = CachedResponse(*msgpack.unpackb(payload))
+            self._set_local(cache_key, cached, local_generation, cache_config)
+            self._count('hits_l2')
+            return cached, None
+
+        self._count('misses')
+        return None, (local_generation, remote_generation)
+
+    def is_cacheable(self, status_code, content_type, body, etag=None):
+        """判断上游响应是否可以缓存"""
+        return (
+            status_code == 200
+            and 'application/json' in (content_type or '').lower()
+            and len(body) <= get_cache_config()['MAX_BODY_SIZE']
+        )
+
+    def _set_local(self, cache_key, cached, local_generation, cache_config):
+        """写入L1；本进程在读取代数之后使该资源前缀失效过时放弃"""
+        with self._lock:
+            if self._generations.get(cache_key.prefix, 0) != local_generation:
+                return False
+            self.l1.set(
+                cache_key.key,
+                cached,
+                min(cache_key.ttl, cache_config['L1_MAX_TTL']),
+                cache_key.prefix
+            )
+            return True
+
+    def set(self, cache_key, cached):
+        """
+        写入缓存（L1 + L2）
+        cache_key.generation 为 get 未命中时读取的失效代数，期间资源前缀已失效时不写入（响应可能是写操作之前的数据）
+        """
+        cache_config = get_cache_config()
+        local_generation, remote_generation = cache_key.generation
+        with self._lock:
+            stale = self._generations.get(cache_key.prefix, 0) != local_generation
+        if stale:
+            self._count('stale_writes_skipped')
+            return
+
+        # 其他进程使资源前缀失效时L2写入被放弃，L1也不写入；读取Redis代数失败时只写入L1
+        if cache_config['L2_ENABLED'] and remote_generation is not None:
+            try:
+                # 前缀集合的过期时间取所有路由中最长的TTL，保证不早于其中的缓存条目过期
+                written = self._set_script()(
+                    keys=[
+                        self._redis_generation_key(cache_key.prefix),
+                        self._redis_key(cache_key.key),
+                        self._redis_prefix_key(cache_key.prefix),
+                    ],
+                    args=[remote_generation, msgpack.packb(list(cached)), cache_key.ttl, self.get_max_ttl()]
+                )
+            except redis.RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f'写入Redis响应缓存失败: {e}')
+                written = True
+            if not written:
+                self._count('stale_writes_skipped')
+                return
+
+        if not self._set_local(cache_key, cached, local_generation, cache_config):
+            self._count('stale_writes_skipped')
+            return
+        self._count('stores')
+
+    def invalidate(self, path):
+        """
+        使路径所属资源前缀下的所有缓存失效（所有租户和用户）
+        同时递增资源前缀的失效代数，进行中的上游请求不会再把写操作之前的响应写入缓存
+        """
+        prefix = get_resource_prefix(path)
+        with self._lock:
+            self._generations[prefix] = self._generations.get(prefix, 0) + 1
+        self.l1.invalidate_prefix(prefix)
+        if get_cache_config()['L2_ENABLED']:
+            prefix_key = self._redis_prefix_key(prefix)
+            generation_key = self._redis_generation_key(prefix)
+            try:
+                client = get_redis_client()
+                # 先递增代数再读取前缀集合：此后的条件写入都会放弃，此前写入的条目都在集合中
+                pipeline = client.pipeline(transaction=False)
+                pipeline.incr(generation_key)
+                pipeline.expire(generation_key, GENERATION_TTL)
+                pipeline.smembers(prefix_key)
+                redis_keys = pipeline.execute()[2]
+                pipeline = client.pipeline(transaction=False)
+                if redis_keys:
+                    pipeline.delete(*redis_keys)
+                pipeline.delete(prefix_key)
+                pipeline.execute()
+            except redis.RedisError as e:
+                self._count('redis_errors')
+                logger.warning(f'清除Redis响应缓存失败: {e}')
+        self._count('invalidations')
+
+    def metrics(self):
+        """缓存指标"""
+        return {
+            'l1_entries': len(self.l1),
+            'hits_l1': self.hits_l1,
+            'hits_l2': self.hits_l2,
+            'misses': self.misses,
+            'stores': self.stores,
+            'invalidations': self.invalidations,
+            'stale_writes_skipped': self.stale_writes_skipped,
+            'redis_errors': self.redis_errors,
+        }
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,214 @@
+"""
+上游服务熔断器
+按服务统计滚动时间窗口内的错误率和慢调用率，超过阈值时熔断并立即返回503，
+熔断一段时间后进入半开状态，放行少量探测请求决定是否恢复
+"""
+import threading
+import time
+
+from django.conf import settings
+
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# allow_request 返回的放行类型
+PERMIT_NORMAL = 'normal'
+PERMIT_PROBE = 'probe'
+
+DEFAULT_BREAKER_CONFIG = {
+    'ENABLED': True,
+    'WINDOW_SECONDS': 10,
+    'WINDOW_BUCKETS': 10,
+    'MIN_REQUESTS': 20,
+    'ERROR_RATE_THRESHOLD': 0.5,
+    'SLOW_CALL_SECONDS': 5,
+    'SLOW_CALL_RATE_THRESHOLD': 0.5,
+    'OPEN_SECONDS': 15,
+    'HALF_OPEN_MAX_PROBES': 3,
+    'SERVICE_OVERRIDES': {},
+}
+
+
+def get_breaker_config(service_name=None):
+    """获取熔断器配置（合并默认值、全局配置和服务级覆盖配置）"""
+    breaker_config = dict(DEFAULT_BREAKER_CONFIG)
+    breaker_config.update(getattr(settings, 'GATEWAY_CIRCUIT_BREAKER', {}))
+    if service_name:
+        breaker_config.update(breaker_config.get('SERVICE_OVERRIDES', {}).get(service_name, {}))
+    return breaker_config
+
+
+class RollingWindow:
+    """
+    滚动时间窗口计数器
+    窗口按时间分为若干个桶，过期的桶在写入时被重置
+    """
+
+    def __init__(self, window_seconds, bucket_count):
+        self.bucket_seconds = window_seconds / bucket_count
+        self.bucket_count = bucket_count
+        # 每个桶：[桶序号, 请求数, 失败数, 慢调用数]
+        self._buckets = [[-1, 0, 0, 0] for _ in range(bucket_count)]
+
+    def _current_index(self):
+        return int(time.monotonic() // self.bucket_seconds)
+
+    def add(self, failed, slow):
+        index = self._current_index()
+        bucket = self._buckets[index % self.bucket_count]
+        if bucket[0] != index:
+            bucket[:] = [index, 0, 0, 0]
+        bucket[1] += 1
+        bucket[2] += int(failed)
+        bucket[3] += int(slow)
+
+    def totals(self):
+        """窗口内的 (请求数, 失败数, 慢调用数)"""
+        oldest = self._current_index() - self.bucket_count
+        requests = failures = slow_calls = 0
+        for index, bucket_requests, bucket_failures, bucket_slow in self._buckets:
+            if index > oldest:
+                requests += bucket_requests
+                failures += bucket_failures
+                slow_calls += bucket_slow
+        return requests, failures, slow_calls
+
+    def reset(self):
+        for bucket in self._buckets:
+            bucket[:] = [-1, 0, 0, 0]
+
+
+class CircuitBreaker:
+    """单个上游服务的熔断器"""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        self.config = get_breaker_config(service_name)
+        self.window = RollingWindow(self.config['WINDOW_SECONDS'], self.config['WINDOW_BUCKETS'])
+        self.state = STATE_CLOSED
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self.state = STATE_OPEN
+        self.opened_at = time.monotonic()
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.trips += 1
+
+    def _close(self):
+        self.state = STATE_CLOSED
+        self.opened_at = None
+        self.probes_in_flight = 0
+        self.probe_successes = 0
+        self.window.reset()
+
+    def retry_after(self):
+        """熔断剩余时间（秒）"""
+        if self.state != STATE_OPEN or self.opened_at is None:
+            return 0
+        remaining = self.config['OPEN_SECONDS'] - (time.monotonic() - self.opened_at)
+        return max(1, int(remaining + 0.999))
+
+    def allow_request(self):
+        """
+        判断是否放行请求
+
+        Returns:
+            放行类型（PERMIT_NORMAL / PERMIT_PROBE），熔断中返回None
+        """
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.config['OPEN_SECONDS']:
+                    self.rejected += 1
+                    return None
+                self.state = STATE_HALF_OPEN
+
+            if self.state == STATE_HALF_OPEN:
+                if self.probes_in_flight >= self.config['HALF_OPEN_MAX_PROBES']:
+                    self.rejected += 1
+                    return None
+                self.probes_in_flight += 1
+                return PERMIT_PROBE
+
+            return PERMIT_NORMAL
+
+    def record(self, permit, failed, latency):
+        """
+        记录请求结果
+
+        Args:
+            permit: allow_request 返回的放行类型
+            failed: 是否失败（连接错误、超时或5xx响应）
+            latency: 上游响应耗时（秒）
+        """
+        slow = latency >= self.config['SLOW_CALL_SECONDS']
+        with self._lock:
+            if permit == PERMIT_PROBE:
+                if self.state != STATE_HALF_OPEN:
+                    return
+                self.probes_in_flight -= 1
+                if failed or slow:
+                    self._open()
+                    return
+                self.probe_successes += 1
+                if self.probe_successes >= self.config['HALF_OPEN_MAX_PROBES']:
+                    self._close()
+                return
+
+            if self.state != STATE_CLOSED:
+                return
+            self.window.add(failed, slow)
+            requests, failures, slow_calls = self.window.totals()
+            if requests < self.config['MIN_REQUESTS']:
+                return
+            if (failures / requests >= self.config['ERROR_RATE_THRESHOLD']
+                    or slow_calls / requests >= self.config['SLOW_CALL_RATE_THRESHOLD']):
+                self._open()
+
+    def metrics(self):
+        """熔断器状态"""
+        with self._lock:
+            requests, failures, slow_calls = self.window.totals()
+            return {
+                'state': self.state,
+                'window_requests': requests,
+                'error_rate': round(failures / requests, 4) if requests else 0,
+                'slow_call_rate': round(slow_calls / requests, 4) if requests else 0,
+                'retry_after': self.retry_after(),
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
+
+
+class CircuitBreakerRegistry:
+    """熔断器注册表，按服务名称懒加载创建"""
+
+    def __init__(self):
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, service_name):
+        """获取服务的熔断器，未启用熔断时返回None"""
+        if not get_breaker_config(service_name)['ENABLED']:
+            return None
+        breaker = self._breakers.get(service_name)
+        if breaker is None:
+            with self._lock:
+                breaker = self._breakers.setdefault(service_name, CircuitBreaker(service_name))
+        return breaker
+
+    def metrics(self):
+        return {
+            service_name: breaker.metrics()
+            for service_name, breaker in list(self._breakers.items())
+        }
+
+
+breaker_registry = CircuitBreakerRegistry()
@@ -0,0 +1,237 @@
+"""
+相同GET请求合并（single-flight）
+同一时刻的相同GET请求只向上游发送一次，结果分发给所有等待的请求
+"""
+import asyncio
+import hashlib
+import re
+import threading
+from collections import namedtuple
+
+from django.conf import settings
+from django.http import HttpResponse
+
+from .cache import get_request_scope
+
+
+DEFAULT_COALESCING_CONFIG = {
+    'ENABLED': True,
+    'ROUTES': [],
+    'WAIT_TIMEOUT': 35,
+}
+
+
+def get_coalescing_config():
+    """获取请求合并配置"""
+    coalescing_config = dict(DEFAULT_COALESCING_CONFIG)
+    coalescing_config.update(getattr(settings, 'GATEWAY_COALESCING', {}))
+    return coalescing_config
+
+
+_route_patterns = None
+
+
+def build_coalescing_key(request):
+    """
+    构建请求合并键（请求方法、路径、查询参数和认证范围）
+
+    Returns:
+        合并键，请求不参与合并时返回None
+    """
+    global _route_patterns
+    coalescing_config = get_coalescing_config()
+    if not coalescing_config['ENABLED'] or request.method != 'GET':
+        return None
+
+    if _route_patterns is None:
+        _route_patterns = [re.compile(pattern) for pattern in coalescing_config['ROUTES']]
+    if not any(pattern.match(request.path) for pattern in _route_patterns):
+        return None
+
+    # 已认证请求按租户和用户合并；否则按原始认证头合并
+    company_id, user_id = get_request_scope(request)
+    if user_id:
+        scope = f'{company_id or "-"}:{user_id}'
+    else:
+        scope = request.META.get('HTTP_AUTHORIZATION', '')
+
+    raw_key = '|'.join([
+        request.method,
+        request.get_full_path(),
+        scope,
+        request.META.get('HTTP_ACCEPT', ''),
+    ])
+    return hashlib.sha1(raw_key.encode('utf-8')).hexdigest()
+
+
+# 合并调用共享的响应快照（不可变）；响应对象会被各自请求的压缩、条件GET等处理原地修改，不能在请求之间共享
+ResponseSnapshot = namedtuple('ResponseSnapshot', ['status_code', 'headers', 'content'])
+
+
+def snapshot_response(response):
+    """保存已缓冲响应的快照（状态码、响应头、响应体）"""
+    return ResponseSnapshot(response.status_code, tuple(response.items()), response.content)
+
+
+def build_snapshot_response(snapshot, shared):
+    """
+    由快照为每个请求（包括leader）构建新的响应对象
+
+    Args:
+        shared: 结果是否来自其他请求发起的调用（添加 X-Coalesced 响应头）
+    """
+    response = HttpResponse(snapshot.content, status=snapshot.status_code)
+    for header, value in snapshot.headers:
+        response[header] = value
+    if shared:
+        response['X-Coalesced'] = 'true'
+    return response
+
+
+class _Call:
+    """进行中的上游调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    同步请求合并（多线程WSGI）
+    第一个请求（leader）执行上游调用，其余相同请求等待并共享其结果
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    def do(self, key, fn):
+        """
+        执行或加入进行中的调用
+
+        Returns:
+            (result, shared): shared为True表示结果来自其他请求发起的调用
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.misses += 1
+
+        if not leader:
+            if call.done.wait(get_coalescing_config()['WAIT_TIMEOUT']):
+                if call.error is not None:
+                    raise call.error
+                if call.result is not None:
+                    with self._lock:
+                        self.hits += 1
+                    return call.result, True
+            else:
+                with self._lock:
+                    self.timeouts += 1
+            # 等待超时或leader异常中断，自行调用上游
+            return fn(), False
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def metrics(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'timeouts': self.timeouts,
+            'in_flight': len(self._calls),
+        }
+
+
+class AsyncSingleFlight:
+    """
+    异步请求合并（ASGI）
+    在事件循环线程内使用，相同请求共享同一个 asyncio.Future
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.hits = 0
+        self.misses = 0
+        self.timeouts = 0
+
+    async def do(self, key, coro_fn):
+        """
+        执行或加入进行中的调用
+
+        Returns:
+            (result, shared): shared为True表示结果来自其他请求发起的调用
+        """
+        future = self._calls.get(key)
+        if future is not None:
+            try:
+                result = await asyncio.wait_for(
+                    asyncio.shield(future),
+                    get_coalescing_config()['WAIT_TIMEOUT']
+                )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return await coro_fn(), False
+            except asyncio.CancelledError:
+                # 只有leader被取消时才自行调用上游；当前请求本身被取消时继续抛出
+                if not future.cancelled():
+                    raise
+                return await coro_fn(), False
+            self.hits += 1
+            return result, True
+
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.misses += 1
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "Future exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._calls.pop(key, None)
+
+    def metrics(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'timeouts': self.timeouts,
+            'in_flight': len(self._calls),
+        }
+
+
+single_flight = SingleFlight()
+async_single_flight = AsyncSingleFlight()
+
+
+def get_coalescing_metrics():
+    """请求合并指标（同步与异步模式合计）"""
+    sync_metrics = single_flight.metrics()
+    async_metrics = async_single_flight.metrics()
+    return {
+        name: sync_metrics[name] + async_metrics[name]
+        for name in sync_metrics
+    }
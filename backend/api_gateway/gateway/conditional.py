@@ -0,0 +1,72 @@
+"""
+条件GET（ETag / If-None-Match）
+网关转发上游服务的ETag，缓存的响应同时保存ETag；客户端携带的 If-None-Match 与ETag匹配时返回304，不传输响应体，
+缓存中已有该ETag时不访问上游服务
+"""
+import hashlib
+
+from django.http import HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+
+
+# 允许返回304的请求方法
+CONDITIONAL_METHODS = ['GET', 'HEAD']
+
+
+def compute_etag(body):
+    """
+    按响应体计算强ETag（与服务端 ConditionalGetMiddleware 的算法一致，同一响应体得到相同的ETag）
+    """
+    return quote_etag(hashlib.md5(body, usedforsecurity=False).hexdigest())
+
+
+def _opaque_tag(etag):
+    """去掉弱ETag前缀，用于弱比较"""
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    """
+    请求的 If-None-Match 是否与ETag匹配（弱比较：压缩后被标记为弱ETag的响应也视为未修改）
+
+    Args:
+        request: Django请求对象
+        etag: 当前响应的ETag，为空时不匹配
+    """
+    if not etag or request.method not in CONDITIONAL_METHODS:
+        return False
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    if '*' in etags:
+        return True
+    target = _opaque_tag(etag)
+    return any(_opaque_tag(candidate) == target for candidate in etags)
+
+
+def build_not_modified_response(etag):
+    """构建不包含响应体的304响应"""
+    client_response = HttpResponseNotModified()
+    if etag:
+        client_response['ETag'] = etag
+    return client_response
+
+
+def evaluate_conditional(request, client_response):
+    """
+    对已缓冲的200响应判断条件GET，ETag匹配时替换为304响应
+
+    Returns:
+        304响应或原响应（流式响应由上游服务判断条件GET，原样返回）
+    """
+    if client_response.streaming or client_response.status_code != 200:
+        return client_response
+    etag = client_response.get('ETag')
+    if not etag_matches(request, etag):
+        return client_response
+    not_modified = build_not_modified_response(etag)
+    for header in ('Vary', 'X-Cache', 'X-Coalesced'):
+        if client_response.has_header(header):
+            not_modified[header] = client_response[header]
+    return not_modified
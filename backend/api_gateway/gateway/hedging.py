@@ -0,0 +1,365 @@
+"""
+对冲请求与重试预算
+幂等请求在等待超过该服务的p95延迟后，向另一个副本再发送一次请求，取先返回的结果；
+对冲请求消耗按请求量积累的重试令牌，令牌耗尽时不再对冲，避免在故障时放大上游压力
+"""
+import asyncio
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+# 可以安全重复发送的请求方法
+IDEMPOTENT_METHODS = ['GET', 'HEAD', 'OPTIONS']
+
+DEFAULT_HEDGING_CONFIG = {
+    'ENABLED': True,
+    'ROUTES': [],
+    'DELAY_PERCENTILE': 0.95,
+    # 延迟样本不足时使用的对冲延迟（秒）
+    'DEFAULT_DELAY': 0.2,
+    'MIN_DELAY': 0.02,
+    'MAX_DELAY': 2,
+    'MIN_SAMPLES': 50,
+    'WINDOW_SIZE': 500,
+    # 每个请求积累的重试令牌数（0.1表示对冲请求最多占请求量的10%）
+    'BUDGET_RATIO': 0.1,
+    'BUDGET_MAX_TOKENS': 20,
+    # 同步模式下发送对冲请求的线程数（首次请求在调用线程中执行，不占用该线程池）
+    'MAX_WORKERS': 64,
+}
+
+
+def get_hedging_config():
+    """获取对冲请求配置"""
+    hedging_config = dict(DEFAULT_HEDGING_CONFIG)
+    hedging_config.update(getattr(settings, 'GATEWAY_HEDGING', {}))
+    return hedging_config
+
+
+class LatencyTracker:
+    """最近N个上游响应延迟的环形缓冲区，用于估算延迟分位数"""
+
+    def __init__(self, window_size):
+        self._samples = [0.0] * window_size
+        self._count = 0
+        self._cached_quantile = None
+        self._lock = threading.Lock()
+
+    def record(self, latency):
+        with self._lock:
+            self._samples[self._count % len(self._samples)] = latency
+            self._count += 1
+            # 每积累一定数量的新样本后重新计算分位数
+            if self._count % 20 == 0:
+                self._cached_quantile = None
+
+    def quantile(self, q, min_samples):
+        """延迟分位数（秒），样本不足时返回None"""
+        with self._lock:
+            size = min(self._count, len(self._samples))
+            if size < min_samples:
+                return None
+            if self._cached_quantile is None or self._cached_quantile[0] != q:
+                ordered = sorted(self._samples[:size])
+                self._cached_quantile = (q, ordered[min(size - 1, int(size * q))])
+            return self._cached_quantile[1]
+
+
+class RetryBudget:
+    """
+    重试预算（令牌桶）
+    每个请求存入 ratio 个令牌，每次对冲取出1个令牌，令牌数不超过 max_tokens
+    """
+
+    def __init__(self, ratio, max_tokens):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def try_withdraw(self):
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class HedgePolicy:
+    """单个上游服务的对冲策略"""
+
+    def __init__(self, service_name):
+        self.service_name = service_name
+        hedging_config = get_hedging_config()
+        self.tracker = LatencyTracker(hedging_config['WINDOW_SIZE'])
+        self.budget = RetryBudget(hedging_config['BUDGET_RATIO'], hedging_config['BUDGET_MAX_TOKENS'])
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """对冲延迟（秒）：该服务的p95延迟，限制在 [MIN_DELAY, MAX_DELAY] 内"""
+        hedging_config = get_hedging_config()
+        delay = self.tracker.quantile(hedging_config['DELAY_PERCENTILE'], hedging_config['MIN_SAMPLES'])
+        if delay is None:
+            delay = hedging_config['DEFAULT_DELAY']
+        return min(max(delay, hedging_config['MIN_DELAY']), hedging_config['MAX_DELAY'])
+
+    def try_hedge(self):
+        """是否发送对冲请求（消耗重试预算）"""
+        hedge = self.budget.try_withdraw()
+        with self._lock:
+            if hedge:
+                self.hedged += 1
+            else:
+                self.budget_exhausted += 1
+        return hedge
+
+    def record_hedge_win(self):
+        """对冲请求先于首次请求成功返回"""
+        with self._lock:
+            self.hedge_wins += 1
+
+    def metrics(self):
+        with self._lock:
+            counters = {
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'budget_exhausted': self.budget_exhausted,
+            }
+        return {
+            'delay_ms': round(self.delay() * 1000, 2),
+            'hedged': counters['hedged'],
+            'hedge_wins': counters['hedge_wins'],
+            'budget_tokens': round(self.budget.tokens, 2),
+            'budget_exhausted': counters['budget_exhausted'],
+        }
+
+
+class HedgingRegistry:
+    """对冲策略注册表，按服务名称懒加载创建"""
+
+    def __init__(self):
+        self._policies = {}
+        self._routes = None
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _route_matches(self, path):
+        if self._routes is None:
+            with self._lock:
+                if self._routes is None:
+                    self._routes = [re.compile(pattern) for pattern in get_hedging_config()['ROUTES']]
+        return any(pattern.match(path) for pattern in self._routes)
+
+    def get(self, service_name):
+        policy = self._policies.get(service_name)
+        if policy is None:
+            with self._lock:
+                policy = self._policies.setdefault(service_name, HedgePolicy(service_name))
+        return policy
+
+    def get_for_request(self, request, service_name):
+        """
+        获取请求适用的对冲策略（同时为该服务积累重试预算）
+
+        Returns:
+            HedgePolicy，请求不是幂等请求或路由未配置对冲时返回None
+        """
+        if not get_hedging_config()['ENABLED'] or request.method not in IDEMPOTENT_METHODS:
+            return None
+        if not self._route_matches(request.path):
+            return None
+        policy = self.get(service_name)
+        policy.budget.deposit()
+        return policy
+
+    @property
+    def executor(self):
+        """同步模式下发送对冲请求的线程池"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=get_hedging_config()['MAX_WORKERS'],
+                        thread_name_prefix='gateway-hedge'
+                    )
+        return self._executor
+
+    def metrics(self):
+        return {
+            service_name: policy.metrics()
+            for service_name, policy in list(self._policies.items())
+        }
+
+
+hedging_registry = HedgingRegistry()
+
+
+def _attempt(balancer, replica, send, policy=None):
+    """
+    向选定的副本发送一次请求，结果用于副本的被动摘除；
+    每次请求各自的延迟计入对冲策略的延迟统计（不使用对冲后的延迟，避免p95被拉低）
+    """
+    failed = True
+    started = time.monotonic()
+    try:
+        response = send(replica)
+        failed = response.status_code >= 500
+        if policy is not None and not failed:
+            policy.tracker.record(time.monotonic() - started)
+        return response
+    finally:
+        balancer.release(replica, failed)
+
+
+async def _aattempt(balancer, replica, send, policy=None):
+    """向选定的副本异步发送一次请求（同 _attempt）"""
+    failed = True
+    started = time.monotonic()
+    try:
+        response = await send(replica)
+        failed = response.status_code >= 500
+        if policy is not None and not failed:
+            policy.tracker.record(time.monotonic() - started)
+        return response
+    except asyncio.CancelledError:
+        # 对冲中未被采用而取消的请求不算副本失败
+        failed = False
+        raise
+    finally:
+        balancer.release(replica, failed)
+
+
+def _discard(future):
+    """丢弃未被采用的对冲请求结果，释放其连接"""
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
+
+
+def _hedge_after(balancer, primary_replica, send, policy, primary_done, deadline):
+    """
+    在线程池中执行：到达对冲时间时首次请求仍未返回，则消耗重试预算向另一个副本发送对冲请求
+
+    Returns:
+        对冲请求的响应，未发送对冲请求时返回None
+    """
+    if primary_done.wait(max(0, deadline - time.monotonic())) or not policy.try_hedge():
+        return None
+    return _attempt(balancer, balancer.acquire(exclude=primary_replica), send, policy)
+
+
+def _hedge_result(hedge):
+    """首次请求失败后取对冲请求的结果，对冲请求未发送或同样失败时返回None"""
+    if hedge.cancel():
+        return None
+    try:
+        response = hedge.result()
+    except Exception:
+        return None
+    if response is not None and response.status_code >= 500:
+        response.close()
+        return None
+    return response
+
+
+def send_upstream(balancer, send, policy=None):
+    """
+    由负载均衡器选择副本发送请求（同步模式）
+    指定对冲策略且服务有多个副本时，首次请求在调用线程中执行，线程池在到达对冲延迟后向另一个副本发送对冲请求；
+    调用线程在首次请求返回后才能继续，因此首次请求失败（5xx或连接错误）时改用已发出的对冲请求的结果
+
+    Args:
+        balancer: 服务副本的负载均衡器
+        send: 向副本发送一次请求的函数 send(replica) -> response
+        policy: HedgePolicy，为None时不对冲
+
+    Returns:
+        上游响应，所有请求都失败时返回首次请求失败的响应或抛出其异常
+    """
+    # 只有一个副本时对冲请求只会发给同一个副本
+    if policy is None or len(balancer.replicas) < 2:
+        return _attempt(balancer, balancer.acquire(), send, policy)
+
+    primary_replica = balancer.acquire()
+    primary_done = threading.Event()
+    # 对冲时间从首次请求发出时算起，不包括在线程池中排队的时间
+    hedge = hedging_registry.executor.submit(
+        _hedge_after, balancer, primary_replica, send, policy, primary_done, time.monotonic() + policy.delay()
+    )
+    try:
+        response = _attempt(balancer, primary_replica, send, policy)
+    except Exception:
+        primary_done.set()
+        hedged = _hedge_result(hedge)
+        if hedged is None:
+            raise
+        policy.record_hedge_win()
+        return hedged
+    primary_done.set()
+
+    if response.status_code < 500:
+        if not hedge.cancel():
+            hedge.add_done_callback(_discard)
+        return response
+
+    hedged = _hedge_result(hedge)
+    if hedged is None:
+        return response
+    response.close()
+    policy.record_hedge_win()
+    return hedged
+
+
+async def asend_upstream(balancer, send, policy=None):
+    """
+    由负载均衡器选择副本发送请求；指定对冲策略且服务有多个副本时，超过对冲延迟未返回则向另一个副本发送对冲请求，
+    取先成功返回的结果，未采用的请求被取消（异步模式）
+
+    Args:
+        balancer: 服务副本的负载均衡器
+        send: 向副本发送一次请求的协程函数 send(replica) -> response
+        policy: HedgePolicy，为None时不对冲
+
+    Returns:
+        上游响应，所有请求都失败时返回最后一个失败的响应或抛出其异常
+    """
+    # 只有一个副本时对冲请求只会发给同一个副本
+    if policy is None or len(balancer.replicas) < 2:
+        return await _aattempt(balancer, balancer.acquire(), send, policy)
+
+    primary_replica = balancer.acquire()
+    primary = asyncio.ensure_future(_aattempt(balancer, primary_replica, send, policy))
+    done, _ = await asyncio.wait([primary], timeout=policy.delay())
+
+    pending = {primary}
+    if not done and policy.try_hedge():
+        hedge_replica = balancer.acquire(exclude=primary_replica)
+        pending.add(asyncio.ensure_future(_aattempt(balancer, hedge_replica, send, policy)))
+
+    last = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if last is not None and last.exception() is None:
+                    await last.result().aclose()
+                last = task
+                if task.exception() is None and task.result().status_code < 500:
+                    if task is not primary:
+                        policy.record_hedge_win()
+                    return task.result()
+        return last.result()
+    finally:
+        # 取消未完成的请求（httpx在取消时关闭对应的连接）
+        for task in pending:
+            task.cancel()
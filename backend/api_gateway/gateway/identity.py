@@ -0,0 +1,85 @@
+"""
+网关身份解析
+网关在认证时已验证JWT，这里再解析一次租户（企业ID），通过签名的内部身份头转发给下游服务，
+下游服务无需再次解析JWT或查询用户企业关系；请求头 X-Company-Id 指定企业时按缓存的成员集合校验
+"""
+from django.http import JsonResponse
+from rest_framework import status
+
+from common.utils.internal_auth import get_internal_auth_secret, build_identity_headers
+from common.utils.jwt_utils import get_requested_company_id, get_user_company_id, is_company_member
+from .ratelimit import rate_limiter
+
+
+def is_identity_forwarding_enabled():
+    """是否启用内部身份转发（配置了 INTERNAL_AUTH_SECRET）"""
+    return get_internal_auth_secret() is not None
+
+
+def resolve_identity(request):
+    """
+    解析已认证请求的用户ID和企业ID，写入 request.user_id / request.company_id
+    （每个请求只解析一次，响应缓存、请求合并和转发共用）
+
+    Args:
+        request: 已通过认证的请求（request.auth 为 AccessToken）
+
+    Returns:
+        请求头 X-Company-Id 指定的企业不属于该用户时返回False
+    """
+    if hasattr(request, 'user_id'):
+        return not getattr(request, 'company_denied', False)
+    request.user_id = None
+    request.company_id = None
+
+    token = getattr(request, 'auth', None)
+    if token is None or not hasattr(token, 'get'):
+        return True
+    request.user_id = token.get('user_id')
+    if not request.user_id:
+        return True
+
+    requested_company_id = get_requested_company_id(request.META)
+    if requested_company_id is None:
+        request.company_id = get_user_company_id(request.user_id)
+    elif is_company_member(request.user_id, requested_company_id):
+        request.company_id = requested_company_id
+    else:
+        request.company_denied = True
+        return False
+    return True
+
+
+def requires_tenant_lookup():
+    """网关是否需要查询用户所属企业（启用了内部身份转发或配置了企业级限额），决定启动时是否连接MongoDB"""
+    return is_identity_forwarding_enabled() or rate_limiter.has_company_limits()
+
+
+def should_resolve_identity(request):
+    """
+    是否需要在网关解析身份：启用了内部身份转发，或请求的路由有企业级限额
+    （企业ID从已验证的JWT经租户解析缓存取得，不依赖内部身份转发）；
+    不解析时请求头 X-Company-Id 原样转发，由下游服务的 TenantMiddleware 校验
+    """
+    return is_identity_forwarding_enabled() or rate_limiter.requires_company(request)
+
+
+def build_company_forbidden_response():
+    """请求头 X-Company-Id 指定的企业不属于当前用户"""
+    return JsonResponse(
+        {'error': '无权访问该企业'},
+        status=status.HTTP_403_FORBIDDEN
+    )
+
+
+def get_identity_headers(request):
+    """
+    构建转发给下游服务的签名身份头
+
+    Returns:
+        请求头字典，请求未认证或未启用身份转发时返回空字典
+    """
+    user_id = getattr(request, 'user_id', None)
+    if not user_id:
+        return {}
+    return build_identity_headers(user_id, request.company_id, request.auth.get('exp'))
@@ -0,0 +1,372 @@
+"""
+网关指标
+按路由记录请求延迟、请求和响应字节数、状态码，按上游服务记录上游延迟、结果（状态码/超时/错误）、
+拒绝次数以及连接池和准入控制的饱和度；
+各工作进程先在本地累加，由后台线程定期把增量合并到Redis，/metrics 汇总所有进程的数据并以Prometheus文本格式输出
+"""
+import bisect
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+import redis
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from common.utils.redis_client import get_redis_client
+from .admission import get_admission_metrics
+from .routing import router
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'gateway:metrics'
+
+DEFAULT_METRICS_CONFIG = {
+    'ENABLED': True,
+    # 是否通过Redis合并所有工作进程的指标（关闭时 /metrics 只输出处理该请求的进程的指标）
+    'SHARED': True,
+    # 本地增量合并到Redis的间隔（秒）
+    'FLUSH_INTERVAL': 5,
+    # 访问 /metrics 需要的Bearer令牌，为空时只允许本机和内网地址访问
+    'TOKEN': '',
+    'LATENCY_BUCKETS': [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    'SIZE_BUCKETS': [256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304],
+}
+
+# 指标定义：名称 -> (类型, 直方图分桶配置项, 说明)
+METRIC_DEFINITIONS = {
+    'gateway_requests_total': ('counter', None, '网关请求数'),
+    'gateway_request_duration_seconds': ('histogram', 'LATENCY_BUCKETS', '网关请求延迟（流式响应为首字节时间）'),
+    'gateway_request_bytes': ('histogram', 'SIZE_BUCKETS', '请求体字节数'),
+    'gateway_response_bytes': ('histogram', 'SIZE_BUCKETS', '响应体字节数'),
+    'gateway_upstream_requests_total': ('counter', None, '上游请求数（按上游状态码、timeout、error）'),
+    'gateway_upstream_duration_seconds': ('histogram', 'LATENCY_BUCKETS', '上游请求延迟（含对冲）'),
+    'gateway_upstream_response_bytes': ('histogram', 'SIZE_BUCKETS', '上游响应体字节数（传输编码后）'),
+    'gateway_upstream_rejections_total': ('counter', None, '未发送到上游的请求数（circuit_open、overloaded）'),
+    'gateway_upstream_pool_in_flight': ('gauge', None, '上游连接池进行中的请求数'),
+    'gateway_upstream_pool_size': ('gauge', None, '上游连接池大小'),
+    'gateway_upstream_admission_in_flight': ('gauge', None, '已获得准入名额的上游请求数'),
+    'gateway_upstream_admission_limit': ('gauge', None, '上游并发名额'),
+    'gateway_upstream_admission_queue_depth': ('gauge', None, '等待准入名额的请求数'),
+}
+
+
+def get_metrics_config():
+    """获取网关指标配置"""
+    metrics_config = dict(DEFAULT_METRICS_CONFIG)
+    metrics_config.update(getattr(settings, 'GATEWAY_METRICS', {}))
+    return metrics_config
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _format_le(bound):
+    return '+Inf' if bound == float('inf') else _format_value(bound)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ]
+    return '{' + ','.join(escaped) + '}'
+
+
+class MetricsCollector:
+    """
+    指标收集器（每个进程一个实例）
+    计数器和直方图以增量形式在本地累加，直方图各分桶为非累计计数，输出时再累计
+    """
+
+    def __init__(self):
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+        self._pid = None
+        self._flusher = None
+        self.worker_id = None
+        self.flush_errors = 0
+
+    def _ensure_flusher(self):
+        """启动当前进程的后台合并线程（fork出的工作进程各自启动）"""
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._pid = pid
+            self._values = defaultdict(float)
+            self.worker_id = f'{socket.gethostname()}:{pid}'
+            if get_metrics_config()['SHARED']:
+                self._flusher = threading.Thread(target=self._flush_loop, name='gateway-metrics', daemon=True)
+                self._flusher.start()
+
+    def inc(self, name, labels, value=1):
+        """计数器加value"""
+        self._ensure_flusher()
+        with self._lock:
+            self._values[(name, labels, '')] += value
+
+    def observe(self, name, labels, value):
+        """直方图记录一个观测值"""
+        self._ensure_flusher()
+        buckets = get_metrics_config()[METRIC_DEFINITIONS[name][1]]
+        index = bisect.bisect_left(buckets, value)
+        le = _format_le(buckets[index]) if index < len(buckets) else '+Inf'
+        with self._lock:
+            self._values[(name, labels, le)] += 1
+            self._values[(name, labels, 'sum')] += value
+            self._values[(name, labels, 'count')] += 1
+
+    def record_request(self, route, method, status_code, duration, request_bytes, response_bytes):
+        """记录一个网关请求"""
+        labels = (('route', route),)
+        self.inc('gateway_requests_total', labels + (('method', method), ('status', status_code)))
+        self.observe('gateway_request_duration_seconds', labels, duration)
+        self.observe('gateway_request_bytes', labels, request_bytes)
+        if response_bytes is not None:
+            self.observe('gateway_response_bytes', labels, response_bytes)
+
+    def record_upstream(self, service_name, outcome, duration, response_bytes=None):
+        """
+        记录一次上游调用
+
+        Args:
+            outcome: 上游响应状态码，或 timeout / error
+            response_bytes: 上游响应的Content-Length，未知时为None
+        """
+        labels = (('upstream', service_name),)
+        self.inc('gateway_upstream_requests_total', labels + (('outcome', outcome),))
+        self.observe('gateway_upstream_duration_seconds', labels, duration)
+        if response_bytes is not None:
+            self.observe('gateway_upstream_response_bytes', labels, response_bytes)
+
+    def record_rejection(self, service_name, reason):
+        """记录未发送到上游的请求（熔断、准入拒绝）"""
+        self.inc('gateway_upstream_rejections_total', (('upstream', service_name), ('reason', reason)))
+
+    def collect_gauges(self):
+        """当前进程的连接池和准入控制状态"""
+        gauges = {}
+        for service_name, pool_metrics in router.metrics().items():
+            labels = (('upstream', service_name),)
+            gauges[('gateway_upstream_pool_in_flight', labels)] = pool_metrics['in_flight']
+            gauges[('gateway_upstream_pool_size', labels)] = pool_metrics['pool_size']
+        for service_name, admission_metrics in get_admission_metrics().items():
+            labels = (('upstream', service_name),)
+            gauges[('gateway_upstream_admission_in_flight', labels)] = admission_metrics['in_flight']
+            gauges[('gateway_upstream_admission_limit', labels)] = admission_metrics['max_in_flight']
+            gauges[('gateway_upstream_admission_queue_depth', labels)] = admission_metrics['queue_depth']
+        return gauges
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(get_metrics_config()['FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('合并网关指标失败')
+
+    def flush(self):
+        """把本地增量合并到Redis，并写入当前进程的饱和度（合并失败时增量保留到下次）"""
+        metrics_config = get_metrics_config()
+        gauge_key = f'{REDIS_KEY_PREFIX}:gauges:{self.worker_id}'
+        gauges = self.collect_gauges()
+        with self._lock:
+            values, self._values = self._values, defaultdict(float)
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            for (name, labels, suffix), value in values.items():
+                pipeline.hincrbyfloat(f'{REDIS_KEY_PREFIX}:values', json.dumps([name, labels, suffix]), value)
+            pipeline.delete(gauge_key)
+            if gauges:
+                pipeline.hset(gauge_key, mapping={
+                    json.dumps([name, labels]): value
+                    for (name, labels), value in gauges.items()
+                })
+                # 进程退出后其饱和度在过期后不再计入
+                pipeline.expire(gauge_key, metrics_config['FLUSH_INTERVAL'] * 3)
+                pipeline.sadd(f'{REDIS_KEY_PREFIX}:workers', gauge_key)
+            pipeline.execute()
+        except redis.RedisError as e:
+            self.flush_errors += 1
+            logger.warning(f'合并网关指标到Redis失败: {e}')
+            with self._lock:
+                for key, value in values.items():
+                    self._values[key] += value
+
+    def _read_shared(self):
+        """读取所有进程合并后的指标"""
+        client = get_redis_client()
+        values = defaultdict(float)
+        for field, value in client.hgetall(f'{REDIS_KEY_PREFIX}:values').items():
+            name, labels, suffix = json.loads(field)
+            values[(name, tuple(tuple(pair) for pair in labels), suffix)] = float(value)
+
+        gauges = defaultdict(float)
+        workers_key = f'{REDIS_KEY_PREFIX}:workers'
+        worker_keys = list(client.smembers(workers_key))
+        pipeline = client.pipeline(transaction=False)
+        for worker_key in worker_keys:
+            pipeline.hgetall(worker_key)
+        for worker_key, worker_gauges in zip(worker_keys, pipeline.execute()):
+            if not worker_gauges:
+                client.srem(workers_key, worker_key)
+                continue
+            for field, value in worker_gauges.items():
+                name, labels = json.loads(field)
+                gauges[(name, tuple(tuple(pair) for pair in labels))] += float(value)
+        return values, gauges
+
+    def snapshot(self):
+        """
+        获取指标快照
+
+        Returns:
+            (values, gauges)：计数器和直方图的累计值、饱和度；共享模式下为所有进程的合计
+        """
+        self._ensure_flusher()
+        if get_metrics_config()['SHARED']:
+            self.flush()
+            try:
+                return self._read_shared()
+            except redis.RedisError as e:
+                logger.warning(f'读取Redis网关指标失败，只输出当前进程的指标: {e}')
+        with self._lock:
+            values = dict(self._values)
+        return values, self.collect_gauges()
+
+    def render(self):
+        """以Prometheus文本格式输出指标"""
+        values, gauges = self.snapshot()
+        metrics_config = get_metrics_config()
+        series = defaultdict(lambda: defaultdict(dict))
+        for (name, labels, suffix), value in values.items():
+            series[name][labels][suffix] = value
+        for (name, labels), value in gauges.items():
+            series[name][labels][''] = value
+
+        lines = []
+        for name, (metric_type, buckets_key, description) in METRIC_DEFINITIONS.items():
+            if name not in series:
+                continue
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, parts in sorted(series[name].items()):
+                if metric_type != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(parts[""])}')
+                    continue
+                bounds = set(metrics_config[buckets_key])
+                bounds.update(float(le) for le in parts if le not in ('sum', 'count'))
+                cumulative = 0
+                for bound in sorted(bounds):
+                    le = _format_le(bound)
+                    cumulative += parts.get(le, 0)
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {_format_value(cumulative)}')
+                if float('inf') not in bounds:
+                    lines.append(
+                        f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {_format_value(parts.get("count", 0))}'
+                    )
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(parts.get("sum", 0))}')
+                lines.append(f'{name}_count{_format_labels(labels)} {_format_value(parts.get("count", 0))}')
+        return '\n'.join(lines) + '\n'
+
+
+gateway_metrics = MetricsCollector()
+
+
+def get_route_label(request):
+    """路由标签：匹配的URL模式（如 api/users/<path:path>），避免按实际路径产生过多的时间序列"""
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match is None:
+        return 'unmatched'
+    return resolver_match.route or resolver_match.view_name
+
+
+def _get_request_bytes(request):
+    try:
+        return int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return 0
+
+
+def _count_streaming_bytes(response, on_complete):
+    """包装流式响应体，响应发送完毕后回调实际发送的字节数"""
+    content = response.streaming_content
+    if response.is_async:
+        async def counted():
+            total = 0
+            try:
+                async for chunk in content:
+                    total += len(chunk)
+                    yield chunk
+            finally:
+                on_complete(total)
+    else:
+        def counted():
+            total = 0
+            try:
+                for chunk in content:
+                    total += len(chunk)
+                    yield chunk
+            finally:
+                on_complete(total)
+    response.streaming_content = counted()
+
+
+class MetricsMiddleware:
+    """
+    记录每个请求的路由、状态码、延迟和字节数（同时支持同步和异步模式，异步模式下不切换线程）
+    应放在中间件列表最前面，统计压缩后的响应字节数
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = time.monotonic()
+        response = self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.monotonic()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started):
+        if not get_metrics_config()['ENABLED']:
+            return
+        duration = time.monotonic() - started
+        route = get_route_label(request)
+
+        def record(response_bytes):
+            gateway_metrics.record_request(
+                route, request.method, response.status_code, duration, _get_request_bytes(request), response_bytes
+            )
+
+        if response.has_header('Content-Length'):
+            record(int(response['Content-Length']))
+        elif response.streaming:
+            _count_streaming_bytes(response, record)
+        else:
+            record(len(response.content))
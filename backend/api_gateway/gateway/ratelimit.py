@@ -0,0 +1,326 @@
+"""
+按租户限流
+令牌桶保存在Redis中（所有网关进程共享），按路由分组分别限制企业和用户的请求速率；
+每个进程一次从Redis租用一批令牌在本地消耗，大部分请求无需访问Redis
+"""
+import logging
+import math
+import re
+import threading
+import time
+from collections import namedtuple
+
+import redis
+from django.conf import settings
+
+from common.utils.redis_client import get_redis_client
+from .cache import get_request_scope
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'gateway:ratelimit'
+
+DEFAULT_RATE_LIMIT_CONFIG = {
+    'ENABLED': True,
+    # 每次从Redis租用的最大令牌数
+    'LEASE_SIZE': 10,
+    # 本地租用令牌的有效期（秒），过期未用完的令牌作废，用于限制多进程下的超发
+    'LEASE_TTL': 1,
+    # Redis不可用时是否放行请求
+    'FAIL_OPEN': True,
+    # 网关前的可信反向代理层数：0表示直接使用连接地址（REMOTE_ADDR）；
+    # N表示取 X-Forwarded-For 中由可信代理追加的右数第N个地址（更左侧的地址由客户端控制，不可信）
+    'TRUSTED_PROXY_COUNT': 0,
+    'GROUPS': [],
+}
+
+# 令牌桶：key为Redis键，capacity为桶容量（允许的突发请求数），rate为每秒补充的令牌数
+Bucket = namedtuple('Bucket', ['key', 'capacity', 'rate'])
+
+# 限流结果：remaining为剩余令牌数，reset为令牌桶补满所需秒数，retry_after为被拒绝时建议的重试间隔
+RateLimitDecision = namedtuple('RateLimitDecision', ['allowed', 'limit', 'remaining', 'reset', 'retry_after'])
+
+# 原子地补充令牌并租用最多 ARGV[3] 个令牌
+# 返回 [租到的令牌数, 租用后剩余的令牌数, 下一个令牌补充所需毫秒数]
+TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then
+    redis.replicate_commands()
+end
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) * 1000 + math.floor(tonumber(now_parts[2]) / 1000)
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1])
+local ts = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+
+local granted = math.min(requested, math.floor(tokens))
+tokens = tokens - granted
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+
+local wait_ms = 0
+if tokens < 1 then
+    wait_ms = math.ceil((1 - tokens) / rate * 1000)
+end
+return {granted, math.floor(tokens), wait_ms}
+"""
+
+
+def get_rate_limit_config():
+    """获取限流配置"""
+    rate_limit_config = dict(DEFAULT_RATE_LIMIT_CONFIG)
+    rate_limit_config.update(getattr(settings, 'GATEWAY_RATE_LIMIT', {}))
+    return rate_limit_config
+
+
+def get_client_ip(request):
+    """
+    获取客户端IP（未认证请求的限流主体）
+    只信任配置的可信代理层数追加的 X-Forwarded-For 地址，客户端自行设置的地址会被忽略
+    """
+    remote_addr = request.META.get('REMOTE_ADDR', '')
+    trusted_proxy_count = get_rate_limit_config()['TRUSTED_PROXY_COUNT']
+    if trusted_proxy_count <= 0:
+        return remote_addr
+    hops = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    if len(hops) < trusted_proxy_count:
+        # 请求未经过全部可信代理（如直接访问网关）
+        return remote_addr
+    return hops[-trusted_proxy_count]
+
+
+class _Lease:
+    """本地租用的令牌"""
+
+    __slots__ = ('tokens', 'expires_at', 'remote_remaining')
+
+    def __init__(self):
+        self.tokens = 0
+        self.expires_at = 0
+        self.remote_remaining = 0
+
+
+class RateLimiter:
+    """
+    令牌桶限流器
+    路由分组按顺序匹配，每个分组可分别配置企业级（COMPANY）和用户级（USER）限额，
+    未认证请求的用户级限额按客户端IP计算
+    """
+
+    def __init__(self):
+        self._groups = None
+        self._leases = {}
+        self._lock = threading.Lock()
+        self._script = None
+        self.allowed = 0
+        self.rejected = 0
+        self.redis_calls = 0
+        self.redis_errors = 0
+
+    def _get_groups(self):
+        """编译路由分组：[(分组名, 路径正则, 企业限额, 用户限额), ...]"""
+        if self._groups is None:
+            self._groups = [
+                (group['NAME'], re.compile(group['PATTERN']), group.get('COMPANY'), group.get('USER'))
+                for group in get_rate_limit_config()['GROUPS']
+            ]
+        return self._groups
+
+    def _match_group(self, request):
+        """请求匹配的路由分组，未启用限流或没有匹配的分组时返回None"""
+        if not get_rate_limit_config()['ENABLED']:
+            return None
+        for group in self._get_groups():
+            if group[1].match(request.path):
+                return group
+        return None
+
+    def has_company_limits(self):
+        """是否配置了企业级限额（网关需要查询用户所属企业）"""
+        return get_rate_limit_config()['ENABLED'] and any(group[2] for group in self._get_groups())
+
+    def requires_company(self, request):
+        """
+        请求匹配的分组是否有企业级限额
+        有企业级限额时网关需要先解析企业ID（resolve_identity），与是否启用内部身份转发无关
+        """
+        group = self._match_group(request)
+        return group is not None and bool(group[2])
+
+    def get_buckets(self, request):
+        """
+        获取请求需要消耗令牌的令牌桶
+
+        Returns:
+            Bucket列表，请求不受限流时返回空列表
+        """
+        group = self._match_group(request)
+        if group is None:
+            return []
+
+        name, _, company_limit, user_limit = group
+        _, user_id = get_request_scope(request)
+        # 只使用网关解析（已校验）的企业ID，不使用请求头中未校验的企业
+        company_id = getattr(request, 'company_id', None)
+        buckets = []
+        if company_limit and company_id:
+            buckets.append(Bucket(f'{REDIS_KEY_PREFIX}:{name}:company:{company_id}', *company_limit))
+        if user_limit:
+            subject = f'user:{user_id}' if user_id else f'ip:{get_client_ip(request)}'
+            buckets.append(Bucket(f'{REDIS_KEY_PREFIX}:{name}:{subject}', *user_limit))
+        return buckets
+
+    def _lease_size(self, bucket):
+        """每次租用的令牌数：不超过一个租用周期内补充的令牌数，避免低速率分组的令牌被单个进程占用"""
+        rate_limit_config = get_rate_limit_config()
+        return max(1, min(rate_limit_config['LEASE_SIZE'], int(bucket.rate * rate_limit_config['LEASE_TTL'])))
+
+    def _decision(self, bucket, allowed, remaining, retry_after=0):
+        reset = math.ceil(max(0, bucket.capacity - remaining) / bucket.rate)
+        return RateLimitDecision(allowed, bucket.capacity, remaining, reset, retry_after)
+
+    def _take_local(self, bucket, now):
+        """从本地租用的令牌中取一个，没有可用令牌时返回None（调用方需持有锁）"""
+        lease = self._leases.get(bucket.key)
+        if lease is None or lease.tokens <= 0 or lease.expires_at <= now:
+            return None
+        lease.tokens -= 1
+        return self._decision(bucket, True, lease.remote_remaining + lease.tokens)
+
+    def _take_remote(self, bucket):
+        """从Redis租用一批令牌并取一个"""
+        if self._script is None:
+            self._script = get_redis_client().register_script(TOKEN_BUCKET_SCRIPT)
+        granted, remaining, wait_ms = self._script(
+            keys=[bucket.key],
+            args=[bucket.capacity, bucket.rate, self._lease_size(bucket)]
+        )
+        with self._lock:
+            self.redis_calls += 1
+            if granted <= 0:
+                return self._decision(bucket, False, 0, max(1, math.ceil(wait_ms / 1000)))
+
+            lease = self._leases.get(bucket.key)
+            now = time.monotonic()
+            if lease is None or lease.expires_at <= now:
+                lease = self._leases[bucket.key] = _Lease()
+            # 新租用的令牌从现在起计算有效期（续租时一并延长剩余令牌的有效期）
+            lease.expires_at = now + get_rate_limit_config()['LEASE_TTL']
+            lease.tokens += granted - 1
+            lease.remote_remaining = remaining
+            self._evict_expired(now)
+            return self._decision(bucket, True, remaining + lease.tokens)
+
+    def _refund(self, buckets):
+        """
+        归还已取得的令牌（后续令牌桶拒绝时，请求未被放行，不应消耗前面令牌桶的令牌）
+        令牌归还到本地租用的令牌中，租用已过期时随租用一起作废
+        """
+        now = time.monotonic()
+        with self._lock:
+            for bucket in buckets:
+                lease = self._leases.get(bucket.key)
+                if lease is not None and lease.expires_at > now:
+                    lease.tokens += 1
+
+    def _evict_expired(self, now):
+        """清理过期的租用记录，避免不活跃的用户长期占用内存（调用方需持有锁）"""
+        if len(self._leases) > 10000:
+            for key in [key for key, lease in self._leases.items() if lease.expires_at <= now]:
+                del self._leases[key]
+
+    def _combine(self, decisions):
+        """多个令牌桶的结果合并：任一拒绝即拒绝，剩余数取最小值"""
+        rejected = [decision for decision in decisions if not decision.allowed]
+        result = rejected[0] if rejected else min(decisions, key=lambda decision: decision.remaining)
+        with self._lock:
+            if result.allowed:
+                self.allowed += 1
+            else:
+                self.rejected += 1
+        return result
+
+    def check_local(self, buckets):
+        """
+        只使用本地租用的令牌判断（不涉及网络IO，可在事件循环中直接调用）
+
+        Returns:
+            RateLimitDecision，所有令牌桶都有本地令牌时才消耗令牌，否则返回None
+        """
+        now = time.monotonic()
+        with self._lock:
+            for bucket in buckets:
+                lease = self._leases.get(bucket.key)
+                if lease is None or lease.tokens <= 0 or lease.expires_at <= now:
+                    return None
+            decisions = [self._take_local(bucket, now) for bucket in buckets]
+        return self._combine(decisions)
+
+    def check(self, buckets):
+        """
+        消耗每个令牌桶的一个令牌（本地令牌不足时访问Redis）；
+        任一令牌桶拒绝时归还已从前面令牌桶取得的令牌
+
+        Returns:
+            RateLimitDecision，不受限流时返回None
+        """
+        if not buckets:
+            return None
+
+        decisions = []
+        taken = []
+        for bucket in buckets:
+            with self._lock:
+                decision = self._take_local(bucket, time.monotonic())
+            if decision is None:
+                try:
+                    decision = self._take_remote(bucket)
+                except redis.RedisError as e:
+                    with self._lock:
+                        self.redis_errors += 1
+                    logger.warning(f'访问Redis令牌桶失败: {e}')
+                    if get_rate_limit_config()['FAIL_OPEN']:
+                        continue
+                    decision = self._decision(bucket, False, 0, 1)
+            decisions.append(decision)
+            if not decision.allowed:
+                self._refund(taken)
+                break
+            taken.append(bucket)
+
+        if not decisions:
+            return None
+        return self._combine(decisions)
+
+    def metrics(self):
+        return {
+            'allowed': self.allowed,
+            'rejected': self.rejected,
+            'redis_calls': self.redis_calls,
+            'redis_errors': self.redis_errors,
+            'leases': len(self._leases),
+        }
+
+
+def apply_rate_limit_headers(response, decision):
+    """添加标准限流响应头（RateLimit-Limit / RateLimit-Remaining / RateLimit-Reset）"""
+    if decision is None:
+        return response
+    response['RateLimit-Limit'] = str(decision.limit)
+    response['RateLimit-Remaining'] = str(decision.remaining)
+    response['RateLimit-Reset'] = str(decision.reset)
+    if not decision.allowed:
+        response['Retry-After'] = str(decision.retry_after)
+    return response
+
+
+rate_limiter = RateLimiter()
@@ -0,0 +1,207 @@
+"""
+网关路由表
+启动时一次性解析所有上游服务的地址并创建连接池，生成不可变的路由表（路径前缀 -> 服务 -> 连接池），
+请求处理时只做字典查找；支持通过信号或管理接口热重载
+"""
+import logging
+import signal
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from django.conf import settings
+
+from common.utils.service_config import get_service_urls
+from .upstream import PROXIED_SERVICES, get_pool_config, create_pool
+
+
+logger = logging.getLogger(__name__)
+
+# 路径前缀到上游服务的映射
+ROUTE_PREFIXES = {
+    '/api/users/': 'user_service',
+    '/api/companies/': 'company_service',
+    '/api/auth/': 'auth_service',
+    '/api/permissions/': 'permission_service',
+    '/api/notifications/': 'notification_service',
+    '/api/logs/': 'log_service',
+}
+
+DEFAULT_ROUTING_CONFIG = {
+    'RELOAD_SIGNAL': 'SIGHUP',
+    'ADMIN_TOKEN': '',
+    'DRAIN_SECONDS': 60,
+}
+
+Route = namedtuple('Route', ['prefix', 'service_name', 'base_urls', 'pool'])
+
+
+def get_routing_config():
+    """获取路由表配置"""
+    routing_config = dict(DEFAULT_ROUTING_CONFIG)
+    routing_config.update(getattr(settings, 'GATEWAY_ROUTING', {}))
+    return routing_config
+
+
+class RoutingTable:
+    """
+    不可变路由表
+    重载时整体替换，不修改已有的路由表，因此读取时无需加锁
+    """
+
+    def __init__(self, routes, version):
+        self.version = version
+        self.routes = MappingProxyType({route.prefix: route for route in routes})
+        self.services = MappingProxyType({route.service_name: route for route in routes})
+
+    def get(self, service_name):
+        """按服务名称查找路由，不存在时返回None"""
+        return self.services.get(service_name)
+
+    def match(self, path):
+        """按请求路径查找路由（/api/<资源>/ 前缀），不存在时返回None"""
+        parts = path.split('/', 3)
+        if len(parts) < 4 or parts[1] != 'api':
+            return None
+        return self.routes.get(f'/api/{parts[2]}/')
+
+    def pools(self):
+        return [route.pool for route in self.services.values()]
+
+    def describe(self):
+        """路由表内容（不含连接池）"""
+        return {
+            'version': self.version,
+            'routes': {
+                route.prefix: {'service': route.service_name, 'base_urls': route.base_urls}
+                for route in self.routes.values()
+            },
+        }
+
+
+def build_routing_table(version=1):
+    """
+    解析所有上游服务地址并创建连接池，生成路由表
+    （异步网关模式下创建异步连接池）
+    """
+    if settings.GATEWAY_ASYNC:
+        from .async_upstream import create_async_pool as pool_factory
+    else:
+        pool_factory = create_pool
+
+    routes = []
+    for prefix, service_name in ROUTE_PREFIXES.items():
+        base_urls = tuple(get_service_urls(service_name))
+        routes.append(Route(prefix, service_name, base_urls, pool_factory(service_name, list(base_urls))))
+    return RoutingTable(routes, version)
+
+
+class Router:
+    """
+    路由表持有者
+    首次访问时构建路由表，热重载时构建新表后原子替换，旧表的连接池在排空时间后关闭
+    """
+
+    def __init__(self):
+        self._table = None
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    @property
+    def table(self):
+        table = self._table
+        if table is None:
+            with self._lock:
+                if self._table is None:
+                    self._table = build_routing_table()
+                table = self._table
+        return table
+
+    def get_pool(self, service_name):
+        """
+        获取服务的连接池
+
+        Returns:
+            连接池实例，服务不存在时返回None
+        """
+        route = self.table.get(service_name)
+        return route.pool if route is not None else None
+
+    def reload(self):
+        """
+        重新解析服务地址并替换路由表
+
+        Returns:
+            新的路由表
+        """
+        with self._lock:
+            old_table = self._table
+            version = old_table.version + 1 if old_table is not None else 1
+            self._table = build_routing_table(version)
+            self.reloads += 1
+            table = self._table
+
+        logger.info(f'网关路由表已重载: {table.describe()}')
+        if old_table is not None:
+            # 进行中的请求仍在使用旧连接池，等待排空后再关闭
+            timer = threading.Timer(
+                get_routing_config()['DRAIN_SECONDS'],
+                self._close_pools,
+                args=(old_table.pools(),)
+            )
+            timer.daemon = True
+            timer.start()
+        if not settings.GATEWAY_ASYNC:
+            threading.Thread(target=self.prewarm, daemon=True).start()
+        return table
+
+    def _close_pools(self, pools):
+        for pool in pools:
+            try:
+                pool.close()
+            except Exception as e:
+                logger.warning(f'关闭 {pool.service_name} 旧连接池失败: {e}')
+
+    def prewarm(self, service_names=None):
+        """
+        预热所有（或指定）上游服务的连接池（同步模式）
+
+        Returns:
+            dict: 服务名称到成功预热连接数的映射
+        """
+        results = {}
+        for service_name in service_names or PROXIED_SERVICES:
+            count = get_pool_config(service_name)['PREWARM']
+            pool = self.get_pool(service_name)
+            if pool is None or count <= 0:
+                continue
+            results[service_name] = pool.prewarm(count)
+        logger.info(f'上游连接池预热完成: {results}')
+        return results
+
+    def install_signal_handler(self):
+        """
+        注册热重载信号（默认SIGHUP）
+        信号处理函数只启动后台线程执行重载，避免在信号上下文中创建连接池
+        """
+        signal_name = get_routing_config()['RELOAD_SIGNAL']
+        if not signal_name:
+            return
+        try:
+            signal.signal(
+                getattr(signal, signal_name),
+                lambda signum, frame: threading.Thread(target=self.reload, daemon=True).start()
+            )
+        except (AttributeError, ValueError) as e:
+            # 非主线程或平台不支持该信号时只能通过管理接口重载
+            logger.warning(f'注册路由表重载信号 {signal_name} 失败: {e}')
+
+    def metrics(self):
+        """所有连接池的指标"""
+        return {
+            service_name: route.pool.metrics()
+            for service_name, route in self.table.services.items()
+        }
+
+
+router = Router()
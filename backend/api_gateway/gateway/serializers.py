@@ -0,0 +1,33 @@
+"""
+网关序列化器
+"""
+from django.conf import settings
+from rest_framework import serializers
+
+
+class BatchItemSerializer(serializers.Serializer):
+    """批量请求中的单个子请求"""
+    id = serializers.CharField(max_length=100, required=False, help_text="子请求标识，原样返回在结果中")
+    method = serializers.ChoiceField(choices=['GET', 'POST', 'PUT', 'PATCH', 'DELETE'], default='GET')
+    path = serializers.CharField(max_length=2000, required=True, help_text="网关路径，可包含查询参数，如 /api/users/?page=1")
+    body = serializers.JSONField(required=False, allow_null=True)
+
+    def validate_path(self, value):
+        """只允许代理路由，不允许嵌套批量请求"""
+        if not value.startswith('/api/'):
+            raise serializers.ValidationError("路径必须以 /api/ 开头")
+        if value.startswith('/api/batch/'):
+            raise serializers.ValidationError("不支持嵌套批量请求")
+        return value
+
+
+class BatchRequestSerializer(serializers.Serializer):
+    """批量请求序列化器"""
+    requests = BatchItemSerializer(many=True, allow_empty=False)
+
+    def validate_requests(self, value):
+        """限制子请求数量"""
+        max_requests = settings.GATEWAY_BATCH['MAX_REQUESTS']
+        if len(value) > max_requests:
+            raise serializers.ValidationError(f"子请求数量不能超过 {max_requests}")
+        return value
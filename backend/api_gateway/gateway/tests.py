@@ -0,0 +1,491 @@
+"""
+网关测试
+python api_gateway/manage.py test gateway
+"""
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from common.utils.internal_auth import SIGNATURE_HEADER, verify_identity_headers
+from common.utils.load_balancer import create_load_balancer
+
+from .admission import AdmissionLimiter, AsyncAdmissionLimiter
+from .async_views import user_service_proxy
+from .cache import CacheKey, CachedResponse, ResponseCache, get_request_scope
+from .circuit_breaker import PERMIT_PROBE, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, CircuitBreaker
+from .conditional import etag_matches, evaluate_conditional
+from .hedging import HedgePolicy, HedgingRegistry, send_upstream
+from .identity import get_identity_headers, resolve_identity, should_resolve_identity
+from .ratelimit import Bucket, RateLimiter
+from .views import build_upstream_request, forward_request, proxy_request
+
+
+@override_settings(GATEWAY_RATE_LIMIT={'ENABLED': False})
+class CompanyHeaderForwardingDisabledTests(SimpleTestCase):
+    """未启用内部身份转发时，X-Company-Id 由下游服务校验"""
+
+    def setUp(self):
+        self.request = RequestFactory().get(
+            '/api/users/',
+            HTTP_AUTHORIZATION='Bearer token',
+            HTTP_X_COMPANY_ID='company-b',
+        )
+        self.request.auth = {'user_id': 'user-1', 'exp': 0}
+        patcher = mock.patch('gateway.identity.is_identity_forwarding_enabled', return_value=False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_gateway_does_not_validate_membership(self):
+        with mock.patch('gateway.identity.is_company_member') as is_company_member:
+            self.assertFalse(should_resolve_identity(self.request))
+        is_company_member.assert_not_called()
+
+    def test_header_forwarded_to_upstream(self):
+        upstream_request = build_upstream_request(self.request, 'http://user-service', 'users/')
+        self.assertEqual(upstream_request['headers']['X-Company-Id'], 'company-b')
+        self.assertNotIn('X-Internal-Company-Id', upstream_request['headers'])
+
+    def test_cache_scope_isolated_by_requested_company(self):
+        self.assertEqual(get_request_scope(self.request), ('company-b', 'user-1'))
+
+
+@override_settings(GATEWAY_RATE_LIMIT={'ENABLED': False})
+class CompanyMembershipTests(SimpleTestCase):
+    """启用内部身份转发时，网关按成员集合校验 X-Company-Id 指定的企业"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        for patcher in (
+            mock.patch('gateway.identity.is_identity_forwarding_enabled', return_value=True),
+            mock.patch('gateway.identity.get_user_company_id', return_value='company-a'),
+            mock.patch('gateway.identity.is_company_member', side_effect=lambda user_id, company_id: company_id == 'company-b'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def build_request(self, **extra):
+        request = self.factory.get('/api/users/', HTTP_AUTHORIZATION='Bearer token', **extra)
+        request.auth = {'user_id': 'user-1', 'exp': 0}
+        return request
+
+    def test_default_company_without_header(self):
+        request = self.build_request()
+        self.assertTrue(resolve_identity(request))
+        self.assertEqual(request.company_id, 'company-a')
+
+    def test_member_company_selected(self):
+        request = self.build_request(HTTP_X_COMPANY_ID='company-b')
+        self.assertTrue(resolve_identity(request))
+        self.assertEqual(request.company_id, 'company-b')
+
+    def test_non_member_forbidden_before_upstream(self):
+        request = self.build_request(HTTP_X_COMPANY_ID='company-c')
+        with (
+            mock.patch('gateway.views.router'),
+            mock.patch('gateway.views.proxy_request') as proxy,
+        ):
+            response = forward_request(request, 'user_service', 'users/')
+        self.assertEqual(response.status_code, 403)
+        proxy.assert_not_called()
+        # 已解析过的请求再次解析时保持拒绝
+        self.assertFalse(resolve_identity(request))
+
+
+@override_settings(GATEWAY_RATE_LIMIT={
+    'ENABLED': True,
+    'GROUPS': [{'NAME': 'default', 'PATTERN': r'^/api/', 'COMPANY': (500, 100), 'USER': (100, 20)}],
+})
+class CompanyRateLimitTests(SimpleTestCase):
+    """企业级限额不依赖内部身份转发，企业ID来自已验证的JWT和租户解析缓存"""
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/users/', HTTP_AUTHORIZATION='Bearer token')
+        self.request.auth = {'user_id': 'user-1', 'exp': 0}
+        self.limiter = RateLimiter()
+        for patcher in (
+            mock.patch('gateway.identity.is_identity_forwarding_enabled', return_value=False),
+            mock.patch('gateway.identity.rate_limiter', self.limiter),
+            mock.patch('gateway.identity.get_user_company_id', return_value='company-a'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_company_bucket_applies_without_identity_forwarding(self):
+        self.assertTrue(should_resolve_identity(self.request))
+        self.assertTrue(resolve_identity(self.request))
+        keys = [bucket.key for bucket in self.limiter.get_buckets(self.request)]
+        self.assertIn('gateway:ratelimit:default:company:company-a', keys)
+        self.assertIn('gateway:ratelimit:default:user:user-1', keys)
+
+
+@override_settings(GATEWAY_RATE_LIMIT={'ENABLED': True, 'LEASE_SIZE': 10, 'LEASE_TTL': 60})
+class RateLimiterLeaseTests(SimpleTestCase):
+    """令牌从Redis批量租用后在本地消耗，被拒绝的请求归还已取得的令牌"""
+
+    def setUp(self):
+        self.limiter = RateLimiter()
+        self.company = Bucket('company', 100, 50)
+        self.user = Bucket('user', 10, 5)
+        # 令牌桶脚本的返回值：[租到的令牌数, 剩余令牌数, 下一个令牌补充所需毫秒数]
+        self.granted = {'company': [10, 90, 0], 'user': [5, 5, 0]}
+        client = mock.Mock()
+        client.register_script.return_value = lambda keys, args: self.granted[keys[0]]
+        patcher = mock.patch('gateway.ratelimit.get_redis_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_leased_tokens_consumed_locally(self):
+        self.assertTrue(self.limiter.check([self.company, self.user]).allowed)
+        self.assertEqual(self.limiter.redis_calls, 2)
+
+        decision = self.limiter.check_local([self.company, self.user])
+        self.assertTrue(decision.allowed)
+        self.assertEqual(decision.remaining, 8)
+        self.assertEqual(self.limiter.redis_calls, 2)
+        self.assertEqual(self.limiter._leases['company'].tokens, 8)
+
+    def test_rejected_request_refunds_earlier_buckets(self):
+        self.granted['user'] = [0, 0, 1500]
+        decision = self.limiter.check([self.company, self.user])
+        self.assertFalse(decision.allowed)
+        self.assertEqual(decision.retry_after, 2)
+        # 企业令牌桶取得的令牌归还到本地租用中
+        self.assertEqual(self.limiter._leases['company'].tokens, 10)
+        self.assertEqual(self.limiter.rejected, 1)
+
+    def test_lease_expiry_refreshed_on_grant(self):
+        self.granted['user'] = [1, 9, 0]
+        with mock.patch('gateway.ratelimit.time.monotonic', return_value=100):
+            self.limiter.check([self.user])
+        self.assertEqual(self.limiter._leases['user'].expires_at, 160)
+        with mock.patch('gateway.ratelimit.time.monotonic', return_value=130):
+            self.limiter.check([self.user])
+        self.assertEqual(self.limiter._leases['user'].expires_at, 190)
+
+
+class AdmissionLimiterTests(SimpleTestCase):
+    """上游并发名额已满时排队，释放的名额交给等待的请求，队列已满时立即拒绝"""
+
+    def test_released_slot_handed_to_waiting_thread(self):
+        limiter = AdmissionLimiter('user_service')
+        limiter.max_in_flight = 1
+        self.assertTrue(limiter.acquire())
+
+        results = []
+        waiter = threading.Thread(target=lambda: results.append(limiter.acquire()))
+        waiter.start()
+        while limiter.queue_depth == 0:
+            time.sleep(0.001)
+        limiter.release()
+        waiter.join(1)
+
+        self.assertEqual(results, [True])
+        self.assertEqual((limiter.in_flight, limiter.queued, limiter.admitted), (1, 1, 2))
+
+    def test_rejected_when_queue_full(self):
+        limiter = AdmissionLimiter('user_service')
+        limiter.max_in_flight = 1
+        limiter.max_queue = 0
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire())
+        self.assertEqual(limiter.rejected_queue_full, 1)
+
+    def test_async_slots_handed_over_in_arrival_order(self):
+        async def scenario():
+            limiter = AsyncAdmissionLimiter('user_service')
+            limiter.max_in_flight = 1
+            self.assertTrue(await limiter.acquire())
+
+            admitted = []
+
+            async def wait(name):
+                await limiter.acquire()
+                admitted.append(name)
+
+            waiters = [asyncio.ensure_future(wait(name)) for name in ('first', 'second')]
+            await asyncio.sleep(0)
+            self.assertEqual(limiter.queue_depth, 2)
+
+            limiter.release()
+            await asyncio.wait_for(waiters[0], 1)
+            self.assertEqual(admitted, ['first'])
+            self.assertFalse(waiters[1].done())
+            limiter.release()
+            await asyncio.gather(*waiters)
+            self.assertEqual(admitted, ['first', 'second'])
+            # 名额直接转交，并发数保持不变
+            self.assertEqual(limiter.in_flight, 1)
+
+        asyncio.run(scenario())
+
+
+class AsyncAdmissionTimeoutRaceTests(SimpleTestCase):
+    """排队等待超时与 release() 转交名额同时发生时，名额不会泄漏"""
+
+    def test_slot_handed_over_at_timeout_is_kept(self):
+        async def scenario():
+            limiter = AsyncAdmissionLimiter('user_service')
+            limiter.max_in_flight = 1
+            self.assertTrue(await limiter.acquire())
+
+            async def wait_for_racing_release(future, timeout):
+                # 超时的同时，持有名额的请求把名额转交给了等待者
+                limiter.release()
+                raise asyncio.TimeoutError()
+
+            with mock.patch('gateway.admission.asyncio.wait_for', wait_for_racing_release):
+                self.assertTrue(await limiter.acquire())
+            self.assertEqual(limiter.rejected_timeout, 0)
+
+            limiter.release()
+            self.assertEqual(limiter.in_flight, 0)
+            self.assertTrue(await limiter.acquire())
+
+        asyncio.run(scenario())
+
+
+class AsyncProxyMethodTests(SimpleTestCase):
+    """异步代理视图与 @api_view 一致地处理HEAD和OPTIONS"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.forward_request = mock.AsyncMock(
+            return_value=HttpResponse(b'{"id": 1}', content_type='application/json')
+        )
+        for patcher in (
+            mock.patch('gateway.async_views.authenticate', return_value=(mock.Mock(), {'user_id': 'user-1'})),
+            mock.patch('gateway.async_views.forward_request', self.forward_request),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_head_dispatched_like_get_without_body(self):
+        response = asyncio.run(user_service_proxy(self.factory.head('/api/users/1/'), path='1/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], '9')
+        self.forward_request.assert_awaited_once()
+        self.assertEqual(self.forward_request.await_args.args[0].method, 'HEAD')
+
+    def test_options_returns_view_metadata(self):
+        response = asyncio.run(user_service_proxy(self.factory.options('/api/users/'), path=''))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'User Service Proxy')
+        self.assertEqual(response['Allow'], 'GET, POST, PUT, PATCH, DELETE, OPTIONS')
+        self.forward_request.assert_not_called()
+
+
+@override_settings(GATEWAY_HEDGING={'DEFAULT_DELAY': 0.01, 'MIN_DELAY': 0})
+class SyncHedgingTests(SimpleTestCase):
+    """同步模式对冲：首次请求在调用线程中执行，单副本服务不对冲"""
+
+    def setUp(self):
+        self.policy = HedgePolicy('user_service')
+
+    def test_single_replica_sends_once_on_calling_thread(self):
+        balancer = create_load_balancer(['http://user-service'])
+        send = mock.Mock(return_value=mock.Mock(status_code=200))
+        with mock.patch.object(HedgingRegistry, 'executor', new_callable=mock.PropertyMock) as executor:
+            send_upstream(balancer, send, self.policy)
+        executor.assert_not_called()
+        send.assert_called_once_with(balancer.replicas[0])
+        self.assertEqual(self.policy.hedged, 0)
+
+    def test_hedge_replaces_failed_primary(self):
+        balancer = create_load_balancer(['http://replica-a', 'http://replica-b'])
+        primary_response = mock.Mock(status_code=503)
+        hedge_response = mock.Mock(status_code=200)
+        hedge_sent = threading.Event()
+
+        def send(replica):
+            if replica.url == balancer.replicas[0].url:
+                # 首次请求在对冲请求发出后才失败返回
+                hedge_sent.wait(1)
+                return primary_response
+            hedge_sent.set()
+            return hedge_response
+
+        self.assertIs(send_upstream(balancer, send, self.policy), hedge_response)
+        primary_response.close.assert_called_once()
+        self.assertEqual((self.policy.hedged, self.policy.hedge_wins), (1, 1))
+
+
+@override_settings(GATEWAY_UPSTREAM_MSGPACK=True)
+class UpstreamAcceptTests(SimpleTestCase):
+    """只有写入响应缓存的响应向上游请求msgpack，其他响应沿用客户端的 Accept"""
+
+    def setUp(self):
+        self.request = RequestFactory().get('/api/users/', HTTP_ACCEPT='application/json')
+        self.request.auth = None
+
+    def test_client_accept_passed_through(self):
+        upstream_request = build_upstream_request(self.request, 'http://user-service', 'users/')
+        self.assertEqual(upstream_request['headers']['Accept'], 'application/json')
+
+    def test_msgpack_requested_for_cached_response(self):
+        upstream_request = build_upstream_request(self.request, 'http://user-service', 'users/', msgpack=True)
+        self.assertEqual(upstream_request['headers']['Accept'], 'application/msgpack')
+
+
+class ResponseCacheGenerationTests(SimpleTestCase):
+    """请求上游期间资源前缀被写操作失效时，取得的响应不写入缓存"""
+
+    def setUp(self):
+        self.cache = ResponseCache()
+        self.cache_key = CacheKey('key', '/api/companies/', 60)
+        self.cached = CachedResponse(200, 'application/json', b'{}', '"etag"')
+
+    @override_settings(GATEWAY_RESPONSE_CACHE={'L2_ENABLED': False})
+    def test_stale_local_write_skipped(self):
+        cached, generation = self.cache.get(self.cache_key)
+        self.assertIsNone(cached)
+        self.cache.invalidate('/api/companies/1/')
+        self.cache.set(self.cache_key._replace(generation=generation), self.cached)
+        self.assertEqual(self.cache.get(self.cache_key)[0], None)
+        self.assertEqual(self.cache.stale_writes_skipped, 1)
+
+    @override_settings(GATEWAY_RESPONSE_CACHE={'L2_ENABLED': False})
+    def test_write_without_invalidation_stored(self):
+        _, generation = self.cache.get(self.cache_key)
+        self.cache.set(self.cache_key._replace(generation=generation), self.cached)
+        self.assertEqual(self.cache.get(self.cache_key)[0], self.cached)
+
+    def test_redis_write_compares_generation_read_before_fetch(self):
+        client = mock.Mock()
+        client.pipeline.return_value.execute.return_value = [None, b'3']
+        script = client.register_script.return_value
+        script.return_value = 0
+        with mock.patch('gateway.cache.get_redis_client', return_value=client):
+            _, generation = self.cache.get(self.cache_key)
+            self.cache.set(self.cache_key._replace(generation=generation), self.cached)
+        self.assertEqual(script.call_args.kwargs['args'][0], '3')
+        self.assertEqual(self.cache.stale_writes_skipped, 1)
+        self.assertEqual(self.cache.stores, 0)
+        self.assertIsNone(self.cache.get_local(self.cache_key))
+
+
+@override_settings(GATEWAY_CIRCUIT_BREAKER={'MIN_REQUESTS': 2, 'OPEN_SECONDS': 10, 'HALF_OPEN_MAX_PROBES': 2})
+class CircuitBreakerTests(SimpleTestCase):
+    """错误率超过阈值时熔断，熔断时间过后半开放行探测请求，探测结果决定恢复或再次熔断"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('gateway.circuit_breaker.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker('user_service')
+        for _ in range(2):
+            self.breaker.record(self.breaker.allow_request(), True, 0.1)
+
+    def test_open_rejects_until_open_seconds_elapse(self):
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.assertIsNone(self.breaker.allow_request())
+        self.now += 4
+        self.assertEqual(self.breaker.retry_after(), 6)
+        self.assertEqual(self.breaker.rejected, 1)
+
+    def test_half_open_limits_probes_and_closes_after_successes(self):
+        self.now += 10
+        probes = [self.breaker.allow_request() for _ in range(2)]
+        self.assertEqual(probes, [PERMIT_PROBE, PERMIT_PROBE])
+        self.assertEqual(self.breaker.state, STATE_HALF_OPEN)
+        self.assertIsNone(self.breaker.allow_request())
+
+        for permit in probes:
+            self.breaker.record(permit, False, 0.1)
+        self.assertEqual(self.breaker.state, STATE_CLOSED)
+        self.assertEqual(self.breaker.window.totals(), (0, 0, 0))
+
+    def test_failed_probe_reopens(self):
+        self.now += 10
+        self.breaker.record(self.breaker.allow_request(), True, 0.1)
+        self.assertEqual(self.breaker.state, STATE_OPEN)
+        self.assertEqual(self.breaker.trips, 2)
+        self.assertIsNone(self.breaker.allow_request())
+
+
+class ConditionalGetTests(SimpleTestCase):
+    """If-None-Match 与响应或缓存的ETag匹配时返回304"""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_weak_comparison(self):
+        request = self.factory.get('/api/users/', HTTP_IF_NONE_MATCH='W/"abc", "def"')
+        self.assertTrue(etag_matches(request, '"abc"'))
+        self.assertTrue(etag_matches(request, 'W/"def"'))
+        self.assertFalse(etag_matches(request, '"xyz"'))
+        self.assertFalse(etag_matches(self.factory.post('/api/users/', HTTP_IF_NONE_MATCH='*'), '"abc"'))
+
+    def test_buffered_response_replaced_with_304(self):
+        request = self.factory.get('/api/users/', HTTP_IF_NONE_MATCH='"abc"')
+        response = HttpResponse(b'{}', content_type='application/json')
+        response['ETag'] = '"abc"'
+        response['X-Coalesced'] = 'true'
+        not_modified = evaluate_conditional(request, response)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual((not_modified['ETag'], not_modified['X-Coalesced']), ('"abc"', 'true'))
+
+    def test_cached_etag_answered_without_upstream(self):
+        request = self.factory.get('/api/users/', HTTP_IF_NONE_MATCH='"abc"')
+        response_cache = mock.Mock()
+        response_cache.build_key.return_value = CacheKey('key', '/api/users/', 60)
+        response_cache.get.return_value = (CachedResponse(200, 'application/json', b'{}', '"abc"'), None)
+        with (
+            mock.patch('gateway.views.response_cache', response_cache),
+            mock.patch('gateway.views.fetch_upstream') as fetch_upstream,
+        ):
+            response = proxy_request(request, mock.Mock(), 'user_service', 'users/')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['X-Cache'], 'HIT')
+        fetch_upstream.assert_not_called()
+
+
+class SignedIdentityHeaderTests(SimpleTestCase):
+    """网关签名的内部身份头可被下游服务校验，篡改或过期的身份头不被信任"""
+
+    def setUp(self):
+        patcher = mock.patch('common.utils.internal_auth._secret', b'test-secret')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.request = RequestFactory().get('/api/users/', HTTP_AUTHORIZATION='Bearer token')
+        self.request.auth = {'user_id': 'user-1', 'exp': time.time() + 30}
+        self.request.user_id = 'user-1'
+        self.request.company_id = 'company-a'
+
+    def to_meta(self, headers):
+        return {'HTTP_' + name.upper().replace('-', '_'): value for name, value in headers.items()}
+
+    def test_signed_headers_verified(self):
+        headers = build_upstream_request(self.request, 'http://user-service', 'users/')['headers']
+        self.assertEqual(verify_identity_headers(self.to_meta(headers)), ('user-1', 'company-a'))
+
+    def test_expiry_capped_by_token(self):
+        headers = get_identity_headers(self.request)
+        self.assertLessEqual(int(headers['X-Internal-Expires']), self.request.auth['exp'])
+
+    def test_tampered_headers_rejected(self):
+        meta = self.to_meta(get_identity_headers(self.request))
+        meta['HTTP_X_INTERNAL_COMPANY_ID'] = 'company-b'
+        self.assertIsNone(verify_identity_headers(meta))
+
+    def test_expired_headers_rejected(self):
+        headers = get_identity_headers(self.request)
+        with mock.patch('common.utils.internal_auth.time.time', return_value=self.request.auth['exp'] + 1):
+            self.assertIsNone(verify_identity_headers(self.to_meta(headers)))
+
+    def test_client_identity_headers_not_forwarded(self):
+        request = RequestFactory().get(
+            '/api/users/',
+            HTTP_X_INTERNAL_USER_ID='admin',
+            HTTP_X_INTERNAL_SIGNATURE='forged',
+        )
+        request.auth = None
+        headers = build_upstream_request(request, 'http://user-service', 'users/')['headers']
+        self.assertNotIn('X-Internal-User-Id', headers)
+        self.assertNotIn(SIGNATURE_HEADER, headers)
@@ -0,0 +1,203 @@
+"""
+上游服务连接池管理
+为每个上游服务维护独立的 keep-alive 连接池，避免每次转发都新建TCP连接
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from common.utils.load_balancer import create_load_balancer
+
+
+logger = logging.getLogger(__name__)
+
+# 网关代理的上游服务
+PROXIED_SERVICES = [
+    'user_service',
+    'company_service',
+    'auth_service',
+    'permission_service',
+    'notification_service',
+    'log_service',
+]
+
+DEFAULT_POOL_CONFIG = {
+    'POOL_SIZE': 20,
+    'POOL_BLOCK': False,
+    'PREWARM': 2,
+    # 预热时发送HEAD请求的路径（任何状态码都可以，只需建立keep-alive连接）
+    'PREWARM_PATH': '/api/',
+    'TIMEOUT': 30,
+    'ASYNC_POOL_SIZE': 1000,
+    'SERVICE_OVERRIDES': {},
+}
+
+
+DEFAULT_BALANCER_CONFIG = {
+    'STRATEGY': 'round_robin',
+    'EJECTION': {},
+    'SERVICE_OVERRIDES': {},
+}
+
+
+def get_balancer_config(service_name=None):
+    """获取副本负载均衡配置（合并默认值、全局配置和服务级覆盖配置）"""
+    balancer_config = dict(DEFAULT_BALANCER_CONFIG)
+    balancer_config.update(getattr(settings, 'GATEWAY_LOAD_BALANCER', {}))
+    if service_name:
+        balancer_config.update(balancer_config.get('SERVICE_OVERRIDES', {}).get(service_name, {}))
+    return balancer_config
+
+
+def build_load_balancer(service_name, urls):
+    """按配置创建服务副本的负载均衡器"""
+    balancer_config = get_balancer_config(service_name)
+    return create_load_balancer(urls, balancer_config['STRATEGY'], balancer_config['EJECTION'])
+
+
+def get_pool_config(service_name=None):
+    """
+    获取连接池配置（合并默认值、全局配置和服务级覆盖配置）
+
+    Args:
+        service_name: 服务名称，为None时返回全局配置
+    """
+    pool_config = dict(DEFAULT_POOL_CONFIG)
+    pool_config.update(getattr(settings, 'GATEWAY_UPSTREAM_POOL', {}))
+    if service_name:
+        pool_config.update(pool_config.get('SERVICE_OVERRIDES', {}).get(service_name, {}))
+    return pool_config
+
+
+class UpstreamPool:
+    """
+    单个上游服务的连接池
+    基于 requests.Session + HTTPAdapter，连接在请求之间保持复用；
+    服务有多个副本时每个副本各有一个连接池，由负载均衡器选择副本
+    """
+
+    def __init__(self, service_name, base_urls, pool_size=20, pool_block=False, timeout=30):
+        self.service_name = service_name
+        self.base_urls = base_urls
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.balancer = build_load_balancer(service_name, base_urls)
+
+        self.adapter = HTTPAdapter(
+            pool_connections=len(base_urls),
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._lock = threading.Lock()
+        self.requests_total = 0
+        self.errors_total = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.prewarmed = 0
+
+    def request(self, method, url, body=None, **kwargs):
+        """
+        通过连接池发送请求
+
+        Args:
+            body: 原始请求体（bytes 或可迭代的请求体流）
+        """
+        with self._lock:
+            self.requests_total += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            kwargs.setdefault('timeout', self.timeout)
+            return self.session.request(method=method, url=url, data=body, **kwargs)
+        except requests.exceptions.RequestException:
+            with self._lock:
+                self.errors_total += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _connection_pool(self, base_url):
+        """获取副本的底层 urllib3 连接池"""
+        return self.adapter.poolmanager.connection_from_url(base_url)
+
+    def prewarm(self, count):
+        """
+        预热连接池：经 session 向每个副本发送 count 个HEAD请求，建立的keep-alive连接留在池中供转发复用
+        （只使用 requests 的公开接口，不依赖 urllib3 连接池的内部方法）
+
+        Returns:
+            成功建立的连接数
+        """
+        count = min(count, self.pool_size)
+        path = get_pool_config(self.service_name)['PREWARM_PATH']
+        warmed = 0
+        for base_url in self.base_urls:
+            responses = []
+            try:
+                # 先不读取响应（stream=True），每个请求各占用一个连接，迫使连接池建立 count 个连接
+                for _ in range(count):
+                    responses.append(self.session.head(
+                        f'{base_url}{path}',
+                        stream=True,
+                        allow_redirects=False,
+                        timeout=self.timeout,
+                    ))
+            except requests.exceptions.RequestException as e:
+                logger.warning(f'预热 {self.service_name} 连接池失败（{base_url}）: {e}')
+            finally:
+                # 读完响应后连接归还连接池（close() 会关闭未读完的连接）
+                for response in responses:
+                    response.content
+            warmed += len(responses)
+
+        with self._lock:
+            self.prewarmed += warmed
+        return warmed
+
+    def metrics(self):
+        """连接池指标"""
+        pools = [self._connection_pool(base_url) for base_url in self.base_urls]
+        return {
+            'base_urls': self.base_urls,
+            'pool_size': self.pool_size,
+            'idle_connections': sum(pool.pool.qsize() for pool in pools if pool.pool is not None),
+            'connections_created': sum(pool.num_connections for pool in pools),
+            'upstream_requests': sum(pool.num_requests for pool in pools),
+            'requests_total': self.requests_total,
+            'errors_total': self.errors_total,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'prewarmed': self.prewarmed,
+            'load_balancer': self.balancer.metrics(),
+        }
+
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+
+
+def create_pool(service_name, base_urls):
+    """
+    按配置创建服务的连接池
+
+    Args:
+        service_name: 服务名称
+        base_urls: 服务副本地址列表
+    """
+    pool_config = get_pool_config(service_name)
+    return UpstreamPool(
+        service_name,
+        base_urls,
+        pool_size=pool_config['POOL_SIZE'],
+        pool_block=pool_config['POOL_BLOCK'],
+        timeout=pool_config['TIMEOUT'],
+    )
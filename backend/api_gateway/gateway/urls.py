@@ -1,19 +1,37 @@
 """
 API网关路由配置
 """
+from django.conf import settings
 from django.urls import path
-from .views import (
-    health_check,
-    user_service_proxy,
-    company_service_proxy,
-    auth_service_proxy,
-    permission_service_proxy,
-    notification_service_proxy,
-    log_service_proxy,
-)
+from .views import health_check, metrics_endpoint, routing_admin
+
+# 异步网关模式下使用异步代理视图，路由表保持不变
+if settings.GATEWAY_ASYNC:
+    from .async_views import (
+        batch_proxy,
+        user_service_proxy,
+        company_service_proxy,
+        auth_service_proxy,
+        permission_service_proxy,
+        notification_service_proxy,
+        log_service_proxy,
+    )
+else:
+    from .views import (
+        batch_proxy,
+        user_service_proxy,
+        company_service_proxy,
+        auth_service_proxy,
+        permission_service_proxy,
+        notification_service_proxy,
+        log_service_proxy,
+    )
 
 urlpatterns = [
     path('health/', health_check, name='health_check'),
+    path('metrics', metrics_endpoint, name='metrics'),
+    path('admin/routes/', routing_admin, name='routing_admin'),
+    path('api/batch/', batch_proxy, name='batch_proxy'),
     path('api/users/', user_service_proxy, name='user_service_proxy'),
     path('api/users/<path:path>', user_service_proxy, name='user_service_proxy_detail'),
     path('api/companies/', company_service_proxy, name='company_service_proxy'),
@@ -2,9 +2,16 @@
 API网关视图
 统一路由分发和请求转发
 """
+import hmac
+import ipaddress
+import logging
+import time
+
 import requests
+import urllib3
 from django.conf import settings
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import patch_vary_headers
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
@@ -12,29 +19,135 @@ from rest_framework import status
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
 
+from common.middleware.compression_middleware import get_supported_encodings, get_accepted_encodings
+from common.utils.jwt_utils import COMPANY_ID_HEADER
+from common.utils.msgpack_utils import MSGPACK_ACCEPT, is_msgpack_content_type, unpackb, msgpack_to_json
+from common.utils.tracing import SERVER_TIMING_HEADER, get_trace_headers, span
 
-from common.utils.service_config import get_service_url
+from .routing import router, get_routing_config
+from .identity import should_resolve_identity, resolve_identity, get_identity_headers, build_company_forbidden_response
+from .ratelimit import rate_limiter, apply_rate_limit_headers
+from .admission import admission_registry, get_admission_metrics
+from .hedging import hedging_registry, send_upstream
+from .metrics import gateway_metrics, get_metrics_config
+from .cache import response_cache, CachedResponse
+from .conditional import compute_etag, etag_matches, build_not_modified_response, evaluate_conditional
+from .coalescing import (
+    build_coalescing_key, snapshot_response, build_snapshot_response, single_flight, get_coalescing_metrics,
+)
+from .circuit_breaker import breaker_registry
+from .serializers import BatchRequestSerializer
+from .batch import run_batch
 
 
-def forward_request(request, service_name, path=''):
+logger = logging.getLogger(__name__)
+
+# 会修改资源的请求方法，转发后使对应资源前缀的缓存失效
+WRITE_METHODS = ['POST', 'PUT', 'PATCH', 'DELETE']
+
+# 透传时复制到客户端响应的内容相关响应头
+PASSTHROUGH_HEADERS = ['Content-Type', 'Content-Disposition', 'Content-Language', 'ETag']
+
+
+class RequestBodyStream:
     """
-    转发请求到指定服务
+    客户端请求体流
+    按原始Content-Length分块读取请求体并转发给上游，大请求体无需整体载入内存
+    """
+    
+    def __init__(self, request, content_length, chunk_size):
+        self.request = request
+        self.content_length = content_length
+        self.chunk_size = chunk_size
+    
+    def __len__(self):
+        return self.content_length
+    
+    def read(self, size=-1):
+        return self.request.read(size)
+    
+    def __iter__(self):
+        while True:
+            chunk = self.request.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def get_request_body(request):
+    """
+    获取原始请求体（不解析、不重新编码）
+    
+    Returns:
+        (body, content_length): 请求体尚未读取且超过流式阈值时返回 RequestBodyStream，否则返回bytes
+    """
+    # DRF Request 包装了原始 HttpRequest，流式读取需要使用原始请求对象
+    http_request = getattr(request, '_request', request)
+    try:
+        content_length = int(http_request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    
+    body_consumed = hasattr(http_request, '_body') or getattr(http_request, '_read_started', False)
+    if not body_consumed and content_length > settings.GATEWAY_STREAM_REQUEST_THRESHOLD:
+        body_stream = RequestBodyStream(http_request, content_length, settings.GATEWAY_STREAM_CHUNK_SIZE)
+        return body_stream, content_length
+    
+    body = http_request.body
+    return body, len(body)
+
+
+def get_upstream_accept_encoding(request, stream):
+    """
+    转发给上游的 Accept-Encoding
+    流式透传时只请求客户端也接受的压缩算法，上游压缩的响应体可原样转发而无需解压再压缩；
+    缓冲读取的响应由网关解压，可请求网关支持的所有算法
+    """
+    if not settings.GATEWAY_UPSTREAM_COMPRESSION:
+        return 'identity'
+    encodings = get_supported_encodings()
+    if stream:
+        encodings = get_accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''), encodings)
+    return ', '.join(encodings) or 'identity'
+
+
+def get_upstream_accept(request, msgpack):
+    """
+    转发给上游的 Accept
+    写入响应缓存的响应使用msgpack传输，由网关转换为JSON后缓存（只在写入缓存时转换一次）；
+    其他响应沿用客户端的 Accept，上游返回的JSON原样转发，不在网关解析和重新编码
+    """
+    if settings.GATEWAY_UPSTREAM_MSGPACK and msgpack:
+        return MSGPACK_ACCEPT
+    return request.META.get('HTTP_ACCEPT')
+
+
+def is_relayable_encoding(request, response):
+    """上游响应是否已按客户端接受的算法压缩（可直接转发压缩后的响应体）"""
+    encoding = response.headers.get('Content-Encoding', '').strip().lower()
+    if not encoding or encoding == 'identity':
+        return False
+    return bool(get_accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''), [encoding]))
+
+
+def build_upstream_request(request, base_url, path='', stream=False, conditional=False, msgpack=False):
+    """
+    构建转发到上游服务的请求参数（同步/异步转发共用）
     
     Args:
         request: Django请求对象
-        service_name: 服务名称
+        base_url: 上游服务地址
         path: 服务路径（不包含/api/前缀）
-    """
-    service_url = get_service_url(service_name)
-    if not service_url:
-        return JsonResponse(
-            {'error': f'服务 {service_name} 不存在'},
-            status=status.HTTP_404_NOT_FOUND
-        )
+        stream: 是否流式透传上游响应体
+        conditional: 是否转发 If-None-Match（由上游判断条件GET；需要缓存或合并的请求必须取得完整响应体）
+        msgpack: 是否向上游请求msgpack（响应写入缓存前由网关转换为JSON）
     
+    Returns:
+        dict: method、url、params、headers、body
+    """
     # 构建完整URL
     full_path = f'/api/{path}' if path else '/api/'
-    url = f'{service_url}{full_path}'
+    url = f'{base_url}{full_path}'
     
     # 获取请求方法
     method = request.method.lower()
@@ -48,62 +161,343 @@ def forward_request(request, service_name, path=''):
     if auth_header:
         headers['Authorization'] = auth_header
     
+    # 网关签名的内部身份头（下游服务据此信任用户和租户，无需再次解析JWT）
+    identity_headers = get_identity_headers(request)
+    headers.update(identity_headers)
+    
+    # 未转发内部身份时由下游服务校验指定的企业
+    company_header = request.META.get(COMPANY_ID_HEADER)
+    if company_header and not identity_headers:
+        headers['X-Company-Id'] = company_header
+    
+    # 追踪头（在对冲线程池中构建请求时无法读取当前请求的上下文，显式使用请求的追踪记录）
+    trace = getattr(request, 'trace', None)
+    if trace is not None:
+        headers.update(get_trace_headers(trace))
+    
     # 复制其他重要头
-    for key in ['Content-Type', 'Accept']:
-        if key in request.META:
-            headers[key] = request.META[key]
+    if request.META.get('CONTENT_TYPE'):
+        headers['Content-Type'] = request.META['CONTENT_TYPE']
+    accept = get_upstream_accept(request, msgpack)
+    if accept:
+        headers['Accept'] = accept
+    
+    if conditional and request.META.get('HTTP_IF_NONE_MATCH'):
+        headers['If-None-Match'] = request.META['HTTP_IF_NONE_MATCH']
+    
+    # 网关与上游服务之间压缩传输
+    headers['Accept-Encoding'] = get_upstream_accept_encoding(request, stream)
     
-    # 准备请求数据
-    data = None
-    json_data = None
+    # 原样转发请求体和原始Content-Type（JSON、表单、multipart均不做解析）
+    body = None
     if method in ['post', 'put', 'patch']:
-        if request.content_type and 'application/json' in request.content_type:
-            try:
-                import json
-                json_data = json.loads(request.body)
-            except:
-                pass
+        body, content_length = get_request_body(request)
+        headers['Content-Length'] = str(content_length)
+    
+    return {
+        'method': method,
+        'url': url,
+        'params': params,
+        'headers': headers,
+        'body': body,
+    }
+
+
+def record_upstream_timing(request, service_name, latency, response):
+    """上游调用耗时计入请求的追踪，并合并上游服务返回的各阶段耗时（Server-Timing）"""
+    trace = getattr(request, 'trace', None)
+    if trace is None:
+        return
+    trace.record('upstream', latency, service_name)
+    trace.merge_server_timing(service_name, response.headers.get(SERVER_TIMING_HEADER))
+
+
+def build_client_response(response):
+    """
+    将上游响应转换为返回给客户端的响应（兼容 requests 和 httpx 的响应对象）
+    """
+    # 检查响应内容类型
+    content_type = response.headers.get('content-type', '').lower()
+    is_json = 'application/json' in content_type
+    
+    # 尝试解析 JSON / msgpack 响应
+    if is_json or is_msgpack_content_type(content_type):
+        try:
+            response_data = response.json() if is_json else unpackb(response.content)
+        except ValueError:
+            # 解析失败，返回原始文本
+            response_data = {'error': '响应解析失败', 'details': response.text[:500]}
+    else:
+        # 非 JSON 响应（可能是 HTML 错误页面）
+        response_data = {
+            'error': '服务返回非 JSON 响应',
+            'details': response.text[:500] if response.text else '空响应',
+            'status_code': response.status_code
+        }
+    
+    # 返回响应
+    return JsonResponse(
+        response_data,
+        status=response.status_code,
+        safe=False
+    )
+
+
+def is_passthrough_response(response):
+    """
+    判断上游响应能否直接透传给客户端
+    JSON、msgpack响应和无内容响应无需网关检查；其他响应（如HTML错误页面）需要缓冲后转换为JSON错误信息
+    """
+    if response.status_code == status.HTTP_204_NO_CONTENT:
+        return True
+    content_type = response.headers.get('content-type', '').lower()
+    return 'application/json' in content_type or is_msgpack_content_type(content_type)
+
+
+def get_edge_body(response):
+    """
+    已完整读取的上游响应体在边缘转换为返回给客户端的格式：msgpack转换为JSON，其他格式原样返回
+    
+    Returns:
+        (content_type, body, converted)
+    """
+    content_type = response.headers.get('Content-Type', '')
+    if is_msgpack_content_type(content_type) and response.content:
+        return 'application/json', msgpack_to_json(response.content), True
+    return content_type, response.content, False
+
+
+def build_streaming_response(response, streaming_content, encoded=False):
+    """
+    构建透传响应：原样复制上游状态码和内容相关响应头，响应体分块流式返回
+    
+    Args:
+        response: 上游响应对象（requests 或 httpx）
+        streaming_content: 响应体分块迭代器（同步或异步）
+        encoded: 响应体是否为上游压缩后的原始字节（原样转发给客户端）
+    """
+    client_response = StreamingHttpResponse(streaming_content, status=response.status_code)
+    for header in PASSTHROUGH_HEADERS:
+        if header in response.headers:
+            client_response[header] = response.headers[header]
+    if encoded:
+        client_response['Content-Encoding'] = response.headers['Content-Encoding']
+        if 'Content-Length' in response.headers:
+            client_response['Content-Length'] = response.headers['Content-Length']
+        patch_vary_headers(client_response, ('Accept-Encoding',))
+    # 上游响应体被解压后长度会变化，只在未压缩时保留Content-Length
+    elif 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+        client_response['Content-Length'] = response.headers['Content-Length']
+    return client_response
+
+
+def iter_upstream_body(response, chunk_size, encoded=False):
+    """
+    分块读取上游响应体，读取结束或客户端断开后释放连接回连接池
+    
+    Args:
+        encoded: 是否读取未解压的原始字节
+    """
+    try:
+        if encoded:
+            chunks = response.raw.stream(chunk_size, decode_content=False)
         else:
-            data = request.POST.dict()
+            chunks = response.iter_content(chunk_size=chunk_size)
+        for chunk in chunks:
+            if chunk:
+                yield chunk
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError) as e:
+        # 响应头已发送，无法再修改状态码，只能中断响应
+        logger.warning(f'读取上游响应失败: {e}')
+    finally:
+        response.close()
+
+
+def build_cached_response(cached, cache_status):
+    """
+    使用缓冲的上游响应体构建响应（不重新编码）
+    
+    Args:
+        cached: CachedResponse
+        cache_status: 缓存状态（HIT/MISS），写入X-Cache响应头
+    """
+    client_response = HttpResponse(
+        cached.body,
+        status=cached.status_code,
+        content_type=cached.content_type
+    )
+    client_response['X-Cache'] = cache_status
+    if cached.etag:
+        client_response['ETag'] = cached.etag
+    return client_response
+
+
+def build_buffered_response(response):
+    """使用已完整读取的上游响应体构建响应（JSON不解析、不重新编码；msgpack转换为JSON）"""
+    content_type, body, converted = get_edge_body(response)
+    client_response = HttpResponse(body, status=response.status_code)
+    for header in PASSTHROUGH_HEADERS:
+        if header in response.headers:
+            client_response[header] = response.headers[header]
+    if converted:
+        # 上游ETag对应msgpack表示，按转换后的JSON重新计算
+        client_response['Content-Type'] = content_type
+        if response.status_code == status.HTTP_200_OK:
+            client_response['ETag'] = compute_etag(body)
+        elif client_response.has_header('ETag'):
+            del client_response['ETag']
+    return client_response
+
+
+def cache_upstream_response(cache_key, response):
+    """
+    缓存上游响应（响应体需已完整读取）并构建返回给客户端的响应
+    
+    Returns:
+        (client_response, cached): cached为需要写入缓存的CachedResponse，不可缓存时为None
+    """
+    if not is_passthrough_response(response):
+        return build_client_response(response), None
+    
+    # 缓存转换为JSON后的响应体，缓存命中时无需再次转换
+    content_type, body, converted = get_edge_body(response)
     
+    # 上游未返回ETag（或响应体已转换）时按响应体计算，后续缓存命中时可直接判断条件GET
+    etag = None
+    if response.status_code == status.HTTP_200_OK:
+        etag = (not converted and response.headers.get('ETag')) or compute_etag(body)
+    cached = CachedResponse(
+        response.status_code,
+        content_type,
+        body,
+        etag
+    )
+    if not response_cache.is_cacheable(*cached):
+        return build_cached_response(cached, 'BYPASS'), None
+    return build_cached_response(cached, 'MISS'), cached
+
+
+def build_circuit_open_response(breaker):
+    """熔断中的快速失败响应"""
+    client_response = JsonResponse(
+        {'error': f'服务 {breaker.service_name} 暂时不可用，请稍后重试'},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+    client_response['Retry-After'] = str(breaker.retry_after())
+    return client_response
+
+
+def build_rate_limited_response():
+    """超出限流额度时返回的429响应"""
+    return JsonResponse(
+        {'error': '请求过于频繁，请稍后重试'},
+        status=status.HTTP_429_TOO_MANY_REQUESTS
+    )
+
+
+def build_overloaded_response(limiter):
+    """上游并发已满且排队失败时返回的响应（503或429，带Retry-After）"""
+    client_response = JsonResponse(
+        {'error': f'服务 {limiter.service_name} 繁忙，请稍后重试'},
+        status=limiter.config['REJECT_STATUS']
+    )
+    client_response['Retry-After'] = str(limiter.retry_after())
+    return client_response
+
+
+def fetch_upstream(request, pool, service_name, path, cache_key=None, buffered=False):
+    """
+    在上游并发名额内调用上游服务，名额不足时排队，队列已满或等待超时时直接拒绝
+    
+    Args:
+        cache_key: 响应缓存键，不为None时缓冲并缓存响应
+        buffered: 是否必须返回已缓冲的响应（请求合并时结果需要分发给多个请求）
+    """
+    limiter = admission_registry.get(service_name)
+    if limiter is None:
+        return call_upstream(request, pool, service_name, path, cache_key, buffered)
+    
+    if not limiter.acquire():
+        gateway_metrics.record_rejection(service_name, 'overloaded')
+        return build_overloaded_response(limiter)
     try:
-        # 发送请求
-        response = requests.request(
-            method=method,
-            url=url,
-            params=params,
-            headers=headers,
-            json=json_data,
-            data=data,
-            timeout=30
-        )
+        return call_upstream(request, pool, service_name, path, cache_key, buffered)
+    finally:
+        limiter.release()
+
+
+def call_upstream(request, pool, service_name, path, cache_key=None, buffered=False):
+    """
+    调用上游服务并构建返回给客户端的响应（上游异常转换为错误响应）
+    
+    Args:
+        cache_key: 响应缓存键，不为None时缓冲并缓存响应
+        buffered: 是否必须返回已缓冲的响应（请求合并时结果需要分发给多个请求）
+    """
+    # 熔断中的服务直接返回503，不占用工作线程等待上游
+    breaker = breaker_registry.get(service_name)
+    permit = None
+    if breaker is not None:
+        permit = breaker.allow_request()
+        if permit is None:
+            gateway_metrics.record_rejection(service_name, 'circuit_open')
+            return build_circuit_open_response(breaker)
+    
+    # 配置了对冲的路由上，幂等请求超过p95延迟未返回时向另一个副本发送对冲请求
+    hedge_policy = hedging_registry.get_for_request(request, service_name)
+    started = time.monotonic()
+    latency = None
+    failed = True
+    outcome = 'error'
+    response_bytes = None
+    try:
+        # 通过上游连接池发送请求（复用keep-alive连接），需要缓存或合并的响应不使用流式读取
+        stream = settings.GATEWAY_STREAM_RESPONSES and cache_key is None and not buffered
+        conditional = cache_key is None and not buffered
         
-        # 检查响应内容类型
-        content_type = response.headers.get('content-type', '').lower()
-        is_json = 'application/json' in content_type
+        def send(replica):
+            upstream_request = build_upstream_request(
+                request, replica.url, path, stream, conditional, msgpack=cache_key is not None
+            )
+            return pool.request(stream=stream, **upstream_request)
         
-        # 尝试解析 JSON 响应
-        if is_json:
-            try:
-                response_data = response.json()
-            except ValueError:
-                # JSON 解析失败，返回原始文本
-                response_data = {'error': '响应解析失败', 'details': response.text[:500]}
-        else:
-            # 非 JSON 响应（可能是 HTML 错误页面）
-            response_data = {
-                'error': '服务返回非 JSON 响应',
-                'details': response.text[:500] if response.text else '空响应',
-                'status_code': response.status_code
-            }
+        # 由负载均衡器选择副本，请求结果用于被动摘除不健康的副本
+        response = send_upstream(pool.balancer, send, hedge_policy)
+        latency = time.monotonic() - started
+        failed = response.status_code >= 500
+        outcome = str(response.status_code)
+        if 'Content-Length' in response.headers:
+            response_bytes = int(response.headers['Content-Length'])
+        record_upstream_timing(request, service_name, latency, response)
         
-        # 返回响应
-        return JsonResponse(
-            response_data,
-            status=response.status_code,
-            safe=False
-        )
+        if cache_key is not None:
+            client_response, cached = cache_upstream_response(cache_key, response)
+            if cached is not None:
+                response_cache.set(cache_key, cached)
+            return client_response
+        
+        # 上游判断客户端的ETag未变化，返回不含响应体的304
+        if response.status_code == status.HTTP_304_NOT_MODIFIED:
+            response.close()
+            return build_not_modified_response(response.headers.get('ETag'))
+        
+        # 透传模式：不解析、不重新编码，直接分块返回上游响应体
+        if is_passthrough_response(response):
+            if stream:
+                # 上游已按客户端接受的算法压缩时，原样转发压缩后的响应体
+                encoded = is_relayable_encoding(request, response)
+                return build_streaming_response(
+                    response,
+                    iter_upstream_body(response, settings.GATEWAY_STREAM_CHUNK_SIZE, encoded),
+                    encoded
+                )
+            if buffered:
+                return build_buffered_response(response)
+        
+        return build_client_response(response)
     except requests.exceptions.RequestException as e:
+        if isinstance(e, requests.exceptions.Timeout):
+            outcome = 'timeout'
         return JsonResponse(
             {'error': f'服务调用失败: {str(e)}'},
             status=status.HTTP_503_SERVICE_UNAVAILABLE
@@ -113,6 +507,83 @@ def forward_request(request, service_name, path=''):
             {'error': f'请求处理失败: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    finally:
+        if latency is None:
+            latency = time.monotonic() - started
+        if permit is not None:
+            breaker.record(permit, failed, latency)
+        if get_metrics_config()['ENABLED']:
+            gateway_metrics.record_upstream(service_name, outcome, latency, response_bytes)
+
+
+def forward_request(request, service_name, path=''):
+    """
+    转发请求到指定服务
+    
+    Args:
+        request: Django请求对象
+        service_name: 服务名称
+        path: 服务路径（不包含/api/前缀）
+    """
+    pool = router.get_pool(service_name)
+    if pool is None:
+        return JsonResponse(
+            {'error': f'服务 {service_name} 不存在'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    
+    # 解析一次用户和租户，缓存隔离、限流和转发给下游服务的身份头共用
+    if should_resolve_identity(request) and not resolve_identity(request):
+        return build_company_forbidden_response()
+    
+    # 按租户限流：超出限额时直接返回429
+    with span('ratelimit'):
+        decision = rate_limiter.check(rate_limiter.get_buckets(request))
+    if decision is not None and not decision.allowed:
+        return apply_rate_limit_headers(build_rate_limited_response(), decision)
+    
+    return apply_rate_limit_headers(proxy_request(request, pool, service_name, path), decision)
+
+
+def proxy_request(request, pool, service_name, path):
+    """
+    经过响应缓存和请求合并后调用上游服务
+    
+    Args:
+        pool: 上游服务连接池
+    """
+    # GET响应缓存：命中时直接返回，不访问上游服务
+    cache_key = response_cache.build_key(request)
+    if cache_key is not None:
+        with span('cache'):
+            cached, generation = response_cache.get(cache_key)
+        if cached is not None:
+            # 客户端持有的ETag与缓存一致时直接返回304，不访问上游也不传输响应体
+            if etag_matches(request, cached.etag):
+                client_response = build_not_modified_response(cached.etag)
+                client_response['X-Cache'] = 'HIT'
+                return client_response
+            return build_cached_response(cached, 'HIT')
+        # 请求上游前的失效代数：上游返回前资源已被写操作失效时不写入缓存
+        cache_key = cache_key._replace(generation=generation)
+    
+    try:
+        # 相同的并发GET请求合并为一次上游调用
+        coalescing_key = build_coalescing_key(request)
+        if coalescing_key is None:
+            return evaluate_conditional(request, fetch_upstream(request, pool, service_name, path, cache_key))
+        
+        # 共享不可变的响应快照，每个请求各自构建响应对象（之后的压缩、ETag处理互不影响）
+        snapshot, shared = single_flight.do(
+            coalescing_key,
+            lambda: snapshot_response(fetch_upstream(request, pool, service_name, path, cache_key, buffered=True))
+        )
+        # 合并的请求各自携带的ETag可能不同，分别判断条件GET
+        return evaluate_conditional(request, build_snapshot_response(snapshot, shared))
+    finally:
+        # 写操作可能已在上游生效（包括超时的情况），使同一资源前缀的缓存失效
+        if request.method in WRITE_METHODS:
+            response_cache.invalidate(request.path)
 
 
 @api_view(['GET'])
@@ -122,10 +593,82 @@ def health_check(request):
     return Response({
         'status': 'ok',
         'service': 'api_gateway',
-        'version': '1.0.0'
+        'version': '1.0.0',
+        'routing_table_version': router.table.version,
+        'upstream_pools': router.metrics(),
+        'response_cache': response_cache.metrics(),
+        'request_coalescing': get_coalescing_metrics(),
+        'circuit_breakers': breaker_registry.metrics(),
+        'rate_limit': rate_limiter.metrics(),
+        'admission': get_admission_metrics(),
+        'hedging': hedging_registry.metrics(),
     })
 
 
+def is_internal_address(address):
+    """是否为本机或内网地址（连接地址，不使用客户端可伪造的 X-Forwarded-For）"""
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return ip.is_loopback or ip.is_private
+
+
+def metrics_endpoint(request):
+    """
+    网关指标（Prometheus文本格式）
+    配置了 GATEWAY_METRICS_TOKEN 时需要在 Authorization 头中提供 Bearer 令牌；
+    未配置令牌时只允许本机和内网地址访问（指标包含各租户、各服务的统计）
+    """
+    metrics_config = get_metrics_config()
+    if not metrics_config['ENABLED']:
+        return JsonResponse({'error': '网关指标未启用'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if metrics_config['TOKEN']:
+        provided_token = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        if not hmac.compare_digest(provided_token.encode('utf-8'), metrics_config['TOKEN'].encode('utf-8')):
+            return JsonResponse({'error': '指标令牌无效'}, status=status.HTTP_403_FORBIDDEN)
+    elif not is_internal_address(request.META.get('REMOTE_ADDR', '')):
+        return JsonResponse({'error': '未配置指标令牌时只允许内网访问'}, status=status.HTTP_403_FORBIDDEN)
+    
+    return HttpResponse(gateway_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])
+def routing_admin(request):
+    """
+    路由表管理
+    GET 查看当前路由表，POST 重新解析服务地址并热重载路由表；
+    需要在 X-Gateway-Admin-Token 头中提供管理令牌，未配置令牌时接口不可用
+    """
+    admin_token = get_routing_config()['ADMIN_TOKEN']
+    if not admin_token:
+        return Response({'error': '路由管理接口未启用'}, status=status.HTTP_404_NOT_FOUND)
+    
+    provided_token = request.META.get('HTTP_X_GATEWAY_ADMIN_TOKEN', '')
+    if not hmac.compare_digest(provided_token.encode('utf-8'), admin_token.encode('utf-8')):
+        return Response({'error': '管理令牌无效'}, status=status.HTTP_403_FORBIDDEN)
+    
+    table = router.reload() if request.method == 'POST' else router.table
+    return Response(table.describe())
+
+
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def batch_proxy(request):
+    """
+    批量请求代理
+    并发执行多个子请求并合并返回，每个子请求按其路由单独进行认证和权限检查
+    """
+    serializer = BatchRequestSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    results = run_batch(request, serializer.validated_data['requests'])
+    return Response({'results': results}, status=status.HTTP_200_OK)
+
+
 @api_view(['GET', 'POST', 'PUT', 'PATCH', 'DELETE'])
 @permission_classes([IsAuthenticated])
 def user_service_proxy(request, path=''):
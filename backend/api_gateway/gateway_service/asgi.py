@@ -0,0 +1,10 @@
+"""
+ASGI config for gateway_service project.
+启用 GATEWAY_ASYNC 后使用，例如：uvicorn gateway_service.asgi:application
+"""
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'gateway_service.settings')
+
+application = get_asgi_application()
@@ -33,7 +33,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'gateway.metrics.MetricsMiddleware',
+    'common.middleware.tracing_middleware.TracingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'common.middleware.compression_middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -62,6 +65,10 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'gateway_service.wsgi.application'
+ASGI_APPLICATION = 'gateway_service.asgi.application'
+
+# 异步网关模式：启用后代理视图使用异步视图和非阻塞HTTP客户端（需以ASGI方式运行）
+GATEWAY_ASYNC = config('GATEWAY_ASYNC', default=False, cast=bool)
 
 # Database (网关不需要数据库，但Django要求配置)
 DATABASES = {
@@ -102,7 +109,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework配置
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'common.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -121,7 +128,171 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
+# 前端通过 X-Company-Id 请求头切换当前企业
+from corsheaders.defaults import default_headers
+CORS_ALLOW_HEADERS = (*default_headers, 'x-company-id')
+
 # 服务URL配置（用于服务间调用）
 # 使用统一的配置管理，根据环境自动选择（开发/生产）
 from common.utils.service_config import get_all_service_urls
 SERVICE_URLS = get_all_service_urls()
+
+# 上游连接池配置（网关到各微服务的keep-alive连接）
+GATEWAY_UPSTREAM_POOL = {
+    'POOL_SIZE': config('GATEWAY_POOL_SIZE', default=20, cast=int),
+    'POOL_BLOCK': config('GATEWAY_POOL_BLOCK', default=False, cast=bool),
+    'PREWARM': config('GATEWAY_POOL_PREWARM', default=2, cast=int),
+    'PREWARM_PATH': config('GATEWAY_POOL_PREWARM_PATH', default='/api/'),
+    'TIMEOUT': config('GATEWAY_UPSTREAM_TIMEOUT', default=30, cast=int),
+    # ASGI模式下每个上游服务的最大并发连接数
+    'ASYNC_POOL_SIZE': config('GATEWAY_ASYNC_POOL_SIZE', default=1000, cast=int),
+    # 按服务覆盖配置，例如 {'log_service': {'POOL_SIZE': 50}}
+    'SERVICE_OVERRIDES': {},
+}
+
+# 响应透传：JSON响应不经解析和重新编码，直接分块流式返回给客户端
+GATEWAY_STREAM_RESPONSES = config('GATEWAY_STREAM_RESPONSES', default=True, cast=bool)
+GATEWAY_STREAM_CHUNK_SIZE = config('GATEWAY_STREAM_CHUNK_SIZE', default=64 * 1024, cast=int)
+
+# 网关与上游服务之间压缩传输：流式透传时上游按客户端接受的算法压缩，网关原样转发压缩后的响应体
+GATEWAY_UPSTREAM_COMPRESSION = config('GATEWAY_UPSTREAM_COMPRESSION', default=True, cast=bool)
+
+# 写入响应缓存的上游响应使用msgpack传输，由网关转换为JSON后缓存；
+# 其他响应按客户端的 Accept 协商，上游返回的JSON原样转发，不在网关重新编码
+GATEWAY_UPSTREAM_MSGPACK = config('GATEWAY_UPSTREAM_MSGPACK', default=True, cast=bool)
+
+# 请求体超过该大小（字节）且尚未被读取时，以流的方式转发给上游
+GATEWAY_STREAM_REQUEST_THRESHOLD = config('GATEWAY_STREAM_REQUEST_THRESHOLD', default=1024 * 1024, cast=int)
+
+# GET响应缓存：进程内LRU（L1）+ Redis（L2），按租户、用户、路径和查询参数隔离
+# 对同一资源前缀（如 /api/companies/）的写操作会使该前缀下的缓存失效
+GATEWAY_RESPONSE_CACHE = {
+    'ENABLED': config('GATEWAY_CACHE_ENABLED', default=True, cast=bool),
+    'L1_MAX_ENTRIES': config('GATEWAY_CACHE_L1_MAX_ENTRIES', default=1000, cast=int),
+    # L1各进程独立，TTL上限用于控制多进程部署下的数据滞后
+    'L1_MAX_TTL': config('GATEWAY_CACHE_L1_MAX_TTL', default=5, cast=int),
+    'L2_ENABLED': config('GATEWAY_CACHE_L2_ENABLED', default=True, cast=bool),
+    'MAX_BODY_SIZE': config('GATEWAY_CACHE_MAX_BODY_SIZE', default=1024 * 1024, cast=int),
+    # 路由缓存时间（秒）：(网关路径正则, TTL)
+    'ROUTES': [
+        (r'^/api/companies/[^/]+/$', 60),
+        (r'^/api/users/[^/]+/$', 30),
+        (r'^/api/notifications/unread_count/$', 5),
+    ],
+}
+
+# 相同GET请求合并：同一时刻相同的GET请求（方法、路径、查询参数、认证范围）只调用一次上游
+# 参与合并的响应需要完整缓冲，因此只对小响应的路由启用
+GATEWAY_COALESCING = {
+    'ENABLED': config('GATEWAY_COALESCING_ENABLED', default=True, cast=bool),
+    'ROUTES': [
+        r'^/api/(users|companies|permissions|notifications)/',
+        r'^/api/logs/statistics/$',
+    ],
+    # 等待其他请求发起的上游调用的最长时间（秒），超时后自行调用上游
+    'WAIT_TIMEOUT': config('GATEWAY_COALESCING_WAIT_TIMEOUT', default=35, cast=int),
+}
+
+# 上游熔断器：滚动窗口内错误率或慢调用率超过阈值时熔断，熔断期间直接返回503
+GATEWAY_CIRCUIT_BREAKER = {
+    'ENABLED': config('GATEWAY_BREAKER_ENABLED', default=True, cast=bool),
+    'WINDOW_SECONDS': config('GATEWAY_BREAKER_WINDOW_SECONDS', default=10, cast=int),
+    'WINDOW_BUCKETS': 10,
+    # 窗口内请求数达到该值后才计算错误率
+    'MIN_REQUESTS': config('GATEWAY_BREAKER_MIN_REQUESTS', default=20, cast=int),
+    'ERROR_RATE_THRESHOLD': config('GATEWAY_BREAKER_ERROR_RATE', default=0.5, cast=float),
+    'SLOW_CALL_SECONDS': config('GATEWAY_BREAKER_SLOW_CALL_SECONDS', default=5, cast=float),
+    'SLOW_CALL_RATE_THRESHOLD': config('GATEWAY_BREAKER_SLOW_CALL_RATE', default=0.5, cast=float),
+    'OPEN_SECONDS': config('GATEWAY_BREAKER_OPEN_SECONDS', default=15, cast=int),
+    # 半开状态下的探测请求数，全部成功后恢复
+    'HALF_OPEN_MAX_PROBES': config('GATEWAY_BREAKER_HALF_OPEN_PROBES', default=3, cast=int),
+    # 按服务覆盖配置，例如 {'log_service': {'SLOW_CALL_SECONDS': 2}}
+    'SERVICE_OVERRIDES': {},
+}
+
+# 批量请求：/api/batch/ 一次提交多个子请求，网关并发执行后合并返回
+GATEWAY_BATCH = {
+    'MAX_REQUESTS': config('GATEWAY_BATCH_MAX_REQUESTS', default=20, cast=int),
+    # 同时执行的子请求数
+    'MAX_WORKERS': config('GATEWAY_BATCH_MAX_WORKERS', default=10, cast=int),
+}
+
+# 服务副本负载均衡：副本地址通过 <SERVICE>_URLS 环境变量配置（逗号分隔）
+GATEWAY_LOAD_BALANCER = {
+    # round_robin / least_outstanding / power_of_two
+    'STRATEGY': config('GATEWAY_LB_STRATEGY', default='round_robin'),
+    # 被动摘除：副本连续失败（连接错误、超时或5xx）达到阈值后暂时不再分配请求
+    'EJECTION': {
+        'CONSECUTIVE_FAILURES': config('GATEWAY_LB_EJECTION_FAILURES', default=5, cast=int),
+        'EJECTION_SECONDS': config('GATEWAY_LB_EJECTION_SECONDS', default=30, cast=int),
+        'MAX_EJECTION_SECONDS': config('GATEWAY_LB_MAX_EJECTION_SECONDS', default=300, cast=int),
+        'MAX_EJECTION_PERCENT': config('GATEWAY_LB_MAX_EJECTION_PERCENT', default=50, cast=int),
+    },
+    # 服务级覆盖配置，如 {'log_service': {'STRATEGY': 'least_outstanding'}}
+    'SERVICE_OVERRIDES': {},
+}
+
+# 路由表：启动时构建，发送重载信号或调用 /admin/routes/ 管理接口时热重载
+GATEWAY_ROUTING = {
+    'RELOAD_SIGNAL': config('GATEWAY_ROUTING_RELOAD_SIGNAL', default='SIGHUP'),
+    # 管理接口令牌（X-Gateway-Admin-Token 头），为空时管理接口不可用
+    'ADMIN_TOKEN': config('GATEWAY_ADMIN_TOKEN', default=''),
+    # 重载后旧连接池等待进行中的请求完成的时间（秒）
+    'DRAIN_SECONDS': config('GATEWAY_ROUTING_DRAIN_SECONDS', default=60, cast=int),
+}
+
+# 按租户限流：令牌桶保存在Redis中，各进程按批租用令牌
+# 路由分组按顺序匹配第一个；COMPANY / USER 为 (桶容量, 每秒补充令牌数)，未认证请求的USER限额按客户端IP计算
+GATEWAY_RATE_LIMIT = {
+    'ENABLED': config('GATEWAY_RATE_LIMIT_ENABLED', default=True, cast=bool),
+    'LEASE_SIZE': config('GATEWAY_RATE_LIMIT_LEASE_SIZE', default=10, cast=int),
+    'LEASE_TTL': config('GATEWAY_RATE_LIMIT_LEASE_TTL', default=1, cast=float),
+    'FAIL_OPEN': config('GATEWAY_RATE_LIMIT_FAIL_OPEN', default=True, cast=bool),
+    # 网关前的可信反向代理层数（如前端nginx转发时为1），决定未认证请求按哪个客户端IP限流
+    'TRUSTED_PROXY_COUNT': config('GATEWAY_TRUSTED_PROXY_COUNT', default=0, cast=int),
+    'GROUPS': [
+        # 登录、注册等认证接口：防止暴力尝试
+        {'NAME': 'auth', 'PATTERN': r'^/api/auth/', 'USER': (10, 0.5)},
+        # 日志查询和统计开销较大
+        {'NAME': 'logs', 'PATTERN': r'^/api/logs/', 'COMPANY': (100, 20), 'USER': (30, 5)},
+        {'NAME': 'default', 'PATTERN': r'^/api/', 'COMPANY': (500, 100), 'USER': (100, 20)},
+    ],
+}
+
+# 上游并发准入控制：每个上游服务的最大并发请求数和有界等待队列
+GATEWAY_ADMISSION = {
+    'ENABLED': config('GATEWAY_ADMISSION_ENABLED', default=True, cast=bool),
+    'MAX_IN_FLIGHT': config('GATEWAY_ADMISSION_MAX_IN_FLIGHT', default=50, cast=int),
+    'MAX_QUEUE': config('GATEWAY_ADMISSION_MAX_QUEUE', default=100, cast=int),
+    # 排队等待的最长时间（秒）
+    'QUEUE_TIMEOUT': config('GATEWAY_ADMISSION_QUEUE_TIMEOUT', default=2, cast=float),
+    # 拒绝时返回的状态码（503 或 429）
+    'REJECT_STATUS': config('GATEWAY_ADMISSION_REJECT_STATUS', default=503, cast=int),
+    'RETRY_AFTER': config('GATEWAY_ADMISSION_RETRY_AFTER', default=1, cast=int),
+    # 服务级覆盖配置，如 {'log_service': {'MAX_IN_FLIGHT': 20}}
+    'SERVICE_OVERRIDES': {},
+}
+
+# 对冲请求：配置的路由上，幂等请求超过该服务p95延迟未返回时向另一个副本再发送一次，取先返回的结果
+GATEWAY_HEDGING = {
+    'ENABLED': config('GATEWAY_HEDGING_ENABLED', default=True, cast=bool),
+    'ROUTES': [
+        r'^/api/users/',
+        r'^/api/logs/',
+    ],
+    'DELAY_PERCENTILE': config('GATEWAY_HEDGING_PERCENTILE', default=0.95, cast=float),
+    'DEFAULT_DELAY': config('GATEWAY_HEDGING_DEFAULT_DELAY', default=0.2, cast=float),
+    # 重试预算：每个请求积累的令牌数（对冲请求最多占请求量的比例）和令牌上限
+    'BUDGET_RATIO': config('GATEWAY_HEDGING_BUDGET_RATIO', default=0.1, cast=float),
+    'BUDGET_MAX_TOKENS': config('GATEWAY_HEDGING_BUDGET_MAX_TOKENS', default=20, cast=int),
+    'MAX_WORKERS': config('GATEWAY_HEDGING_MAX_WORKERS', default=64, cast=int),
+}
+
+# 网关指标（/metrics，Prometheus文本格式）：各工作进程定期把本地增量合并到Redis，输出所有进程的合计
+GATEWAY_METRICS = {
+    'ENABLED': config('GATEWAY_METRICS_ENABLED', default=True, cast=bool),
+    'SHARED': config('GATEWAY_METRICS_SHARED', default=True, cast=bool),
+    'FLUSH_INTERVAL': config('GATEWAY_METRICS_FLUSH_INTERVAL', default=5, cast=int),
+    # /metrics 的Bearer令牌，为空时只允许本机和内网地址访问
+    'TOKEN': config('GATEWAY_METRICS_TOKEN', default=''),
+}
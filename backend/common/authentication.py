@@ -0,0 +1,81 @@
+"""
+服务端认证
+信任网关签名的内部身份头，经网关转发的请求无需再次解析JWT或查询数据库；
+直接访问服务的请求复用 TenantMiddleware 已校验的JWT，不重复解码，也不查询Django用户表
+"""
+from rest_framework.authentication import BaseAuthentication
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from common.utils.internal_auth import verify_identity_headers
+from common.utils.jwt_utils import get_request_token
+
+
+class StatelessUser:
+    """
+    无状态用户（网关身份或JWT）
+    只包含身份信息，不对应数据库中的用户记录
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_staff = False
+    is_superuser = False
+
+    def __init__(self, user_id, company_id=None):
+        self.id = self.pk = user_id
+        self.user_id = user_id
+        self.company_id = company_id
+
+    def __str__(self):
+        return str(self.user_id)
+
+
+class GatewayIdentityAuthentication(BaseAuthentication):
+    """
+    网关内部身份认证
+    请求带有有效的内部身份头时认证成功；否则返回None，由后续的认证类（JWT）继续处理
+    """
+
+    def authenticate(self, request):
+        # TenantMiddleware 已校验过身份头时直接复用结果
+        identity = getattr(request._request, 'gateway_identity', None)
+        if identity is None:
+            identity = verify_identity_headers(request.META)
+        if identity is None:
+            return None
+
+        user_id, company_id = identity
+        return StatelessUser(user_id, company_id), None
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    无状态JWT认证
+    Token在同一请求内只校验一次（与 TenantMiddleware 共用，解析耗时计入追踪的jwt阶段），
+    校验结果按Token哈希缓存；用户直接由Token中的user_id构建，不查询数据库
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        try:
+            validated_token = get_request_token(request, raw_token)
+        except TokenError as e:
+            raise InvalidToken(e.args[0] if e.args else str(e))
+
+        return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not user_id:
+            raise InvalidToken('Token中不包含用户标识')
+        return StatelessUser(user_id)
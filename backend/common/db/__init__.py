@@ -1,9 +1,44 @@
 """
 MongoDB 数据库连接配置
-使用 mongoengine 连接 MongoDB
+使用 mongoengine 连接 MongoDB；异步代码（ASGI服务）使用 pymongo 的 AsyncMongoClient，无需切换到线程执行查询
 """
+import asyncio
+
 import mongoengine
 from decouple import config
+from pymongo import AsyncMongoClient, monitoring
+
+from common.utils.tracing import get_current_trace
+
+
+class CommandTimingListener(monitoring.CommandListener):
+    """把MongoDB命令耗时计入当前请求的追踪（db阶段）"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        trace = get_current_trace()
+        if trace is not None:
+            trace.record('db', event.duration_micros / 1000000, 'mongodb')
+
+
+def get_mongodb_config():
+    """MongoDB 连接配置（mongoengine 和异步客户端共用）"""
+    return {
+        'db_name': config('MONGODB_NAME', default='platform_db'),
+        'host': config('MONGODB_HOST', default='mongodb'),
+        'port': config('MONGODB_PORT', default=27017, cast=int),
+        'username': config('MONGODB_USER', default='admin'),
+        'password': config('MONGODB_PASSWORD', default='admin123'),
+        'auth_source': config('MONGODB_AUTH_SOURCE', default='admin'),
+    }
 
 
 def connect_mongodb():
@@ -11,23 +46,48 @@ def connect_mongodb():
     连接 MongoDB 数据库
     在 Django 应用启动时调用
     """
-    db_name = config('MONGODB_NAME', default='platform_db')
-    host = config('MONGODB_HOST', default='mongodb')
-    port = config('MONGODB_PORT', default=27017, cast=int)
-    username = config('MONGODB_USER', default='admin')
-    password = config('MONGODB_PASSWORD', default='admin123')
-    auth_source = config('MONGODB_AUTH_SOURCE', default='admin')
+    mongodb_config = get_mongodb_config()
     
     mongoengine.connect(
-        db=db_name,
-        host=host,
-        port=port,
-        username=username,
-        password=password,
-        authentication_source=auth_source,
+        db=mongodb_config['db_name'],
+        host=mongodb_config['host'],
+        port=mongodb_config['port'],
+        username=mongodb_config['username'],
+        password=mongodb_config['password'],
+        authentication_source=mongodb_config['auth_source'],
+        event_listeners=[CommandTimingListener()],
     )
 
 
+_async_database = None
+_async_loop = None
+
+
+def get_async_database():
+    """
+    获取当前事件循环的异步数据库对象（必须在事件循环中调用）
+    AsyncMongoClient 绑定到创建它的事件循环，事件循环变化时重建
+
+    Returns:
+        pymongo AsyncDatabase
+    """
+    global _async_database, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_database is None or _async_loop is not loop:
+        mongodb_config = get_mongodb_config()
+        client = AsyncMongoClient(
+            host=mongodb_config['host'],
+            port=mongodb_config['port'],
+            username=mongodb_config['username'],
+            password=mongodb_config['password'],
+            authSource=mongodb_config['auth_source'],
+            event_listeners=[CommandTimingListener()],
+        )
+        _async_database = client[mongodb_config['db_name']]
+        _async_loop = loop
+    return _async_database
+
+
 def disconnect_mongodb():
     """
     断开 MongoDB 连接
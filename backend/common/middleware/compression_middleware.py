@@ -0,0 +1,146 @@
+"""
+响应压缩中间件
+按客户端的 Accept-Encoding 协商压缩算法（安装了 brotli 时优先br，否则gzip），
+只压缩超过最小长度的文本类响应；已压缩的响应（如网关透传的上游压缩响应体）不会被重复压缩
+"""
+import gzip
+
+from decouple import config
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+DEFAULT_COMPRESSION_CONFIG = {
+    'ENABLED': config('COMPRESSION_ENABLED', default=True, cast=bool),
+    # 小于该长度（字节）的响应不压缩，压缩收益不足以抵消CPU开销
+    'MIN_SIZE': config('COMPRESSION_MIN_SIZE', default=1024, cast=int),
+    'GZIP_LEVEL': config('COMPRESSION_GZIP_LEVEL', default=6, cast=int),
+    'BROTLI_QUALITY': config('COMPRESSION_BROTLI_QUALITY', default=4, cast=int),
+    # 需要压缩的Content-Type前缀
+    'CONTENT_TYPES': [
+        'application/json',
+        'application/msgpack',
+        'application/x-msgpack',
+        'application/javascript',
+        'application/xml',
+        'text/',
+    ],
+}
+
+
+def get_compression_config():
+    """获取响应压缩配置（settings.COMPRESSION 覆盖默认值）"""
+    compression_config = dict(DEFAULT_COMPRESSION_CONFIG)
+    compression_config.update(getattr(settings, 'COMPRESSION', {}))
+    return compression_config
+
+
+def get_supported_encodings():
+    """本进程支持的压缩算法（按优先级排列）"""
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def parse_accept_encoding(header):
+    """
+    解析 Accept-Encoding 请求头
+
+    Returns:
+        dict: 编码 -> q值（q=0表示明确拒绝）
+    """
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        encodings[name] = quality
+    return encodings
+
+
+def get_accepted_encodings(header, supported=None):
+    """
+    客户端接受的压缩算法（按客户端q值从高到低，q值相同时按服务端优先级）
+
+    Args:
+        header: Accept-Encoding 请求头
+        supported: 服务端支持的算法，默认为 get_supported_encodings()
+
+    Returns:
+        编码列表，客户端不接受压缩时返回空列表
+    """
+    if supported is None:
+        supported = get_supported_encodings()
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get('*', 0.0)
+    candidates = [
+        (accepted.get(encoding, wildcard), -index, encoding)
+        for index, encoding in enumerate(supported)
+    ]
+    return [encoding for quality, _, encoding in sorted(candidates, reverse=True) if quality > 0]
+
+
+def compress(content, encoding, compression_config=None):
+    """按指定算法压缩内容"""
+    if compression_config is None:
+        compression_config = get_compression_config()
+    if encoding == 'br':
+        return brotli.compress(content, quality=compression_config['BROTLI_QUALITY'])
+    return gzip.compress(content, compresslevel=compression_config['GZIP_LEVEL'], mtime=0)
+
+
+def is_compressible(response, compression_config):
+    """响应的Content-Type是否需要压缩"""
+    content_type = response.get('Content-Type', '').lower()
+    return any(content_type.startswith(prefix) for prefix in compression_config['CONTENT_TYPES'])
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    响应压缩中间件
+    流式响应和已设置 Content-Encoding 的响应原样返回
+    """
+
+    def process_response(self, request, response):
+        compression_config = get_compression_config()
+        if not compression_config['ENABLED'] or response.streaming or response.has_header('Content-Encoding'):
+            return response
+        if not is_compressible(response, compression_config):
+            return response
+
+        # 响应内容随 Accept-Encoding 变化，共享缓存需要按该请求头区分
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < compression_config['MIN_SIZE']:
+            return response
+
+        encodings = get_accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if not encodings:
+            return response
+
+        compressed = compress(response.content, encodings[0], compression_config)
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encodings[0]
+        # 压缩后字节内容不同，强ETag改为弱ETag
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
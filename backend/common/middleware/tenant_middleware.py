@@ -1,27 +1,184 @@
 """
 多租户中间件
-自动从JWT Token中提取用户ID，从数据库读取企业ID，并注入到请求中
+优先信任网关签名的内部身份头；直接访问服务的请求从JWT Token中提取用户ID，企业ID在首次访问 request.company_id 时
+才从租户缓存或数据库读取（公开接口、404、被权限拒绝等不使用企业ID的请求不产生查询）；
+请求头 X-Company-Id 可以指定当前企业（用户属于多个企业时无需重新登录即可切换），按缓存的成员集合校验；
+同时支持同步和异步模式，ASGI服务中不会为解析身份切换到线程执行
 """
-from django.utils.deprecation import MiddlewareMixin
-from rest_framework_simplejwt.tokens import AccessToken
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import HttpRequest, JsonResponse
+from rest_framework import status
 from rest_framework_simplejwt.exceptions import TokenError
 from typing import Optional
-from common.utils.jwt_utils import get_user_company_id
+from common.utils.jwt_utils import (
+    get_request_token, get_requested_company_id, get_user_company_id, aget_user_company_id,
+    is_company_member, ais_company_member,
+)
+from common.utils.internal_auth import verify_identity_headers
+from common.utils.tracing import span
+
+
+class TenantUsageStats:
+    """延迟解析的统计：需要解析企业ID的请求数和实际访问了企业ID的请求数"""
+
+    def __init__(self):
+        self.deferred = 0
+        self.resolved = 0
+        self._lock = threading.Lock()
+
+    def record_deferred(self):
+        with self._lock:
+            self.deferred += 1
+
+    def record_resolved(self):
+        with self._lock:
+            self.resolved += 1
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'deferred': self.deferred,
+                'resolved': self.resolved,
+                # 未访问企业ID、节省了租户查询的请求数
+                'skipped': self.deferred - self.resolved,
+            }
+
+
+tenant_usage = TenantUsageStats()
+
+
+class LazyCompanyId:
+    """
+    request.company_id 描述符
+    TenantMiddleware 设置解析函数后，首次访问时才解析企业ID并保存结果；
+    直接赋值或未经过 TenantMiddleware 的请求与普通属性一致
+    """
+
+    def __get__(self, request, owner=None):
+        if request is None:
+            return self
+        state = request.__dict__
+        if '_company_id' in state:
+            return state['_company_id']
+        resolver = state.pop('_company_id_resolver', None)
+        if resolver is None:
+            raise AttributeError('company_id')
+        tenant_usage.record_resolved()
+        state['_company_id'] = resolver()
+        return state['_company_id']
+
+    def __set__(self, request, value):
+        request.__dict__.pop('_company_id_resolver', None)
+        request.__dict__['_company_id'] = value
+
+    def __delete__(self, request):
+        request.__dict__.pop('_company_id_resolver', None)
+        request.__dict__.pop('_company_id', None)
+
+
+def set_lazy_company_id(request, resolver):
+    """
+    设置在首次访问 request.company_id 时调用的解析函数
+
+    Args:
+        request: Django请求对象
+        resolver: 无参函数，返回企业ID或None
+    """
+    request.__dict__.pop('_company_id', None)
+    request.__dict__['_company_id_resolver'] = resolver
+    tenant_usage.record_deferred()
 
 
-class TenantMiddleware(MiddlewareMixin):
+async def aget_request_company_id(request):
     """
-    多租户中间件
-    从请求头中提取JWT Token，解析出user_id，然后从数据库读取company_id，并添加到request对象中
+    异步代码中获取请求的企业ID
+    尚未解析时经租户缓存和异步MongoDB客户端读取，不阻塞事件循环（直接访问 request.company_id 会同步查询数据库）
+
+    Args:
+        request: Django请求对象或DRF请求对象
+
+    Returns:
+        企业ID或None
     """
+    request = getattr(request, '_request', request)
+    if '_company_id_resolver' not in request.__dict__:
+        return getattr(request, 'company_id', None)
+    tenant_usage.record_resolved()
+    company_id = await aget_user_company_id(request.user_id)
+    request.company_id = company_id
+    return company_id
+
+
+if not isinstance(HttpRequest.__dict__.get('company_id'), LazyCompanyId):
+    HttpRequest.company_id = LazyCompanyId()
+
+
+def build_company_forbidden_response():
+    """请求头 X-Company-Id 指定的企业不属于当前用户"""
+    return JsonResponse(
+        {'error': '无权访问该企业'},
+        status=status.HTTP_403_FORBIDDEN
+    )
+
+
+class TenantMiddleware:
+    """
+    多租户中间件（同时支持同步和异步模式）
+    经网关转发的请求直接使用网关签名的用户ID和企业ID；
+    否则从请求头中提取JWT Token（同一请求内只校验一次，与DRF认证共用），解析出user_id，
+    company_id在首次访问时从租户缓存或数据库读取；
+    请求头 X-Company-Id 指定企业时按缓存的成员集合校验，不是该企业成员时返回403
+    身份解析只涉及签名校验和JWT解码，异步模式下在事件循环中直接执行；
+    异步视图应通过 aget_request_company_id 读取企业ID，同步视图（在线程中执行）可直接访问 request.company_id
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        requested_company_id = self.process_request(request)
+        if requested_company_id is not None:
+            if not is_company_member(request.user_id, requested_company_id):
+                return build_company_forbidden_response()
+            request.company_id = requested_company_id
+        return self.get_response(request)
+    
+    async def __acall__(self, request):
+        requested_company_id = self.process_request(request)
+        if requested_company_id is not None:
+            if not await ais_company_member(request.user_id, requested_company_id):
+                return build_company_forbidden_response()
+            request.company_id = requested_company_id
+        return await self.get_response(request)
     
     def process_request(self, request):
         """
-        处理请求，提取用户ID，从数据库读取企业ID
+        处理请求，提取用户ID，设置延迟解析的企业ID
+        
+        Returns:
+            请求头 X-Company-Id 指定、需要校验成员关系的企业ID（由调用方按同步或异步方式校验），否则返回None
         """
         request.company_id = None
         request.user_id = None
         
+        # 网关已验证JWT并解析租户，只需校验签名
+        with span('identity'):
+            identity = verify_identity_headers(request.META)
+        if identity is not None:
+            request.gateway_identity = identity
+            request.user_id, request.company_id = identity
+            return None
+        
         # 从请求头获取Token
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         if not auth_header.startswith('Bearer '):
@@ -30,12 +187,19 @@ class TenantMiddleware(MiddlewareMixin):
         token = auth_header.split(' ')[1]
         
         try:
-            access_token = AccessToken(token)
+            # 校验结果保存在请求中，DRF认证（StatelessJWTAuthentication）直接复用
+            access_token = get_request_token(request, token)
             request.user_id = access_token.get('user_id')
             
-            # 从数据库读取用户的company_id
             if request.user_id:
-                request.company_id = get_user_company_id(request.user_id)
+                # 显式指定的企业需要校验成员关系
+                requested_company_id = get_requested_company_id(request.META)
+                if requested_company_id is not None:
+                    return requested_company_id
+                
+                # 用户的company_id在首次访问时读取
+                user_id = request.user_id
+                set_lazy_company_id(request, lambda: get_user_company_id(user_id))
         except (TokenError, Exception):
             # Token无效或解析失败，继续处理请求（可能是公开接口）
             pass
@@ -0,0 +1,64 @@
+"""
+链路追踪中间件
+为每个请求开始追踪（沿用网关或调用方传入的 traceparent），响应中返回 X-Trace-Id 和各阶段耗时的 Server-Timing
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from common.utils.tracing import (
+    TRACEPARENT_HEADER,
+    TRACE_ID_HEADER,
+    SERVER_TIMING_HEADER,
+    get_tracing_config,
+    start_trace,
+    end_trace,
+)
+
+
+class TracingMiddleware:
+    """
+    链路追踪中间件（同时支持同步和异步模式）
+    应放在中间件列表靠前的位置，使 total 覆盖其他中间件的耗时；追踪记录同时保存在 request.trace 中
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not get_tracing_config()['ENABLED']:
+            return self.get_response(request)
+        trace, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            end_trace(trace, token)
+        return self._finish(trace, response)
+
+    async def __acall__(self, request):
+        if not get_tracing_config()['ENABLED']:
+            return await self.get_response(request)
+        trace, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_trace(trace, token)
+        return self._finish(trace, response)
+
+    def _start(self, request):
+        meta_key = 'HTTP_' + TRACEPARENT_HEADER.upper()
+        trace, token = start_trace(request.META.get(meta_key))
+        request.trace = trace
+        return trace, token
+
+    def _finish(self, trace, response):
+        response[TRACE_ID_HEADER] = trace.trace_id
+        if get_tracing_config()['SERVER_TIMING']:
+            response[SERVER_TIMING_HEADER] = trace.server_timing()
+        return response
@@ -0,0 +1,20 @@
+"""
+服务端解析器
+解析 Content-Type 为 application/msgpack 的请求体（服务间调用）
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from common.utils.msgpack_utils import MSGPACK_CONTENT_TYPE, unpackb
+
+
+class MessagePackParser(BaseParser):
+    """msgpack解析器"""
+
+    media_type = MSGPACK_CONTENT_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return unpackb(stream.read())
+        except ValueError as e:
+            raise ParseError(f'msgpack解析失败: {e}')
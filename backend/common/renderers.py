@@ -0,0 +1,21 @@
+"""
+服务端渲染器
+客户端（网关或其他服务）的 Accept 优先 application/msgpack 时以msgpack返回响应
+"""
+from rest_framework.renderers import BaseRenderer
+
+from common.utils.msgpack_utils import MSGPACK_CONTENT_TYPE, packb
+
+
+class MessagePackRenderer(BaseRenderer):
+    """msgpack渲染器"""
+
+    media_type = MSGPACK_CONTENT_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return packb(data)
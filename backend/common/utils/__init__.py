@@ -4,6 +4,7 @@
 # 服务配置可以独立导入（不依赖Django）
 from .service_config import (
     get_service_url,
+    get_service_urls,
     get_all_service_urls,
     is_docker_environment,
 )
@@ -11,6 +12,7 @@ from .service_config import (
 __all__ = [
     # 服务配置（总是可用）
     'get_service_url',
+    'get_service_urls',
     'get_all_service_urls',
     'is_docker_environment',
 ]
@@ -0,0 +1,118 @@
+"""
+网关签名的内部身份头
+网关验证JWT并解析租户后，将用户ID、企业ID和过期时间用HMAC签名后转发给下游服务；
+下游服务只需校验签名即可信任身份，无需再次解析JWT或查询用户企业关系
+"""
+import hashlib
+import hmac
+import time
+
+from decouple import config
+
+
+USER_ID_HEADER = 'X-Internal-User-Id'
+COMPANY_ID_HEADER = 'X-Internal-Company-Id'
+EXPIRES_HEADER = 'X-Internal-Expires'
+SIGNATURE_HEADER = 'X-Internal-Signature'
+
+# 网关转发的所有内部身份头（客户端请求中的同名头不会被转发）
+IDENTITY_HEADERS = (USER_ID_HEADER, COMPANY_ID_HEADER, EXPIRES_HEADER, SIGNATURE_HEADER)
+
+_secret = None
+
+
+def _meta_key(header):
+    """请求头名称对应的 request.META 键"""
+    return 'HTTP_' + header.upper().replace('-', '_')
+
+
+def get_internal_auth_secret():
+    """
+    获取内部身份签名密钥（网关和所有服务必须一致，进程内只读取一次）
+
+    Returns:
+        密钥bytes，未配置时返回None（不签发也不信任内部身份头）
+    """
+    global _secret
+    if _secret is None:
+        _secret = config('INTERNAL_AUTH_SECRET', default='').encode('utf-8')
+    return _secret or None
+
+
+def sign_identity(secret, user_id, company_id, expires):
+    """
+    计算身份签名
+
+    Args:
+        secret: 签名密钥
+        user_id: 用户ID
+        company_id: 企业ID（无企业时为空字符串）
+        expires: 过期时间（Unix时间戳，秒）
+
+    Returns:
+        十六进制签名字符串
+    """
+    message = f'{user_id}|{company_id}|{expires}'.encode('utf-8')
+    return hmac.new(secret, message, hashlib.sha256).hexdigest()
+
+
+def build_identity_headers(user_id, company_id=None, token_expires=None):
+    """
+    构建签名的内部身份头
+
+    签名的有效期为 INTERNAL_AUTH_TTL 秒，且不超过JWT本身的过期时间
+
+    Args:
+        user_id: 用户ID
+        company_id: 企业ID
+        token_expires: JWT的过期时间（exp声明）
+
+    Returns:
+        请求头字典，未配置签名密钥时返回空字典
+    """
+    secret = get_internal_auth_secret()
+    if secret is None or not user_id:
+        return {}
+
+    expires = int(time.time()) + config('INTERNAL_AUTH_TTL', default=60, cast=int)
+    if token_expires:
+        expires = min(expires, int(token_expires))
+    company_id = company_id or ''
+    return {
+        USER_ID_HEADER: str(user_id),
+        COMPANY_ID_HEADER: str(company_id),
+        EXPIRES_HEADER: str(expires),
+        SIGNATURE_HEADER: sign_identity(secret, user_id, company_id, expires),
+    }
+
+
+def verify_identity_headers(meta):
+    """
+    校验请求中的内部身份头
+
+    Args:
+        meta: request.META
+
+    Returns:
+        (user_id, company_id)，身份头缺失、过期或签名无效时返回None
+    """
+    signature = meta.get(_meta_key(SIGNATURE_HEADER))
+    if not signature:
+        return None
+    secret = get_internal_auth_secret()
+    if secret is None:
+        return None
+
+    user_id = meta.get(_meta_key(USER_ID_HEADER), '')
+    company_id = meta.get(_meta_key(COMPANY_ID_HEADER), '')
+    try:
+        expires = int(meta.get(_meta_key(EXPIRES_HEADER), ''))
+    except ValueError:
+        return None
+    if not user_id or expires < time.time():
+        return None
+
+    expected = sign_identity(secret, user_id, company_id, expires)
+    if not hmac.compare_digest(expected, signature):
+        return None
+    return user_id, company_id or None
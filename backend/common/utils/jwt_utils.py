@@ -1,9 +1,34 @@
 """
 JWT工具函数
+JWT的签发和解析只涉及CPU计算，同步和异步代码共用；查询用户企业的函数提供异步版本（aget_user_company_id），
+供ASGI服务在事件循环中直接调用
+Access Token的校验结果按Token哈希缓存在进程内LRU中，同一请求内 TenantMiddleware 和DRF认证共用一次解析结果；
+请求头 X-Company-Id 可以指定当前企业，按缓存的成员集合校验，切换企业无需重新登录
 """
-from rest_framework_simplejwt.tokens import RefreshToken
+import hashlib
+import time
+
+from decouple import config
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
-from typing import Dict, Optional
+from typing import Dict, FrozenSet, Optional
+
+from common.utils.tenant_cache import MISSING, TTLCache, tenant_cache
+from common.utils.tracing import span
+
+
+# 校验结果缓存（0表示不缓存）；有效Token最多缓存到过期时间
+JWT_VERIFY_CACHE_SIZE = config('JWT_VERIFY_CACHE_SIZE', default=4096, cast=int)
+JWT_VERIFY_CACHE_TTL = config('JWT_VERIFY_CACHE_TTL', default=300, cast=int)
+# 无效Token使用单独的较小缓存和较短TTL：任何人都能构造大量无效Token，不能挤出有效Token的缓存
+JWT_VERIFY_FAILURE_CACHE_SIZE = config('JWT_VERIFY_FAILURE_CACHE_SIZE', default=256, cast=int)
+JWT_VERIFY_FAILURE_CACHE_TTL = config('JWT_VERIFY_FAILURE_CACHE_TTL', default=10, cast=int)
+
+_verified_tokens = TTLCache(JWT_VERIFY_CACHE_SIZE)
+_rejected_tokens = TTLCache(JWT_VERIFY_FAILURE_CACHE_SIZE)
+
+# 指定当前企业的请求头（request.META中的键）
+COMPANY_ID_HEADER = 'HTTP_X_COMPANY_ID'
 
 
 def generate_token(user_id: str) -> Dict[str, str]:
@@ -41,8 +66,7 @@ def get_user_from_token(token: str) -> Optional[Dict[str, str]]:
         包含user_id的字典，或None
     """
     try:
-        from rest_framework_simplejwt.tokens import AccessToken
-        access_token = AccessToken(token)
+        access_token = verify_access_token(token)
         return {
             'user_id': access_token.get('user_id'),
         }
@@ -50,9 +74,85 @@ def get_user_from_token(token: str) -> Optional[Dict[str, str]]:
         return None
 
 
+def verify_access_token(raw_token) -> AccessToken:
+    """
+    校验Access Token（签名、过期时间、类型），结果按Token的SHA-256哈希缓存，命中时不再解码
+    
+    Args:
+        raw_token: JWT Token字符串或字节串
+        
+    Returns:
+        校验通过的AccessToken（多个请求共享，不应修改）
+        
+    Raises:
+        TokenError: Token无效或已过期
+    """
+    if isinstance(raw_token, str):
+        raw_token = raw_token.encode('utf-8')
+    if JWT_VERIFY_CACHE_SIZE <= 0:
+        with span('jwt'):
+            return AccessToken(raw_token)
+    
+    key = hashlib.sha256(raw_token).digest()
+    access_token = _verified_tokens.get(key)
+    if access_token is not MISSING:
+        return access_token
+    if JWT_VERIFY_FAILURE_CACHE_SIZE > 0:
+        error = _rejected_tokens.get(key)
+        if error is not MISSING:
+            # 缓存错误信息而不是异常对象，避免重复抛出同一异常时累积traceback
+            raise TokenError(error)
+    
+    try:
+        with span('jwt'):
+            access_token = AccessToken(raw_token)
+    except TokenError as e:
+        if JWT_VERIFY_FAILURE_CACHE_SIZE > 0:
+            _rejected_tokens.set(key, str(e.args[0]) if e.args else str(e), JWT_VERIFY_FAILURE_CACHE_TTL)
+        raise
+    
+    ttl = min(JWT_VERIFY_CACHE_TTL, access_token.get('exp', 0) - time.time())
+    if ttl > 0:
+        _verified_tokens.set(key, access_token, ttl)
+    return access_token
+
+
+def get_request_token(request, raw_token) -> AccessToken:
+    """
+    获取请求的Access Token，同一请求内只校验一次（结果保存在Django请求对象上）
+    TenantMiddleware 和 common.authentication.StatelessJWTAuthentication 共用
+    
+    Args:
+        request: Django请求对象或DRF请求对象
+        raw_token: Authorization头中的JWT Token字符串或字节串
+        
+    Returns:
+        校验通过的AccessToken
+        
+    Raises:
+        TokenError: Token无效或已过期
+    """
+    request = getattr(request, '_request', request)
+    if isinstance(raw_token, bytes):
+        raw_token = raw_token.decode('utf-8')
+    
+    cached = request.__dict__.get('_jwt_result')
+    if cached is None or cached[0] != raw_token:
+        try:
+            cached = (raw_token, verify_access_token(raw_token), None)
+        except TokenError as e:
+            cached = (raw_token, None, e)
+        request._jwt_result = cached
+    
+    _, access_token, error = cached
+    if error is not None:
+        raise TokenError(*error.args)
+    return access_token
+
+
 def get_user_company_id(user_id: str) -> Optional[str]:
     """
-    从数据库获取用户的company_id（返回第一个激活的企业）
+    获取用户的company_id（返回第一个激活的企业），结果经租户解析缓存，命中时不查询数据库
     
     Args:
         user_id: 用户ID
@@ -61,19 +161,143 @@ def get_user_company_id(user_id: str) -> Optional[str]:
         企业ID，如果用户没有关联企业则返回None
     """
     try:
-        # 动态导入，避免循环依赖
-        from services.company_service.companies.models import UserCompany
-        
-        # 查询用户关联的第一个激活企业（使用 mongoengine 查询）
-        user_company = UserCompany.objects.filter(
-            user_id=user_id,
-            is_deleted=False,
-            is_active=True
-        ).first()
-        
-        if user_company:
-            return user_company.company_id
+        with span('tenant'):
+            return tenant_cache.get_company_id(user_id, load_user_company_id)
+    except Exception:
+        # 如果导入失败或查询失败，返回None（失败结果不缓存）
         return None
+
+
+def load_user_company_id(user_id: str) -> Optional[str]:
+    """
+    从数据库查询用户的company_id（不经过缓存，查询失败时抛出异常）
+    """
+    # 动态导入，避免循环依赖
+    from services.company_service.companies.models import UserCompany
+    
+    # 查询用户关联的第一个激活企业（使用 mongoengine 查询）
+    user_company = UserCompany.objects.filter(
+        user_id=user_id,
+        is_deleted=False,
+        is_active=True
+    ).first()
+    
+    if user_company:
+        return user_company.company_id
+    return None
+
+
+async def aget_user_company_id(user_id: str) -> Optional[str]:
+    """
+    获取用户的company_id（异步版本，经租户解析缓存，未命中时使用异步MongoDB客户端查询）
+    
+    Args:
+        user_id: 用户ID
+        
+    Returns:
+        企业ID，如果用户没有关联企业则返回None
+    """
+    try:
+        with span('tenant'):
+            return await tenant_cache.aget_company_id(user_id, aload_user_company_id)
     except Exception:
-        # 如果导入失败或查询失败，返回None
+        # 查询失败时返回None（失败结果不缓存）
         return None
+
+
+async def aload_user_company_id(user_id: str) -> Optional[str]:
+    """
+    从数据库查询用户的company_id（异步版本，与 load_user_company_id 的查询条件和排序一致）
+    """
+    from common.db import get_async_database
+    
+    user_company = await get_async_database()['user_companies'].find_one(
+        {'user_id': user_id, 'is_deleted': False, 'is_active': True},
+        projection={'company_id': 1},
+        sort=[('created_at', -1)]
+    )
+    
+    if user_company:
+        return user_company.get('company_id')
+    return None
+
+
+def get_requested_company_id(meta) -> Optional[str]:
+    """
+    获取请求头 X-Company-Id 指定的企业ID
+    
+    Args:
+        meta: request.META
+        
+    Returns:
+        企业ID，未指定时返回None
+    """
+    return meta.get(COMPANY_ID_HEADER, '').strip() or None
+
+
+def is_company_member(user_id: str, company_id: str) -> bool:
+    """
+    用户是否为企业的激活成员（经租户解析缓存的成员集合判断，命中时不查询数据库）
+    """
+    return company_id in get_user_company_ids(user_id)
+
+
+async def ais_company_member(user_id: str, company_id: str) -> bool:
+    """
+    用户是否为企业的激活成员（异步版本）
+    """
+    return company_id in await aget_user_company_ids(user_id)
+
+
+def get_user_company_ids(user_id: str) -> FrozenSet[str]:
+    """
+    获取用户所属的全部激活企业ID，结果经租户解析缓存
+    
+    Args:
+        user_id: 用户ID
+        
+    Returns:
+        企业ID集合，查询失败时返回空集合（不允许切换企业）
+    """
+    try:
+        with span('tenant'):
+            return tenant_cache.get_company_ids(user_id, load_user_company_ids)
+    except Exception:
+        return frozenset()
+
+
+def load_user_company_ids(user_id: str):
+    """
+    从数据库查询用户所属的全部激活企业ID（不经过缓存，查询失败时抛出异常）
+    """
+    # 动态导入，避免循环依赖
+    from services.company_service.companies.models import UserCompany
+    
+    return UserCompany.objects.filter(
+        user_id=user_id,
+        is_deleted=False,
+        is_active=True
+    ).distinct('company_id')
+
+
+async def aget_user_company_ids(user_id: str) -> FrozenSet[str]:
+    """
+    获取用户所属的全部激活企业ID（异步版本，未命中时使用异步MongoDB客户端查询）
+    """
+    try:
+        with span('tenant'):
+            return await tenant_cache.aget_company_ids(user_id, aload_user_company_ids)
+    except Exception:
+        return frozenset()
+
+
+async def aload_user_company_ids(user_id: str):
+    """
+    从数据库查询用户所属的全部激活企业ID（异步版本，与 load_user_company_ids 的查询条件一致）
+    """
+    from common.db import get_async_database
+    
+    return await get_async_database()['user_companies'].distinct(
+        'company_id',
+        {'user_id': user_id, 'is_deleted': False, 'is_active': True}
+    )
@@ -0,0 +1,196 @@
+"""
+服务副本负载均衡
+在一个服务的多个副本之间分配请求，支持轮询、最少未完成请求和二选一随机（power of two choices）策略，
+并根据被动错误统计临时摘除不健康的副本（不依赖Django，可在任意服务中使用）
+"""
+import itertools
+import random
+import threading
+import time
+
+
+DEFAULT_EJECTION_CONFIG = {
+    # 连续失败多少次后摘除副本
+    'CONSECUTIVE_FAILURES': 5,
+    # 首次摘除时间（秒），同一副本再次被摘除时按次数翻倍
+    'EJECTION_SECONDS': 30,
+    'MAX_EJECTION_SECONDS': 300,
+    # 最多同时摘除的副本比例（百分比），避免所有副本都被摘除
+    'MAX_EJECTION_PERCENT': 50,
+}
+
+
+class Replica:
+    """服务副本及其统计信息"""
+
+    def __init__(self, url):
+        self.url = url
+        self.outstanding = 0
+        self.requests_total = 0
+        self.failures_total = 0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0
+
+    def is_ejected(self, now):
+        return self.ejected_until > now
+
+    def metrics(self, now):
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'requests_total': self.requests_total,
+            'failures_total': self.failures_total,
+            'consecutive_failures': self.consecutive_failures,
+            'ejections': self.ejections,
+            'ejected': self.is_ejected(now),
+        }
+
+
+class LoadBalancer:
+    """
+    负载均衡器基类
+    子类实现 _select 从可用副本中选择一个；acquire/release 成对调用
+    """
+
+    strategy = None
+
+    def __init__(self, urls, ejection_config=None):
+        if not urls:
+            raise ValueError('负载均衡器至少需要一个副本')
+        self.replicas = [Replica(url) for url in urls]
+        self.ejection_config = dict(DEFAULT_EJECTION_CONFIG)
+        self.ejection_config.update(ejection_config or {})
+        self._lock = threading.Lock()
+
+    def _available(self, now, exclude=None):
+        """未被摘除（且不是exclude）的副本，没有时依次退回到未摘除的副本、所有副本"""
+        available = [replica for replica in self.replicas if not replica.is_ejected(now)]
+        if exclude is not None:
+            others = [replica for replica in available if replica is not exclude]
+            if others:
+                return others
+        return available or self.replicas
+
+    def _select(self, replicas):
+        raise NotImplementedError
+
+    def acquire(self, exclude=None):
+        """
+        选择一个副本并计入未完成请求
+
+        Args:
+            exclude: 尽量避开的副本（如对冲请求避开首次请求的副本）
+
+        Returns:
+            Replica实例，请求结束后必须调用 release
+        """
+        with self._lock:
+            replica = self._select(self._available(time.monotonic(), exclude))
+            replica.outstanding += 1
+            replica.requests_total += 1
+            return replica
+
+    def release(self, replica, failed):
+        """
+        结束副本上的请求并记录结果
+
+        Args:
+            replica: acquire 返回的副本
+            failed: 是否失败（连接错误、超时或5xx响应）
+        """
+        with self._lock:
+            replica.outstanding -= 1
+            if not failed:
+                replica.consecutive_failures = 0
+                return
+
+            replica.failures_total += 1
+            replica.consecutive_failures += 1
+            now = time.monotonic()
+            if (replica.consecutive_failures >= self.ejection_config['CONSECUTIVE_FAILURES']
+                    and not replica.is_ejected(now) and self._can_eject(now)):
+                self._eject(replica, now)
+
+    def _can_eject(self, now):
+        """摘除后被摘除副本的比例不超过 MAX_EJECTION_PERCENT"""
+        ejected = sum(1 for replica in self.replicas if replica.is_ejected(now))
+        return (ejected + 1) * 100 <= len(self.replicas) * self.ejection_config['MAX_EJECTION_PERCENT']
+
+    def _eject(self, replica, now):
+        duration = min(
+            self.ejection_config['EJECTION_SECONDS'] * (2 ** replica.ejections),
+            self.ejection_config['MAX_EJECTION_SECONDS']
+        )
+        replica.ejections += 1
+        replica.ejected_until = now + duration
+        # 摘除到期后副本重新参与选择，再次连续失败时会被重新摘除
+        replica.consecutive_failures = 0
+
+    def metrics(self):
+        """负载均衡器状态"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'strategy': self.strategy,
+                'replicas': [replica.metrics(now) for replica in self.replicas],
+            }
+
+
+class RoundRobinBalancer(LoadBalancer):
+    """轮询"""
+
+    strategy = 'round_robin'
+
+    def __init__(self, urls, ejection_config=None):
+        super().__init__(urls, ejection_config)
+        self._counter = itertools.count()
+
+    def _select(self, replicas):
+        return replicas[next(self._counter) % len(replicas)]
+
+
+class LeastOutstandingBalancer(LoadBalancer):
+    """最少未完成请求，相同时随机选择避免总是落在同一副本"""
+
+    strategy = 'least_outstanding'
+
+    def _select(self, replicas):
+        least = min(replica.outstanding for replica in replicas)
+        return random.choice([replica for replica in replicas if replica.outstanding == least])
+
+
+class PowerOfTwoChoicesBalancer(LoadBalancer):
+    """随机选两个副本，取未完成请求较少的一个（开销固定，副本较多时接近最少未完成请求的效果）"""
+
+    strategy = 'power_of_two'
+
+    def _select(self, replicas):
+        if len(replicas) == 1:
+            return replicas[0]
+        first, second = random.sample(replicas, 2)
+        return first if first.outstanding <= second.outstanding else second
+
+
+BALANCER_STRATEGIES = {
+    balancer_class.strategy: balancer_class
+    for balancer_class in (RoundRobinBalancer, LeastOutstandingBalancer, PowerOfTwoChoicesBalancer)
+}
+
+
+def create_load_balancer(urls, strategy='round_robin', ejection_config=None):
+    """
+    创建负载均衡器
+
+    Args:
+        urls: 服务副本URL列表
+        strategy: 负载均衡策略（round_robin / least_outstanding / power_of_two）
+        ejection_config: 副本摘除配置，见 DEFAULT_EJECTION_CONFIG
+
+    Returns:
+        LoadBalancer实例
+    """
+    balancer_class = BALANCER_STRATEGIES.get(strategy)
+    if balancer_class is None:
+        raise ValueError(f'未知的负载均衡策略: {strategy}')
+    return balancer_class(urls, ejection_config)
@@ -0,0 +1,92 @@
+"""
+msgpack 内部传输
+网关与服务之间、服务间调用使用 msgpack 编码（编码更快，大响应体的传输字节更少），
+只在网关返回给客户端时转换为JSON
+"""
+import msgpack
+from decouple import config
+from rest_framework.utils.encoders import JSONEncoder
+
+
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_CONTENT_TYPES = (MSGPACK_CONTENT_TYPE, 'application/x-msgpack')
+
+# 内部调用的 Accept（DRF按渲染器顺序而非q值协商，同时列出JSON时会选中JSON，因此只声明msgpack）；
+# 不经过DRF内容协商的视图仍返回JSON，调用方按响应的 Content-Type 解析
+MSGPACK_ACCEPT = MSGPACK_CONTENT_TYPE
+
+# 与JSON渲染一致地转换msgpack不支持的类型（日期时间、Decimal、UUID等）
+_json_encoder = JSONEncoder()
+
+_enabled = None
+
+
+def is_service_msgpack_enabled():
+    """服务间调用是否使用msgpack（进程内只读取一次）"""
+    global _enabled
+    if _enabled is None:
+        _enabled = config('SERVICE_MSGPACK_ENABLED', default=True, cast=bool)
+    return _enabled
+
+
+def is_msgpack_content_type(content_type):
+    """Content-Type 是否为msgpack"""
+    media_type = (content_type or '').split(';', 1)[0].strip().lower()
+    return media_type in MSGPACK_CONTENT_TYPES
+
+
+def packb(data):
+    """编码为msgpack"""
+    return msgpack.packb(data, default=_json_encoder.default, use_bin_type=True)
+
+
+def unpackb(body):
+    """
+    解码msgpack
+
+    Raises:
+        ValueError: 内容不是有效的msgpack
+    """
+    try:
+        return msgpack.unpackb(body, raw=False)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f'无效的msgpack内容: {e}') from e
+
+
+def msgpack_to_json(body):
+    """把msgpack响应体转换为JSON（与服务端JSON渲染的输出一致）"""
+    # 渲染器依赖DRF配置，在使用时导入，避免服务启动早期导入本模块时读取配置
+    from rest_framework.renderers import JSONRenderer
+
+    return JSONRenderer().render(unpackb(body))
+
+
+def prepare_service_request(kwargs):
+    """
+    服务间调用使用msgpack：json参数编码为msgpack请求体，并声明优先接受msgpack响应
+
+    Args:
+        kwargs: 传给 requests.request 的参数（原地修改）
+    """
+    if not is_service_msgpack_enabled():
+        return
+    headers = dict(kwargs.pop('headers', None) or {})
+    if kwargs.get('json') is not None:
+        kwargs['data'] = packb(kwargs.pop('json'))
+        headers['Content-Type'] = MSGPACK_CONTENT_TYPE
+    headers.setdefault('Accept', MSGPACK_ACCEPT)
+    kwargs['headers'] = headers
+
+
+def decode_response(response):
+    """
+    解析服务间调用的响应体（msgpack或JSON）
+
+    Raises:
+        ValueError: 响应体无法解析
+    """
+    if is_msgpack_content_type(response.headers.get('Content-Type')):
+        return unpackb(response.content)
+    return response.json()
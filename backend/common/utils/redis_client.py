@@ -0,0 +1,63 @@
+"""
+Redis客户端管理
+进程内共享一个Redis连接池，供网关缓存、限流等功能使用；异步代码使用按事件循环创建的异步客户端
+"""
+import asyncio
+import threading
+
+import redis
+import redis.asyncio
+from decouple import config
+
+
+_client = None
+_lock = threading.Lock()
+
+# 异步客户端绑定到创建它的事件循环，事件循环变化时重建
+_async_client = None
+_async_loop = None
+
+
+def get_connection_kwargs():
+    """Redis连接参数（同步和异步客户端共用）"""
+    return {
+        'host': config('REDIS_HOST', default='redis'),
+        'port': config('REDIS_PORT', default=6379, cast=int),
+        'db': config('REDIS_DB', default=0, cast=int),
+        'password': config('REDIS_PASSWORD', default=None),
+        'socket_connect_timeout': config('REDIS_CONNECT_TIMEOUT', default=0.2, cast=float),
+        'socket_timeout': config('REDIS_SOCKET_TIMEOUT', default=0.2, cast=float),
+        'health_check_interval': 30,
+    }
+
+
+def get_redis_client():
+    """
+    获取共享的Redis客户端（懒加载）
+
+    连接和读写超时都设置得较短，Redis不可用时调用方应捕获 redis.RedisError 并降级处理
+
+    Returns:
+        redis.Redis实例
+    """
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = redis.Redis(**get_connection_kwargs())
+    return _client
+
+
+def get_async_redis_client():
+    """
+    获取当前事件循环的异步Redis客户端（必须在事件循环中调用）
+
+    Returns:
+        redis.asyncio.Redis实例
+    """
+    global _async_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_loop is not loop:
+        _async_client = redis.asyncio.Redis(**get_connection_kwargs())
+        _async_loop = loop
+    return _async_client
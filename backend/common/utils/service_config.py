@@ -92,6 +92,32 @@ def get_service_url(service_name, default_port=None):
         return f'http://localhost:{port}'
 
 
+def get_service_urls(service_name, default_port=None):
+    """
+    获取微服务的所有副本URL
+    
+    通过环境变量 <SERVICE>_URLS 配置多个副本（逗号分隔），
+    如 USER_SERVICE_URLS=http://user_service_1:8000,http://user_service_2:8000；
+    未配置时只有一个副本，即 get_service_url 返回的URL
+    
+    Args:
+        service_name: 服务名称（如 'user_service', 'log_service'）
+        default_port: 本地开发环境的默认端口（可选）
+    
+    Returns:
+        服务URL列表
+    """
+    env_var = f'{service_name.upper()}_URLS'
+    replica_urls = [
+        url.strip().rstrip('/')
+        for url in os.getenv(env_var, '').split(',')
+        if url.strip()
+    ]
+    if replica_urls:
+        return replica_urls
+    return [get_service_url(service_name, default_port)]
+
+
 def get_all_service_urls():
     """
     获取所有服务的URL配置
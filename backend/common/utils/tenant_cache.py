@@ -0,0 +1,570 @@
+"""
+租户解析缓存
+用户ID -> 企业ID 的两级缓存：进程内TTL LRU（L1）+ Redis（L2），没有企业的用户同样缓存（负缓存，TTL较短）；
+同样缓存用户所属的全部企业ID（成员集合，Redis中为集合类型），用于校验请求头 X-Company-Id 指定的企业；
+企业成员关系变更（加入、退出、删除企业）时删除Redis中的条目并递增用户的失效代数（进行中的加载不会写回旧数据），
+并通过Redis发布订阅通知所有进程清除L1；
+异步代码使用 aget_company_id（异步Redis客户端和异步查询函数，不切换线程）
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from decouple import config
+from django.conf import settings
+
+from common.utils.redis_client import get_redis_client, get_async_redis_client
+
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = 'tenant:company'
+MEMBERS_KEY_PREFIX = 'tenant:members'
+GENERATION_KEY_PREFIX = 'tenant:generation'
+INVALIDATION_CHANNEL = 'tenant:invalidate'
+
+DEFAULT_TENANT_CACHE_CONFIG = {
+    'ENABLED': config('TENANT_CACHE_ENABLED', default=True, cast=bool),
+    'L1_MAX_ENTRIES': config('TENANT_CACHE_L1_MAX_ENTRIES', default=10000, cast=int),
+    # L1依赖发布订阅失效，TTL用于限制订阅断开期间的数据滞后
+    'L1_TTL': config('TENANT_CACHE_L1_TTL', default=30, cast=int),
+    'L2_ENABLED': config('TENANT_CACHE_L2_ENABLED', default=True, cast=bool),
+    'L2_TTL': config('TENANT_CACHE_L2_TTL', default=600, cast=int),
+    # 没有企业的用户（如注册过程中尚未加入企业）的缓存时间
+    'NEGATIVE_TTL': config('TENANT_CACHE_NEGATIVE_TTL', default=10, cast=int),
+}
+
+# 负缓存在Redis中的值（企业ID不会为空字符串）；成员集合为空时集合中只有这一个元素
+NEGATIVE_VALUE = ''
+
+MISSING = object()
+
+# 失效代数的保留时间（秒），远大于一次加载的耗时
+GENERATION_TTL = 86400
+
+# 只在用户的失效代数与加载前读取的值一致时回填（KEYS: 代数键、缓存键；ARGV: 代数、值、TTL）
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+# 成员集合的条件回填（KEYS: 代数键、集合键；ARGV: 代数、TTL、企业ID...）
+SET_MEMBERS_IF_GENERATION_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('SADD', KEYS[2], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+
+
+def get_tenant_cache_config():
+    """获取租户解析缓存配置（settings.TENANT_CACHE 覆盖默认值）"""
+    cache_config = dict(DEFAULT_TENANT_CACHE_CONFIG)
+    cache_config.update(getattr(settings, 'TENANT_CACHE', {}))
+    return cache_config
+
+
+class TTLCache:
+    """进程内TTL LRU缓存（值可以为None）"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns:
+            缓存的值，不存在或已过期时返回 MISSING
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TenantCache:
+    """
+    租户解析缓存
+    L1未命中时查询Redis，Redis未命中时调用loader查询数据库并回填两级缓存；Redis不可用时退化为只使用L1
+    每个用户在Redis中有一个失效代数，invalidate 时递增；回填Redis时比较加载前读取的代数，
+    加载期间发生过失效则放弃回填（避免把失效前查询到的数据写回并保留整个L2 TTL）
+    """
+
+    def __init__(self):
+        self.l1 = None
+        self.hits_l1 = 0
+        self.hits_l2 = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.stale_writes_skipped = 0
+        self.redis_errors = 0
+        self._evictions = 0
+        self._scripts = {}
+        self._lock = threading.Lock()
+        self._subscriber = None
+
+    def _get_l1(self, cache_config):
+        if self.l1 is None:
+            with self._lock:
+                if self.l1 is None:
+                    self.l1 = TTLCache(cache_config['L1_MAX_ENTRIES'])
+        return self.l1
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _redis_key(self, user_id):
+        return f'{REDIS_KEY_PREFIX}:{user_id}'
+
+    def _members_redis_key(self, user_id):
+        return f'{MEMBERS_KEY_PREFIX}:{user_id}'
+
+    def _generation_key(self, user_id):
+        return f'{GENERATION_KEY_PREFIX}:{user_id}'
+
+    def _members_l1_key(self, user_id):
+        return f'members:{user_id}'
+
+    def _script(self, source):
+        """注册到同步Redis客户端的Lua脚本"""
+        script = self._scripts.get(source)
+        if script is None:
+            script = self._scripts[source] = get_redis_client().register_script(source)
+        return script
+
+    def get_company_id(self, user_id, loader):
+        """
+        获取用户的企业ID
+
+        Args:
+            user_id: 用户ID
+            loader: 缓存未命中时调用的查询函数 loader(user_id)，查询失败时应抛出异常（失败结果不缓存）
+
+        Returns:
+            企业ID，用户没有关联企业时返回None
+        """
+        cache_config = get_tenant_cache_config()
+        if not cache_config['ENABLED']:
+            return loader(user_id)
+
+        key = str(user_id)
+        l1 = self._get_l1(cache_config)
+        company_id = l1.get(key)
+        if company_id is not MISSING:
+            self._count('hits_l1')
+            return company_id
+
+        evictions = self._evictions
+        company_id, generation = self._get_remote(key, cache_config)
+        if company_id is not MISSING:
+            self._count('hits_l2')
+            self._fill_l1(key, company_id, evictions, cache_config)
+            return company_id
+
+        self._count('misses')
+        company_id = loader(user_id)
+        self._set_remote(key, company_id, generation, cache_config)
+        self._fill_l1(key, company_id, evictions, cache_config)
+        return company_id
+
+    async def aget_company_id(self, user_id, aloader):
+        """
+        获取用户的企业ID（异步版本）
+
+        Args:
+            user_id: 用户ID
+            aloader: 缓存未命中时调用的异步查询函数 await aloader(user_id)
+        """
+        cache_config = get_tenant_cache_config()
+        if not cache_config['ENABLED']:
+            return await aloader(user_id)
+
+        key = str(user_id)
+        l1 = self._get_l1(cache_config)
+        company_id = l1.get(key)
+        if company_id is not MISSING:
+            self._count('hits_l1')
+            return company_id
+
+        evictions = self._evictions
+        company_id, generation = await self._aget_remote(key, cache_config)
+        if company_id is not MISSING:
+            self._count('hits_l2')
+            self._fill_l1(key, company_id, evictions, cache_config)
+            return company_id
+
+        self._count('misses')
+        company_id = await aloader(user_id)
+        await self._aset_remote(key, company_id, generation, cache_config)
+        self._fill_l1(key, company_id, evictions, cache_config)
+        return company_id
+
+    def get_company_ids(self, user_id, loader):
+        """
+        获取用户所属的全部企业ID（成员集合）
+
+        Args:
+            user_id: 用户ID
+            loader: 缓存未命中时调用的查询函数 loader(user_id)，返回企业ID的可迭代对象，查询失败时应抛出异常
+
+        Returns:
+            企业ID的frozenset，用户没有关联企业时为空集合
+        """
+        cache_config = get_tenant_cache_config()
+        if not cache_config['ENABLED']:
+            return frozenset(loader(user_id))
+
+        key = str(user_id)
+        l1 = self._get_l1(cache_config)
+        company_ids = l1.get(self._members_l1_key(key))
+        if company_ids is not MISSING:
+            self._count('hits_l1')
+            return company_ids
+
+        evictions = self._evictions
+        company_ids, generation = self._get_remote_members(key, cache_config)
+        if company_ids is not MISSING:
+            self._count('hits_l2')
+            self._fill_l1(self._members_l1_key(key), company_ids, evictions, cache_config)
+            return company_ids
+
+        self._count('misses')
+        company_ids = frozenset(loader(user_id))
+        self._set_remote_members(key, company_ids, generation, cache_config)
+        self._fill_l1(self._members_l1_key(key), company_ids, evictions, cache_config)
+        return company_ids
+
+    async def aget_company_ids(self, user_id, aloader):
+        """
+        获取用户所属的全部企业ID（异步版本）
+
+        Args:
+            user_id: 用户ID
+            aloader: 缓存未命中时调用的异步查询函数 await aloader(user_id)
+        """
+        cache_config = get_tenant_cache_config()
+        if not cache_config['ENABLED']:
+            return frozenset(await aloader(user_id))
+
+        key = str(user_id)
+        l1 = self._get_l1(cache_config)
+        company_ids = l1.get(self._members_l1_key(key))
+        if company_ids is not MISSING:
+            self._count('hits_l1')
+            return company_ids
+
+        evictions = self._evictions
+        company_ids, generation = await self._aget_remote_members(key, cache_config)
+        if company_ids is not MISSING:
+            self._count('hits_l2')
+            self._fill_l1(self._members_l1_key(key), company_ids, evictions, cache_config)
+            return company_ids
+
+        self._count('misses')
+        company_ids = frozenset(await aloader(user_id))
+        await self._aset_remote_members(key, company_ids, generation, cache_config)
+        self._fill_l1(self._members_l1_key(key), company_ids, evictions, cache_config)
+        return company_ids
+
+    def _ttl(self, value, ttl, cache_config):
+        # 没有企业（企业ID为None或成员集合为空）时使用负缓存TTL
+        if not value:
+            return min(ttl, cache_config['NEGATIVE_TTL'])
+        return ttl
+
+    def _fill_l1(self, l1_key, value, evictions, cache_config):
+        """回填L1；读取期间本进程清除过L1条目时放弃（读到的可能是失效前的数据）"""
+        with self._lock:
+            if self._evictions == evictions:
+                self.l1.set(l1_key, value, self._ttl(value, cache_config['L1_TTL'], cache_config))
+
+    def _get_remote(self, user_id, cache_config):
+        """
+        Returns:
+            (企业ID或MISSING, 失效代数)，失效代数为None时不回填Redis
+        """
+        if not cache_config['L2_ENABLED']:
+            return MISSING, None
+        self._ensure_subscriber()
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            pipeline.get(self._redis_key(user_id))
+            pipeline.get(self._generation_key(user_id))
+            value, generation = pipeline.execute()
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'读取租户缓存失败: {e}')
+            return MISSING, None
+        return self._decode(value), self._decode_generation(generation)
+
+    def _set_remote(self, user_id, company_id, generation, cache_config):
+        if not cache_config['L2_ENABLED'] or generation is None:
+            return
+        try:
+            written = self._script(SET_IF_GENERATION_SCRIPT)(
+                keys=[self._generation_key(user_id), self._redis_key(user_id)],
+                args=[
+                    generation,
+                    NEGATIVE_VALUE if company_id is None else company_id,
+                    self._ttl(company_id, cache_config['L2_TTL'], cache_config),
+                ]
+            )
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'写入租户缓存失败: {e}')
+            return
+        if not written:
+            self._count('stale_writes_skipped')
+
+    async def _aget_remote(self, user_id, cache_config):
+        if not cache_config['L2_ENABLED']:
+            return MISSING, None
+        self._ensure_subscriber()
+        try:
+            pipeline = get_async_redis_client().pipeline(transaction=False)
+            pipeline.get(self._redis_key(user_id))
+            pipeline.get(self._generation_key(user_id))
+            value, generation = await pipeline.execute()
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'读取租户缓存失败: {e}')
+            return MISSING, None
+        return self._decode(value), self._decode_generation(generation)
+
+    async def _aset_remote(self, user_id, company_id, generation, cache_config):
+        if not cache_config['L2_ENABLED'] or generation is None:
+            return
+        try:
+            # 异步客户端按事件循环重建，脚本每次注册到当前客户端（只计算SHA1，不访问Redis）
+            written = await get_async_redis_client().register_script(SET_IF_GENERATION_SCRIPT)(
+                keys=[self._generation_key(user_id), self._redis_key(user_id)],
+                args=[
+                    generation,
+                    NEGATIVE_VALUE if company_id is None else company_id,
+                    self._ttl(company_id, cache_config['L2_TTL'], cache_config),
+                ]
+            )
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'写入租户缓存失败: {e}')
+            return
+        if not written:
+            self._count('stale_writes_skipped')
+
+    def _get_remote_members(self, user_id, cache_config):
+        if not cache_config['L2_ENABLED']:
+            return MISSING, None
+        self._ensure_subscriber()
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            pipeline.smembers(self._members_redis_key(user_id))
+            pipeline.get(self._generation_key(user_id))
+            members, generation = pipeline.execute()
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'读取租户成员缓存失败: {e}')
+            return MISSING, None
+        return self._decode_members(members), self._decode_generation(generation)
+
+    def _set_remote_members(self, user_id, company_ids, generation, cache_config):
+        if not cache_config['L2_ENABLED'] or generation is None:
+            return
+        try:
+            written = self._script(SET_MEMBERS_IF_GENERATION_SCRIPT)(
+                keys=[self._generation_key(user_id), self._members_redis_key(user_id)],
+                args=[
+                    generation,
+                    self._ttl(company_ids, cache_config['L2_TTL'], cache_config),
+                    *(company_ids or [NEGATIVE_VALUE]),
+                ]
+            )
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'写入租户成员缓存失败: {e}')
+            return
+        if not written:
+            self._count('stale_writes_skipped')
+
+    async def _aget_remote_members(self, user_id, cache_config):
+        if not cache_config['L2_ENABLED']:
+            return MISSING, None
+        self._ensure_subscriber()
+        try:
+            pipeline = get_async_redis_client().pipeline(transaction=False)
+            pipeline.smembers(self._members_redis_key(user_id))
+            pipeline.get(self._generation_key(user_id))
+            members, generation = await pipeline.execute()
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'读取租户成员缓存失败: {e}')
+            return MISSING, None
+        return self._decode_members(members), self._decode_generation(generation)
+
+    async def _aset_remote_members(self, user_id, company_ids, generation, cache_config):
+        if not cache_config['L2_ENABLED'] or generation is None:
+            return
+        try:
+            written = await get_async_redis_client().register_script(SET_MEMBERS_IF_GENERATION_SCRIPT)(
+                keys=[self._generation_key(user_id), self._members_redis_key(user_id)],
+                args=[
+                    generation,
+                    self._ttl(company_ids, cache_config['L2_TTL'], cache_config),
+                    *(company_ids or [NEGATIVE_VALUE]),
+                ]
+            )
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'写入租户成员缓存失败: {e}')
+            return
+        if not written:
+            self._count('stale_writes_skipped')
+
+    def _decode_members(self, members):
+        # 键不存在时 SMEMBERS 返回空集合
+        if not members:
+            return MISSING
+        return frozenset(member.decode('utf-8') for member in members) - {NEGATIVE_VALUE}
+
+    def _decode(self, value):
+        if value is None:
+            return MISSING
+        value = value.decode('utf-8')
+        return None if value == NEGATIVE_VALUE else value
+
+    def _decode_generation(self, generation):
+        # 从未失效过的用户没有代数键，与脚本中的比较值一致（空字符串）
+        return generation.decode('utf-8') if generation is not None else ''
+
+    def invalidate(self, user_ids):
+        """
+        企业成员关系变更后立即使用户的缓存失效（本进程L1、Redis，并通知其他进程清除L1）
+        同时递增用户的失效代数，进行中的加载不会再把旧数据写回Redis
+
+        Args:
+            user_ids: 用户ID列表
+        """
+        user_ids = [str(user_id) for user_id in user_ids if user_id]
+        if not user_ids:
+            return
+        self._count('invalidations')
+        if self.l1 is not None:
+            for user_id in user_ids:
+                self._evict_l1(user_id)
+
+        if not get_tenant_cache_config()['L2_ENABLED']:
+            return
+        try:
+            pipeline = get_redis_client().pipeline(transaction=False)
+            for user_id in user_ids:
+                pipeline.incr(self._generation_key(user_id))
+                pipeline.expire(self._generation_key(user_id), GENERATION_TTL)
+            pipeline.delete(*[self._redis_key(user_id) for user_id in user_ids])
+            pipeline.delete(*[self._members_redis_key(user_id) for user_id in user_ids])
+            for user_id in user_ids:
+                pipeline.publish(INVALIDATION_CHANNEL, user_id)
+            pipeline.execute()
+        except redis.RedisError as e:
+            self._count('redis_errors')
+            logger.warning(f'租户缓存失效失败: {e}')
+
+    def _evict_l1(self, user_id):
+        with self._lock:
+            self._evictions += 1
+            self.l1.delete(user_id)
+            self.l1.delete(self._members_l1_key(user_id))
+
+    def _clear_l1(self):
+        with self._lock:
+            self._evictions += 1
+            self.l1.clear()
+
+    def _ensure_subscriber(self):
+        """启动订阅失效通知的后台线程（每个进程一个）"""
+        if self._subscriber is not None:
+            return
+        with self._lock:
+            if self._subscriber is None:
+                self._subscriber = threading.Thread(
+                    target=self._subscribe_loop,
+                    name='tenant-cache-invalidation',
+                    daemon=True
+                )
+                self._subscriber.start()
+
+    def _subscribe_loop(self):
+        retry_delay = 1
+        while True:
+            pubsub = None
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # 订阅建立前（或断开期间）可能错过失效通知，清空L1
+                if self.l1 is not None:
+                    self._clear_l1()
+                retry_delay = 1
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message is not None and self.l1 is not None:
+                        self._evict_l1(message['data'].decode('utf-8'))
+            except redis.RedisError as e:
+                logger.warning(f'租户缓存失效订阅断开，{retry_delay}秒后重试: {e}')
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, 60)
+            finally:
+                if pubsub is not None:
+                    pubsub.close()
+
+    def metrics(self):
+        """缓存统计"""
+        with self._lock:
+            return {
+                'entries': len(self.l1) if self.l1 is not None else 0,
+                'hits_l1': self.hits_l1,
+                'hits_l2': self.hits_l2,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'stale_writes_skipped': self.stale_writes_skipped,
+                'redis_errors': self.redis_errors,
+            }
+
+
+tenant_cache = TenantCache()
+
+
+def invalidate_user_company_ids(user_ids):
+    """企业成员关系变更后使用户的租户缓存失效"""
+    tenant_cache.invalidate(user_ids)
@@ -0,0 +1,234 @@
+"""
+请求链路追踪
+网关为每个请求生成trace ID，通过W3C traceparent头传递给下游服务和服务间调用；
+每个服务按阶段记录耗时（JWT解析、租户查询、MongoDB、上游调用等），通过 Server-Timing 响应头逐跳返回，
+上游服务返回的 Server-Timing 以服务名为前缀合并到调用方的响应中
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from decouple import config
+
+from common.utils.msgpack_utils import prepare_service_request
+
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = 'traceparent'
+TRACE_ID_HEADER = 'X-Trace-Id'
+SERVER_TIMING_HEADER = 'Server-Timing'
+
+TRACEPARENT_PATTERN = re.compile(r'^[0-9a-f]{2}-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$')
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+_config = None
+
+
+def get_tracing_config():
+    """获取链路追踪配置（进程内只读取一次）"""
+    global _config
+    if _config is None:
+        _config = {
+            'ENABLED': config('TRACING_ENABLED', default=True, cast=bool),
+            # 是否在响应中返回 Server-Timing 头
+            'SERVER_TIMING': config('TRACING_SERVER_TIMING', default=True, cast=bool),
+            # 超过该耗时（毫秒）的请求以WARNING级别记录各阶段耗时
+            'SLOW_REQUEST_MS': config('TRACING_SLOW_REQUEST_MS', default=1000, cast=int),
+        }
+    return _config
+
+
+class Trace:
+    """
+    一个请求在当前服务内的追踪记录
+    同名阶段的耗时累加（如一个请求内的多次MongoDB查询）；批量请求的子请求可能在多个线程中并发记录
+    """
+
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.started = time.monotonic()
+        # 阶段名称 -> [累计耗时（秒）, 次数, 说明]
+        self.spans = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, duration, description=None):
+        """记录一个阶段的耗时"""
+        with self._lock:
+            entry = self.spans.get(name)
+            if entry is None:
+                self.spans[name] = [duration, 1, description]
+            else:
+                entry[0] += duration
+                entry[1] += 1
+
+    @contextmanager
+    def span(self, name, description=None):
+        """记录代码块的耗时"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started, description)
+
+    def merge_server_timing(self, prefix, header):
+        """
+        合并下游服务返回的 Server-Timing（阶段名称加上服务名前缀）
+
+        Args:
+            prefix: 下游服务名称
+            header: 下游响应的 Server-Timing 头
+        """
+        for name, duration, description in parse_server_timing(header):
+            self.record(f'{prefix}.{name}', duration, description)
+
+    def traceparent(self):
+        """传递给下游服务的 traceparent 头（下游的父span为当前服务）"""
+        return f'00-{self.trace_id}-{self.span_id}-01'
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def server_timing(self):
+        """当前服务各阶段耗时的 Server-Timing 头（total为本服务处理请求的总耗时）"""
+        entries = [_format_server_timing('total', self.elapsed())]
+        with self._lock:
+            spans = [(name, *entry) for name, entry in self.spans.items()]
+        for name, duration, count, description in spans:
+            if count > 1:
+                description = f'{description} x{count}' if description else f'x{count}'
+            entries.append(_format_server_timing(name, duration, description))
+        return ', '.join(entries)
+
+
+def _format_server_timing(name, duration, description=None):
+    entry = f'{name};dur={duration * 1000:.2f}'
+    if description:
+        entry += ';desc="{}"'.format(str(description).replace('"', "'"))
+    return entry
+
+
+def parse_server_timing(header):
+    """
+    解析 Server-Timing 头
+
+    Returns:
+        [(名称, 耗时（秒）, 说明), ...]
+    """
+    entries = []
+    for part in (header or '').split(','):
+        name, *params = [item.strip() for item in part.split(';')]
+        if not name:
+            continue
+        duration = 0.0
+        description = None
+        for param in params:
+            key, _, value = param.partition('=')
+            if key == 'dur':
+                try:
+                    duration = float(value) / 1000
+                except ValueError:
+                    pass
+            elif key == 'desc':
+                description = value.strip('"')
+        entries.append((name, duration, description))
+    return entries
+
+
+def parse_traceparent(value):
+    """
+    解析 traceparent 头
+
+    Returns:
+        (trace_id, parent_span_id)，格式无效时返回None
+    """
+    match = TRACEPARENT_PATTERN.match((value or '').strip().lower())
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
+
+
+def start_trace(traceparent=None):
+    """
+    开始当前请求的追踪（沿用上游传入的trace ID，没有时生成新的trace ID）
+
+    Returns:
+        (trace, token)：token用于在请求结束时调用 end_trace
+    """
+    trace_id, parent_id = parse_traceparent(traceparent) or (None, None)
+    trace = Trace(trace_id, parent_id)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(trace, token):
+    """结束当前请求的追踪，记录各阶段耗时"""
+    _current_trace.reset(token)
+    elapsed_ms = trace.elapsed() * 1000
+    if elapsed_ms >= get_tracing_config()['SLOW_REQUEST_MS']:
+        logger.warning(f'慢请求 trace_id={trace.trace_id} {trace.server_timing()}')
+    elif logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f'trace_id={trace.trace_id} {trace.server_timing()}')
+
+
+def get_current_trace():
+    """当前请求的追踪记录，不在请求中或未启用追踪时返回None"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name, description=None):
+    """在当前请求的追踪中记录代码块的耗时（没有追踪时不记录）"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(name, description):
+        yield
+
+
+def get_trace_headers(trace=None):
+    """
+    服务间调用需要携带的追踪头
+
+    Args:
+        trace: 追踪记录，默认为当前请求的追踪（在线程池中调用时需要显式传入）
+    """
+    trace = trace or _current_trace.get()
+    if trace is None:
+        return {}
+    return {TRACEPARENT_HEADER: trace.traceparent()}
+
+
+def service_request(method, url, service_name, **kwargs):
+    """
+    调用其他服务：携带追踪头，记录调用耗时，并合并下游服务返回的 Server-Timing；
+    请求体和响应使用msgpack（响应体通过 msgpack_utils.decode_response 解析）
+
+    Args:
+        method: 请求方法
+        url: 完整URL
+        service_name: 下游服务名称（Server-Timing中的前缀）
+        **kwargs: 传给 requests.request 的参数
+
+    Returns:
+        requests.Response
+    """
+    prepare_service_request(kwargs)
+    trace = _current_trace.get()
+    if trace is None:
+        return requests.request(method, url, **kwargs)
+
+    headers = dict(kwargs.pop('headers', None) or {})
+    headers.update(get_trace_headers(trace))
+    with trace.span(service_name):
+        response = requests.request(method, url, headers=headers, **kwargs)
+    trace.merge_server_timing(service_name, response.headers.get(SERVER_TIMING_HEADER))
+    return response
@@ -9,6 +9,8 @@ from rest_framework.response import Response
 from django.conf import settings
 from .serializers import RegisterSerializer, LoginSerializer, TokenRefreshSerializer
 from common.utils.jwt_utils import generate_token
+from common.utils.msgpack_utils import decode_response
+from common.utils.tracing import service_request, span
 from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 
@@ -40,8 +42,10 @@ def register(request):
             'password': password,
             # 不传入company_id，让用户服务使用临时值
         }
-        user_response = requests.post(
+        user_response = service_request(
+            'post',
             f'{user_service_url}/api/users/create/',
+            'user_service',
             json=user_data,
             timeout=5
         )
@@ -49,7 +53,7 @@ def register(request):
         if user_response.status_code != 201:
             # 尝试解析错误响应
             try:
-                error_details = user_response.json()
+                error_details = decode_response(user_response)
             except (ValueError, AttributeError):
                 # 如果不是 JSON，返回原始文本
                 error_details = user_response.text[:500] if hasattr(user_response, 'text') else str(user_response)
@@ -61,7 +65,7 @@ def register(request):
         
         # 解析用户创建结果
         try:
-            user_result = user_response.json()
+            user_result = decode_response(user_response)
         except (ValueError, AttributeError):
             return Response(
                 {'error': '创建用户成功，但响应格式错误', 'details': user_response.text[:500] if hasattr(user_response, 'text') else '无法解析响应'},
@@ -75,8 +79,10 @@ def register(request):
             'name': company_name,
             'owner_id': user_id,  # 使用用户ID作为所有者
         }
-        company_response = requests.post(
+        company_response = service_request(
+            'post',
             f'{company_service_url}/api/companies/create/',
+            'company_service',
             json=company_data,
             timeout=5
         )
@@ -84,7 +90,7 @@ def register(request):
         if company_response.status_code != 201:
             # 尝试解析错误响应
             try:
-                error_details = company_response.json()
+                error_details = decode_response(company_response)
             except (ValueError, AttributeError):
                 error_details = company_response.text[:500] if hasattr(company_response, 'text') else str(company_response)
             
@@ -103,7 +109,7 @@ def register(request):
         
         # 解析企业创建结果
         try:
-            company_result = company_response.json()
+            company_result = decode_response(company_response)
         except (ValueError, AttributeError):
             return Response(
                 {'error': '创建企业成功，但响应格式错误', 'details': company_response.text[:500] if hasattr(company_response, 'text') else '无法解析响应'},
@@ -112,8 +118,10 @@ def register(request):
         company_id = company_result['id']
         
         # 3. 更新用户的company_id为企业ID（调用用户服务）
-        update_user_response = requests.patch(
+        update_user_response = service_request(
+            'patch',
             f'{user_service_url}/api/users/{user_id}/update_company_id/',
+            'user_service',
             json={'company_id': company_id},
             timeout=5
         )
@@ -121,7 +129,7 @@ def register(request):
         if update_user_response.status_code not in [200, 201]:
             # 尝试解析错误响应
             try:
-                error_details = update_user_response.json()
+                error_details = decode_response(update_user_response)
             except (ValueError, AttributeError):
                 error_details = update_user_response.text[:500] if hasattr(update_user_response, 'text') else str(update_user_response)
             
@@ -131,8 +139,10 @@ def register(request):
             logger.warning(f'更新用户company_id失败: {error_details}')
         
         # 4. 将用户加入企业（调用企业服务）
-        join_response = requests.post(
+        join_response = service_request(
+            'post',
             f'{company_service_url}/api/companies/{company_id}/join/',
+            'company_service',
             json={'user_id': user_id},
             timeout=5
         )
@@ -140,7 +150,7 @@ def register(request):
         if join_response.status_code not in [200, 201]:
             # 尝试解析错误响应
             try:
-                error_details = join_response.json()
+                error_details = decode_response(join_response)
             except (ValueError, AttributeError):
                 error_details = join_response.text[:500] if hasattr(join_response, 'text') else str(join_response)
             
@@ -150,7 +160,8 @@ def register(request):
             logger.warning(f'用户加入企业失败: {error_details}')
         
         # 4. 生成JWT Token（不包含company_id，从数据库读取）
-        tokens = generate_token(user_id)
+        with span('jwt'):
+            tokens = generate_token(user_id)
         
         return Response({
             'message': '注册成功',
@@ -196,8 +207,10 @@ def login(request):
         if company_id:
             login_data['company_id'] = company_id
         
-        user_response = requests.post(
+        user_response = service_request(
+            'post',
             f'{user_service_url}/api/users/login/',
+            'user_service',
             json=login_data,
             timeout=5
         )
@@ -208,20 +221,22 @@ def login(request):
                 status=status.HTTP_401_UNAUTHORIZED
             )
         
-        user_result = user_response.json()
+        user_result = decode_response(user_response)
         user_id = user_result['user_id']
         
         # 如果没有指定company_id，使用用户的默认企业
         if not company_id:
             # 获取用户的默认企业（调用企业服务）
             company_service_url = settings.SERVICE_URLS['company_service']
-            companies_response = requests.get(
+            companies_response = service_request(
+                'get',
                 f'{company_service_url}/api/companies/user/{user_id}/',
+                'company_service',
                 timeout=5
             )
             
             if companies_response.status_code == 200:
-                companies = companies_response.json()
+                companies = decode_response(companies_response)
                 if companies and len(companies) > 0:
                     company_id = companies[0]['id']
                 else:
@@ -236,7 +251,8 @@ def login(request):
                 )
         
         # 生成JWT Token（不包含company_id，从数据库读取）
-        tokens = generate_token(user_id)
+        with span('jwt'):
+            tokens = generate_token(user_id)
         
         return Response({
             'message': '登录成功',
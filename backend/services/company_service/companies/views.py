@@ -13,6 +13,7 @@ from .serializers import (
     UserCompanySerializer, JoinCompanySerializer
 )
 from common.data_factory.crud import BaseCRUD
+from common.utils.tenant_cache import invalidate_user_company_ids
 from bson import ObjectId
 
 
@@ -233,6 +234,7 @@ def join_company(request, company_id):
             # 重新激活
             existing.is_active = True
             existing.save()
+            invalidate_user_company_ids([user_id])
             serializer = UserCompanySerializer(existing)
             return Response(serializer.data, status=status.HTTP_200_OK)
     
@@ -244,6 +246,8 @@ def join_company(request, company_id):
     )
     user_company.company_id = company_id  # 设置company_id用于数据隔离
     user_company.save()
+    # 用户的租户解析结果可能变化（如此前没有企业时的负缓存）
+    invalidate_user_company_ids([user_id])
     
     serializer = UserCompanySerializer(user_company)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
@@ -285,6 +289,7 @@ def leave_company(request, company_id):
     
     # 软删除关联
     user_company.soft_delete()
+    invalidate_user_company_ids([user_id])
     
     return Response({'message': '退出企业成功'}, status=status.HTTP_200_OK)
 
@@ -318,4 +323,8 @@ def delete_company(request, company_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
     
+    # 企业成员的租户解析结果需要重新查询
+    member_ids = UserCompany.objects.filter(company_id=company_id).distinct('user_id')
+    invalidate_user_company_ids(member_ids)
+    
     return Response({'message': '删除成功'}, status=status.HTTP_200_OK)
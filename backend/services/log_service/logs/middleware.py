@@ -41,9 +41,9 @@ class LoggingMiddleware(MiddlewareMixin):
         if hasattr(request, '_log_start_time'):
             execution_time = (time.time() - request._log_start_time) * 1000  # 转换为毫秒
         
-        # 获取企业ID和用户ID
-        company_id = getattr(request, 'company_id', None)
+        # 获取企业ID和用户ID（未认证的请求不触发企业ID的解析）
         user_id = getattr(request, 'user_id', None)
+        company_id = getattr(request, 'company_id', None) if user_id else None
         
         if not company_id:
             return response
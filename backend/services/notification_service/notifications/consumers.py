@@ -3,9 +3,8 @@ WebSocket消费者 - 实时通知推送
 """
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
+from common.utils.jwt_utils import aget_user_company_id, verify_access_token
 from .models import Notification
 
 
@@ -63,26 +62,17 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         message = event['message']
         await self.send(text_data=json.dumps(message))
     
-    @database_sync_to_async
-    def get_user_from_token(self, token):
-        """从token中获取用户信息，从数据库读取company_id"""
+    async def get_user_from_token(self, token):
+        """从token中获取用户信息，company_id经租户缓存和异步MongoDB客户端读取（不切换到线程）"""
         try:
-            access_token = AccessToken(token)
+            access_token = verify_access_token(token)
             user_id = access_token.get('user_id')
             
             if not user_id:
                 return None
             
-            # 从数据库读取用户的company_id
-            from services.company_service.companies.models import UserCompany
-            
-            user_company = UserCompany.objects.filter(
-                user_id=user_id,
-                is_deleted=False,
-                is_active=True
-            ).first()
-            
-            company_id = user_company.company_id if user_company else None
+            # 读取用户的company_id（与HTTP请求共用租户解析缓存）
+            company_id = await aget_user_company_id(user_id)
             
             return {
                 'user_id': user_id,
@@ -30,10 +30,13 @@ class PermissionMiddleware(MiddlewareMixin):
                 return None
         
         # 如果没有company_id，跳过权限验证（可能是公开接口）
-        company_id = getattr(request, 'company_id', None)
+        # 先判断user_id：未认证的请求不触发企业ID的解析
         user_id = getattr(request, 'user_id', None)
+        if not user_id:
+            return None
         
-        if not company_id or not user_id:
+        company_id = getattr(request, 'company_id', None)
+        if not company_id:
             return None
         
         # 这里可以添加更详细的权限验证逻辑
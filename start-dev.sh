@@ -59,6 +59,7 @@ export MONGODB_PASSWORD=admin123
 export REDIS_HOST=localhost
 export REDIS_PORT=6379
 export SECRET_KEY=dev-secret-key-change-in-production
+export INTERNAL_AUTH_SECRET=dev-internal-auth-secret-change-in-production
 export DEBUG=True
 
 # 5. 启动后端服务（在后台）